@@ -0,0 +1,139 @@
+"""
+编译解码基准：对同一批输入先用普通（eager + 动态 KV 缓存）贪心解码生成评估，再对同一模型启用
+torch.compile + 分桶静态 KV 缓存重新生成，比较每 token 延迟（ms/token）以及两者的结论、输出文本是否一致。
+两种模式都先执行 local_model.warmup（编译模式下即编译或从 inductor 缓存加载），预热耗时单独统计；
+每 token 延迟取各行的中位数，个别行的重新编译不会拉高稳态延迟，但会体现在 recompile_s 中。
+
+用法：python benchmarks/compiled_decoding.py data.csv --judge JudgeLM-7B --mode cot --limit 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from config import FINETUNED_JUDGE_MODELS  # NOQA: E402
+from cli import MODE_ALIASES  # NOQA: E402
+
+
+def timed_generate(model, inputs, max_new_tokens):
+    import torch
+    from local_model import decode_cache
+
+    if model.device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    # 缓存按评估时的生成上限（2048）取用，与实际请求的长度桶一致，只生成 max_new_tokens 个 token
+    with torch.no_grad(), decode_cache(model, inputs["input_ids"], 2048) as cache_kwargs:
+        sequences = model.generate(
+            **inputs, do_sample=False, **{**cache_kwargs, "max_new_tokens": max_new_tokens})
+    if model.device.type == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    return sequences[0][inputs["input_ids"].shape[1]:], elapsed
+
+
+def verdict_of(text, mode):
+    from webui.evaluation import extract_scores, verdict_from_scores, PARSE_FAILED_VERDICT
+
+    try:
+        return verdict_from_scores(*extract_scores(text, mode))
+    except ValueError:
+        return PARSE_FAILED_VERDICT
+
+
+def ms_per_token(runs):
+    # 各行每 token 延迟的中位数
+    per_row = sorted(elapsed * 1000 / len(ids) for ids, elapsed in runs if len(ids))
+    return per_row[len(per_row) // 2] if per_row else 0.0
+
+
+def excess_time(runs, steady_ms):
+    # 超出稳态延迟的总耗时（秒），即预热之后仍发生的重新编译等开销
+    return sum(max(0.0, elapsed - steady_ms * len(ids) / 1000) for ids, elapsed in runs)
+
+
+def timed_warmup(model, tokenizer):
+    from local_model import warmup
+
+    start = time.perf_counter()
+    warmup(model, tokenizer)
+    return time.perf_counter() - start
+
+
+def run(input_path, judge, mode, limit, max_new_tokens, model_path=None):
+    from local_model import load_local_model, compile_model
+    from webui.evaluation import create_prompt, prepare_local_inputs, load_batch_file
+
+    df, error = load_batch_file(input_path)
+    if error:
+        raise SystemExit(error)
+    df = df.dropna(subset=["instruction", "answer1", "answer2"]).head(limit)
+    model, tokenizer = load_local_model(model_path or FINETUNED_JUDGE_MODELS[judge])
+
+    inputs_list = []
+    for _, row in df.iterrows():
+        conversation = create_prompt(
+            row["instruction"], row["answer1"], row["answer2"], mode, judge)
+        inputs, _, _ = prepare_local_inputs(
+            conversation, tokenizer, model, row["instruction"], row["answer1"], row["answer2"], mode)
+        inputs_list.append(inputs)
+    if not inputs_list:
+        raise SystemExit("没有可用于对比的有效行")
+
+    # 先跑 eager，再在同一模型上启用编译，避免加载两份权重
+    eager_warmup = timed_warmup(model, tokenizer)
+    eager = [timed_generate(model, inputs, max_new_tokens) for inputs in inputs_list]
+    compile_model(model)
+    compiled_warmup = timed_warmup(model, tokenizer)
+    compiled = [timed_generate(model, inputs, max_new_tokens) for inputs in inputs_list]
+
+    rows = []
+    for (eager_ids, eager_time), (compiled_ids, compiled_time) in zip(eager, compiled):
+        eager_text = tokenizer.decode(eager_ids, skip_special_tokens=True)
+        compiled_text = tokenizer.decode(compiled_ids, skip_special_tokens=True)
+        rows.append({
+            "eager_tokens": len(eager_ids),
+            "eager_time": eager_time,
+            "compiled_tokens": len(compiled_ids),
+            "compiled_time": compiled_time,
+            "same_text": eager_text == compiled_text,
+            "same_verdict": verdict_of(eager_text, mode) == verdict_of(compiled_text, mode),
+        })
+        print(json.dumps(rows[-1], ensure_ascii=False))
+
+    eager_ms = ms_per_token(eager)
+    compiled_ms = ms_per_token(compiled)
+    return {
+        "rows": len(rows),
+        "eager_warmup_s": eager_warmup,
+        "compiled_warmup_s": compiled_warmup,
+        "eager_ms_per_token": eager_ms,
+        "compiled_ms_per_token": compiled_ms,
+        "compiled_recompile_s": excess_time(compiled, compiled_ms),
+        "speedup": eager_ms / compiled_ms if compiled_ms else 0.0,
+        "same_verdict_rate": sum(r["same_verdict"] for r in rows) / len(rows),
+        "same_text_rate": sum(r["same_text"] for r in rows) / len(rows),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="普通解码与编译解码（静态 KV 缓存）的延迟及结论一致性对比")
+    parser.add_argument("input", help="输入文件（CSV / JSON，包含 instruction, answer1, answer2）")
+    parser.add_argument("--judge", default="JudgeLM-7B", choices=list(FINETUNED_JUDGE_MODELS))
+    parser.add_argument("--mode", default="cot", choices=sorted(MODE_ALIASES))
+    parser.add_argument("--limit", type=int, default=20, help="参与对比的行数")
+    parser.add_argument("--max-new-tokens", type=int, default=512)
+    parser.add_argument("--model-path", help="模型路径，默认取 --judge 的配置；--judge 仍决定提示格式")
+    args = parser.parse_args(argv)
+
+    summary = run(args.input, args.judge, MODE_ALIASES[args.mode], args.limit, args.max_new_tokens,
+                  args.model_path)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+导入耗时预算检查：在干净的子进程中导入网页应用，确认重型依赖未在启动时加载，
+且扣除 gradio 自身导入时间后的启动开销不超过预算。超出预算时以非零状态退出。
+
+用法：python benchmarks/import_budget.py [--budget 秒]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# 启动网页应用时不应加载的模块（仅在使用本地模型或打开可视化时按需导入）
+FORBIDDEN_MODULES = ["torch", "modelscope", "transformers", "matplotlib", "seaborn"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import gradio
+gradio_time = time.perf_counter() - start
+import webui.app
+total_time = time.perf_counter() - start
+print(json.dumps({
+    "gradio": gradio_time,
+    "total": total_time,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (FORBIDDEN_MODULES,)
+
+
+def measure():
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, check=True,
+        capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="检查网页应用的导入耗时预算")
+    parser.add_argument("--budget", type=float, default=1.5,
+                        help="扣除 gradio 导入后允许的启动耗时（秒）")
+    args = parser.parse_args(argv)
+
+    result = measure()
+    app_time = result["total"] - result["gradio"]
+    print(f"gradio 导入: {result['gradio']:.2f}s, 应用自身: {app_time:.2f}s (预算 {args.budget:.2f}s)")
+    failed = False
+    if result["loaded"]:
+        print(f"启动时加载了重型依赖: {', '.join(result['loaded'])}")
+        failed = True
+    if app_time > args.budget:
+        print("应用导入耗时超出预算")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+辅助（推测）解码基准：对同一批输入分别用普通贪心解码和"裁判模型 + 草稿模型"辅助解码生成评估，
+比较生成速度（tokens/s）以及两者的结论、输出文本是否一致。
+
+用法：python benchmarks/speculative_decoding.py data.csv --judge JudgeLM-7B --draft JackFram/llama-160m --mode cot --limit 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from config import FINETUNED_JUDGE_MODELS, DRAFT_MODELS  # NOQA: E402
+from cli import MODE_ALIASES  # NOQA: E402
+
+
+def timed_generate(model, inputs, max_new_tokens, assistant_model=None):
+    import torch
+
+    kwargs = {"assistant_model": assistant_model} if assistant_model is not None else {}
+    start = time.perf_counter()
+    with torch.no_grad():
+        sequences = model.generate(
+            **inputs, max_new_tokens=max_new_tokens, do_sample=False, **kwargs)
+    elapsed = time.perf_counter() - start
+    return sequences[0][inputs["input_ids"].shape[1]:], elapsed
+
+
+def verdict_of(text, mode):
+    from webui.evaluation import extract_scores, verdict_from_scores, PARSE_FAILED_VERDICT
+
+    try:
+        return verdict_from_scores(*extract_scores(text, mode))
+    except ValueError:
+        return PARSE_FAILED_VERDICT
+
+
+def run(input_path, judge, draft, mode, limit, max_new_tokens):
+    from local_model import load_local_model
+    from webui.evaluation import create_prompt, prepare_local_inputs, load_batch_file
+
+    df, error = load_batch_file(input_path)
+    if error:
+        raise SystemExit(error)
+    df = df.dropna(subset=["instruction", "answer1", "answer2"]).head(limit)
+    model, tokenizer = load_local_model(FINETUNED_JUDGE_MODELS[judge])
+    draft_model, _ = load_local_model(draft, device=str(model.device))
+
+    rows = []
+    for _, row in df.iterrows():
+        conversation = create_prompt(
+            row["instruction"], row["answer1"], row["answer2"], mode, judge)
+        inputs, _, _ = prepare_local_inputs(
+            conversation, tokenizer, model, row["instruction"], row["answer1"], row["answer2"], mode)
+        plain_ids, plain_time = timed_generate(model, inputs, max_new_tokens)
+        assisted_ids, assisted_time = timed_generate(
+            model, inputs, max_new_tokens, assistant_model=draft_model)
+        plain_text = tokenizer.decode(plain_ids, skip_special_tokens=True)
+        assisted_text = tokenizer.decode(assisted_ids, skip_special_tokens=True)
+        rows.append({
+            "plain_tokens": len(plain_ids),
+            "plain_time": plain_time,
+            "assisted_tokens": len(assisted_ids),
+            "assisted_time": assisted_time,
+            "same_text": plain_text == assisted_text,
+            "same_verdict": verdict_of(plain_text, mode) == verdict_of(assisted_text, mode),
+        })
+        print(json.dumps(rows[-1], ensure_ascii=False))
+
+    plain_tokens = sum(r["plain_tokens"] for r in rows)
+    assisted_tokens = sum(r["assisted_tokens"] for r in rows)
+    plain_time = sum(r["plain_time"] for r in rows)
+    assisted_time = sum(r["assisted_time"] for r in rows)
+    return {
+        "rows": len(rows),
+        "plain_tokens_per_s": plain_tokens / plain_time if plain_time else 0.0,
+        "assisted_tokens_per_s": assisted_tokens / assisted_time if assisted_time else 0.0,
+        "speedup": plain_time / assisted_time if assisted_time else 0.0,
+        "same_verdict_rate": sum(r["same_verdict"] for r in rows) / len(rows) if rows else 0.0,
+        "same_text_rate": sum(r["same_text"] for r in rows) / len(rows) if rows else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="普通解码与辅助解码的速度及结论一致性对比")
+    parser.add_argument("input", help="输入文件（CSV / JSON，包含 instruction, answer1, answer2）")
+    parser.add_argument("--judge", default="JudgeLM-7B", choices=list(FINETUNED_JUDGE_MODELS))
+    parser.add_argument("--draft", help="草稿模型路径，默认取 DRAFT_MODELS 中的配置")
+    parser.add_argument("--mode", default="cot", choices=sorted(MODE_ALIASES))
+    parser.add_argument("--limit", type=int, default=20, help="参与对比的行数")
+    parser.add_argument("--max-new-tokens", type=int, default=512)
+    args = parser.parse_args(argv)
+
+    draft = args.draft or DRAFT_MODELS.get(args.judge)
+    if not draft:
+        raise SystemExit(f"{args.judge} 未配置草稿模型，请通过 --draft 指定")
+    summary = run(args.input, args.judge, draft, MODE_ALIASES[args.mode],
+                  args.limit, args.max_new_tokens)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,384 @@
 from openai import OpenAI
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
+from config import (
+    PROVIDERS, MODEL_PROVIDERS, PROVIDER_OVERRIDE,
+    HEDGING, HEDGE_QUANTILE, HEDGE_MIN_SAMPLES, HEDGE_BUDGET, HEDGE_FALLBACKS, JUDGE_GENERATION
+)
 
 load_dotenv()  # 加载 .env 文件中的变量
-DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
-ARK_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
-
-
-def call_model(prompt, modelname):
-    if "qwen" in modelname.lower():
-        BASE_URL = DASHSCOPE_BASE_URL
-        API_KEY = os.getenv("DASHSCOPE_API_KEY")
-    elif "deepseek" in modelname.lower():
-        BASE_URL = ARK_BASE_URL
-        API_KEY = os.getenv("ARK_API_KEY")
-    else:
+
+
+class RateLimiter:
+    # 按每分钟请求数均匀放行，rate_limit 为 0 时不限速
+    def __init__(self, rate_limit):
+        self.interval = 60.0 / rate_limit if rate_limit else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+# 每个提供方一份客户端、并发信号量与限速器，在首次调用时创建
+_clients = {}
+_semaphores = {}
+_rate_limiters = {}
+_registry_lock = threading.Lock()
+
+# 按提供方累计的 token 用量与费用
+PROVIDER_USAGE = {}
+
+
+def get_provider(modelname):
+    """
+    返回模型所属提供方的名称与配置；未登记的模型返回 (None, None)。
+    """
+    name = PROVIDER_OVERRIDE or MODEL_PROVIDERS.get(modelname)
+    if name not in PROVIDERS:
+        return None, None
+    return name, PROVIDERS[name]
+
+
+def _provider_resources(name, provider):
+    with _registry_lock:
+        if name not in _clients:
+            _clients[name] = OpenAI(
+                api_key=os.getenv(provider.get("api_key_env", ""), "EMPTY"),
+                base_url=provider["base_url"],
+                timeout=provider.get("timeout", 120),
+            )
+            _semaphores[name] = threading.BoundedSemaphore(
+                provider.get("max_concurrency", 8))
+            _rate_limiters[name] = RateLimiter(provider.get("rate_limit", 0))
+        return _clients[name], _semaphores[name], _rate_limiters[name]
+
+
+def record_usage(name, provider, usage):
+    if usage is None:
+        return
+    price = provider.get("price", {})
+    cost = (usage.prompt_tokens * price.get("input", 0.0)
+            + usage.completion_tokens * price.get("output", 0.0)) / 1000
+    with _registry_lock:
+        totals = PROVIDER_USAGE.setdefault(
+            name, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+        totals["requests"] += 1
+        totals["prompt_tokens"] += usage.prompt_tokens
+        totals["completion_tokens"] += usage.completion_tokens
+        totals["cost"] += cost
+
+
+class LatencyTracker:
+    # 最近 window 次成功调用的延迟，用于估计分位数
+    def __init__(self, window=200):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def quantile(self, q, min_samples):
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# 按模型 ID 记录的延迟与对冲统计
+_latency_trackers = {}
+HEDGE_STATS = {}
+# 对冲请求在独立线程中执行，调用方只等待先返回的结果
+_hedge_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge")
+
+
+def _latency_tracker(modelname):
+    with _registry_lock:
+        return _latency_trackers.setdefault(modelname, LatencyTracker())
+
+
+def set_generation_budget(modelname, max_tokens=None, reasoning_effort=None):
+    # 覆盖某个模型的生成预算（本进程内有效），用于单次批量任务调整推理深度
+    budget = dict(JUDGE_GENERATION.get(modelname, {}))
+    if max_tokens is not None:
+        budget["max_tokens"] = max_tokens
+    if reasoning_effort is not None:
+        budget["reasoning_effort"] = reasoning_effort
+    JUDGE_GENERATION[modelname] = budget
+
+
+def generation_kwargs(modelname):
+    budget = JUDGE_GENERATION.get(modelname, {})
+    kwargs = {}
+    if budget.get("max_tokens"):
+        kwargs["max_tokens"] = budget["max_tokens"]
+    if budget.get("reasoning_effort"):
+        # 非标准参数经 extra_body 透传，不支持的服务会忽略或报错，只应为支持的模型配置
+        kwargs["extra_body"] = {"reasoning_effort": budget["reasoning_effort"]}
+    return kwargs
+
+
+def completion_details(completion):
+    """
+    从回复中取出正文、推理内容（DeepSeek-R1 等的 reasoning_content）与 token 数。
+    """
+    message = completion.choices[0].message
+    usage = completion.usage
+    details = getattr(usage, "completion_tokens_details", None) if usage else None
+    return {
+        "content": message.content,
+        "reasoning": getattr(message, "reasoning_content", None),
+        "prompt_tokens": usage.prompt_tokens if usage else None,
+        "completion_tokens": usage.completion_tokens if usage else None,
+        "reasoning_tokens": getattr(details, "reasoning_tokens", None) if details else None,
+        "finish_reason": completion.choices[0].finish_reason,
+    }
+
+
+def _request(name, provider, modelname, prompt, kwargs=None):
+    """
+    发出一次非流式请求并记录用量与延迟，返回 completion_details；出错时抛出异常。
+    kwargs 为生成预算，默认取 modelname 的配置；对冲到备用模型时沿用原模型的预算。
+    """
+    client, semaphore, rate_limiter = _provider_resources(name, provider)
+    rate_limiter.acquire()
+    with semaphore:
+        start = time.monotonic()
+        completion = client.chat.completions.create(
+            model=modelname,
+            messages=prompt,
+            **(generation_kwargs(modelname) if kwargs is None else kwargs)
+        )
+        _latency_tracker(modelname).add(time.monotonic() - start)
+    record_usage(name, provider, completion.usage)
+    return completion_details(completion)
+
+
+def _hedge_target(name, provider, modelname):
+    # 对冲请求的去向：配置了备用提供方时发往备用提供方，否则发往同一提供方
+    fallback = None if PROVIDER_OVERRIDE else HEDGE_FALLBACKS.get(modelname)
+    if fallback and fallback[0] in PROVIDERS:
+        return fallback[0], PROVIDERS[fallback[0]], fallback[1]
+    return name, provider, modelname
+
+
+def _take_hedge_budget(modelname):
+    # 对冲请求数不超过请求总数的 HEDGE_BUDGET
+    with _registry_lock:
+        stats = HEDGE_STATS[modelname]
+        if stats["hedges"] + 1 > HEDGE_BUDGET * stats["requests"]:
+            return False
+        stats["hedges"] += 1
+        return True
+
+
+def _is_valid(details, validate):
+    content = details["content"]
+    if content is None:
+        return False
+    if validate is None:
+        return True
+    try:
+        validate(content)
+        return True
+    except Exception:
+        return False
+
+
+def _hedged_request(name, provider, modelname, prompt, validate):
+    """
+    主请求超过该模型的延迟分位数仍未返回时发出一个对冲请求，返回先完成且通过 validate 的结果；
+    都无效时返回主请求的结果，都出错时抛出首个异常。未被采用的请求在后台继续完成（费用照常计入）。
+    """
+    with _registry_lock:
+        stats = HEDGE_STATS.setdefault(modelname, {"requests": 0, "hedges": 0, "hedge_wins": 0})
+        stats["requests"] += 1
+    delay = _latency_tracker(modelname).quantile(HEDGE_QUANTILE, HEDGE_MIN_SAMPLES)
+    primary = _hedge_executor.submit(_request, name, provider, modelname, prompt)
+    pending = {primary}
+    hedge = None
+    fallback_result, first_error = None, None
+    while pending:
+        done, pending = wait(pending, timeout=delay if hedge is None else None,
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            hedge = primary
+            if _take_hedge_budget(modelname):
+                hedge = _hedge_executor.submit(
+                    _request, *_hedge_target(name, provider, modelname), prompt, generation_kwargs(modelname))
+                pending.add(hedge)
+            continue
+        for future in done:
+            try:
+                details = future.result()
+            except Exception as e:
+                first_error = first_error or e
+                continue
+            if _is_valid(details, validate):
+                if future is not primary:
+                    with _registry_lock:
+                        stats["hedge_wins"] += 1
+                return details
+            if future is primary or fallback_result is None:
+                fallback_result = details
+    if fallback_result is None and first_error is not None:
+        raise first_error
+    return fallback_result
+
+
+def call_model_detailed(prompt, modelname, validate=None):
+    """
+    非流式调用，返回 completion_details 字典（正文、推理内容、token 数）；出错时打印错误并返回 None。
+    validate 用于请求对冲时判断正文是否可用（抛出异常即无效），例如检查能否解析出分数。
+    """
+    name, provider = get_provider(modelname)
+    if provider is None:
         print("模型名称不正确，请检查模型名称！")
         return
     try:
-        client = OpenAI(
-            api_key=API_KEY,
-            base_url=BASE_URL,
-        )
+        if HEDGING:
+            return _hedged_request(name, provider, modelname, prompt, validate)
+        return _request(name, provider, modelname, prompt)
+    except Exception as e:
+        print(f"错误信息：{e}")
 
-        completion = client.chat.completions.create(
+
+def call_model(prompt, modelname, validate=None):
+    # 只返回回复正文的 call_model_detailed
+    details = call_model_detailed(prompt, modelname, validate)
+    return details["content"] if details else None
+
+
+def _stream_deltas(stream, semaphore):
+    # 逐段产出流式回复的正文；结束或被关闭时关闭连接并释放并发名额
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()
+        semaphore.release()
+
+
+def _open_stream(name, provider, modelname, prompt, kwargs):
+    """
+    发出流式请求并读到首段正文，返回 (首段正文, 其余正文的生成器)；首段正文为 None 表示回复为空。
+    首段耗时按 "<模型 ID> (stream)" 单独记录，作为流式对冲的延迟分位数。
+    """
+    client, semaphore, rate_limiter = _provider_resources(name, provider)
+    rate_limiter.acquire()
+    semaphore.acquire()
+    start = time.monotonic()
+    try:
+        stream = client.chat.completions.create(
             model=modelname,
-            messages=prompt
+            messages=prompt,
+            stream=True,
+            **kwargs
         )
-        return completion.choices[0].message.content
+    except Exception:
+        semaphore.release()
+        raise
+    deltas = _stream_deltas(stream, semaphore)
+    try:
+        first = next(deltas, None)
+    except Exception:
+        deltas.close()
+        raise
+    _latency_tracker(f"{modelname} (stream)").add(time.monotonic() - start)
+    return first, deltas
+
+
+def _close_stream(future):
+    # 未被采用的流式请求在拿到首段后立即关闭，不再继续计费
+    if future.exception() is None:
+        future.result()[1].close()
+
+
+def _hedged_stream(name, provider, modelname, prompt):
+    """
+    流式调用的对冲：首段正文超过该模型首段延迟的分位数仍未到达时发出对冲请求，
+    采用先到达首段的流，另一个流随即关闭。都出错时抛出首个异常。
+    """
+    kwargs = generation_kwargs(modelname)
+    with _registry_lock:
+        stats = HEDGE_STATS.setdefault(modelname, {"requests": 0, "hedges": 0, "hedge_wins": 0})
+        stats["requests"] += 1
+    delay = _latency_tracker(f"{modelname} (stream)").quantile(HEDGE_QUANTILE, HEDGE_MIN_SAMPLES)
+    primary = _hedge_executor.submit(_open_stream, name, provider, modelname, prompt, kwargs)
+    pending = {primary}
+    done, _ = wait(pending, timeout=delay)
+    if not done and _take_hedge_budget(modelname):
+        # 对冲到备用模型时沿用原模型的生成预算
+        pending.add(_hedge_executor.submit(
+            _open_stream, *_hedge_target(name, provider, modelname), prompt, kwargs))
+    first_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                first_error = first_error or future.exception()
+                continue
+            for other in list(done - {future}) + list(pending):
+                other.add_done_callback(_close_stream)
+            if future is not primary:
+                with _registry_lock:
+                    stats["hedge_wins"] += 1
+            return future.result()
+    raise first_error
+
+
+def call_model_stream(prompt, modelname):
+    # 流式调用，逐段产出增量文本；启用对冲时对首段正文对冲。出错时打印错误并结束
+    name, provider = get_provider(modelname)
+    if provider is None:
+        print("模型名称不正确，请检查模型名称！")
+        return
+    deltas = None
+    try:
+        if HEDGING:
+            first, deltas = _hedged_stream(name, provider, modelname, prompt)
+        else:
+            first, deltas = _open_stream(name, provider, modelname, prompt, generation_kwargs(modelname))
+        if first is not None:
+            yield first
+        yield from deltas
     except Exception as e:
         print(f"错误信息：{e}")
+    finally:
+        if deltas is not None:
+            deltas.close()
+
+
+def batch_client(modelname):
+    """
+    离线批处理使用的 (提供方名称, 提供方配置, 客户端)；模型未登记或提供方不支持批处理时抛出 ValueError。
+    """
+    name, provider = get_provider(modelname)
+    if provider is None:
+        raise ValueError(f"模型 {modelname} 未登记提供方")
+    if not provider.get("batch"):
+        raise ValueError(f"提供方 {name} 不支持离线批处理")
+    client, _, _ = _provider_resources(name, provider)
+    return name, provider, client
+
+
+def batch_request_body(prompt, modelname):
+    # 批处理文件中单个请求的 body，与 _request 发出的参数一致；extra_body 中的非标准参数直接并入
+    kwargs = generation_kwargs(modelname)
+    body = {"model": modelname, "messages": prompt, **kwargs.pop("extra_body", {})}
+    body.update(kwargs)
+    return body
@@ -0,0 +1,317 @@
+import argparse
+import os
+import sys
+from config import FINETUNED_JUDGE_MODELS, PROPRIETARY_MODELS, LOCAL_BATCH_WORKERS
+
+
+# 命令行中的推理策略别名
+MODE_ALIASES = {
+    "direct": "直接评估",
+    "cot": "思维链",
+    "直接评估": "直接评估",
+    "思维链": "思维链",
+}
+
+
+def run_batch(input_path, mode="直接评估", judge=None, proprietary=None, cascade=False,
+              calibration=False, threshold=0.5, workers=None, output=None, explanations=False,
+              estimate=False, target_width=0.1, alpha=0.05, seed=None, pointwise=False,
+              ensemble=None, aggregation="majority", max_tokens=None, reasoning_effort=None,
+              batch_api=False, poll_interval=None):
+    """
+    无界面批量评估入口，复用与网页端相同的评估核心，返回 (message, report_path)。
+    judge 为 FINETUNED_JUDGE_MODELS 中的名称，proprietary 为 PROPRIETARY_MODELS 中的名称。
+    """
+    from webui.evaluation import evaluate_batch, calibrated_evaluation_batch, cascade_evaluation_batch
+
+    mode = MODE_ALIASES.get(mode, mode)
+    if max_tokens is not None or reasoning_effort is not None:
+        # 本次任务内覆盖所用专有模型的生成预算
+        from call_model import set_generation_budget
+
+        for name in (ensemble or []) + ([proprietary] if proprietary else []):
+            if name in PROPRIETARY_MODELS:
+                set_generation_budget(PROPRIETARY_MODELS[name], max_tokens, reasoning_effort)
+    if judge and judge not in FINETUNED_JUDGE_MODELS:
+        return f"错误：无效的微调模型 {judge}", None
+    if proprietary and proprietary not in PROPRIETARY_MODELS:
+        return f"错误：无效的专有模型 {proprietary}", None
+    if estimate and (cascade or calibration):
+        return "估计模式仅支持单模型评估（不含校准）", None
+    if pointwise and (cascade or calibration or estimate):
+        return "逐答案评分仅支持单模型评估（不含校准、估计模式）", None
+    if batch_api:
+        if not proprietary or judge or cascade or calibration or estimate or pointwise or ensemble:
+            return "离线批处理模式仅支持单个专有模型评估（不含校准、级联、估计、逐答案评分与集成）", None
+        from config import BATCH_POLL_INTERVAL
+        from webui.batch_api import batch_api_evaluation
+
+        return batch_api_evaluation(input_path, mode, proprietary,
+                                    output_path=os.path.abspath(output) if output else None,
+                                    poll_interval=poll_interval or BATCH_POLL_INTERVAL)
+    if ensemble:
+        return run_ensemble(input_path, mode, ensemble, judge, aggregation, output)
+    if cascade and not (judge and proprietary):
+        return "级联评估需要同时指定微调裁判模型和专有模型", None
+    if not judge and not proprietary:
+        return "请指定微调裁判模型或专有模型", None
+    if output:
+        output = os.path.abspath(output)
+
+    state = {
+        "finetuned_model_name": judge,
+        "proprietary_model_name": proprietary,
+        "confidence_threshold": threshold,
+        "model": None,
+        "tokenizer": None,
+    }
+    if judge and (cascade or not proprietary):
+        from local_model import get_local_model, get_draft_model
+
+        model_path = FINETUNED_JUDGE_MODELS[judge]
+        print(f"Loading model {judge} from {model_path}")
+        # 与界面一致经 get_local_model 加载：按配置编译并预热，首行评估不再承担懒加载开销
+        state["model"], state["tokenizer"] = get_local_model(model_path)
+        state["model_path"] = model_path
+        state["draft_model"] = get_draft_model(judge)
+
+    if pointwise:
+        from webui.pointwise import pointwise_evaluation_batch
+
+        if proprietary:
+            state["finetuned_model_name"] = None
+        return pointwise_evaluation_batch(input_path, mode, state, output_path=output)
+    if estimate:
+        from webui.estimate import estimate_batch
+
+        if proprietary:
+            state["finetuned_model_name"] = None
+        return estimate_batch(input_path, mode, state, target_width=target_width, alpha=alpha,
+                              seed=seed, output_path=output)
+    if cascade:
+        return cascade_evaluation_batch(input_path, mode, state, calibration, output_path=output,
+                                        explanations=explanations)
+    if proprietary:
+        if calibration:
+            return calibrated_evaluation_batch(input_path, mode, model_name=proprietary, output_path=output)
+        state["finetuned_model_name"] = None
+        return evaluate_batch(input_path, mode, state, output_path=output)
+    if calibration:
+        return "校准模式只能用于专有模型", None
+    return evaluate_batch(input_path, mode, state, num_workers=workers, output_path=output)
+
+
+def run_ensemble(input_path, mode, judges, local_judge=None, aggregation="majority", output=None):
+    """
+    集成评估入口：judges 为 PROPRIETARY_MODELS 中的名称列表，指定 local_judge 时加载该微调模型一并参与。
+    """
+    from webui.ensemble import ensemble_evaluation_batch, LOCAL_JUDGE
+
+    invalid = [name for name in judges if name not in PROPRIETARY_MODELS]
+    if invalid:
+        return f"错误：无效的专有模型 {', '.join(invalid)}", None
+    state = {"finetuned_model_name": local_judge, "model": None, "tokenizer": None}
+    judges = list(judges)
+    if local_judge:
+        from local_model import get_local_model
+
+        model_path = FINETUNED_JUDGE_MODELS[local_judge]
+        print(f"Loading model {local_judge} from {model_path}")
+        state["model"], state["tokenizer"] = get_local_model(model_path)
+        judges.append(LOCAL_JUDGE)
+    return ensemble_evaluation_batch(input_path, mode, state, judges, aggregation, output_path=output)
+
+
+def run_recompute(report_path, calibration_weight=None, threshold=None, output=None):
+    """
+    离线重算已有报告的结论，不调用模型，返回 (message, report_path)。
+    """
+    from webui.recompute import recompute_report
+
+    return recompute_report(report_path, calibration_weight, threshold,
+                            output_path=os.path.abspath(output) if output else None)
+
+
+def run_collect(manifest_path, output=None, poll_interval=None):
+    """
+    继续收取已提交的离线批处理任务（例如轮询进程中断后），返回 (message, report_path)。
+    """
+    from config import BATCH_POLL_INTERVAL
+    from webui.batch_api import collect_batch_job
+
+    return collect_batch_job(manifest_path, output_path=os.path.abspath(output) if output else None,
+                             poll_interval=poll_interval or BATCH_POLL_INTERVAL)
+
+
+def run_coordinator(input_path=None, mode="直接评估", judge=None, job=None, shard_size=None, queue=None,
+                    output=None, submit_only=False, poll_interval=5.0):
+    """
+    分布式评估的协调进程：提交新任务（或指定 job 继续已有任务），等待各节点完成后按原行序合并报告。
+    """
+    from config import DISTRIBUTED_QUEUE_PATH, DISTRIBUTED_SHARD_SIZE
+    from webui.distributed import submit_job, merge_job
+
+    queue = queue or DISTRIBUTED_QUEUE_PATH
+    if job is None:
+        if not input_path or not judge:
+            return "提交任务需要输入文件和裁判模型", None
+        message, job = submit_job(input_path, MODE_ALIASES.get(mode, mode), judge, queue_path=queue,
+                                  shard_size=shard_size or DISTRIBUTED_SHARD_SIZE)
+        if job is None or submit_only:
+            return message, job
+        print(message)
+    return merge_job(job, queue_path=queue, output_path=os.path.abspath(output) if output else None,
+                     poll_interval=poll_interval)
+
+
+def run_worker(judge=None, proprietary=None, queue=None, exit_when_idle=False, workers=None):
+    """
+    分布式评估的工作进程：加载裁判模型后持续领取同名裁判的分片，返回完成的分片数。
+    """
+    from config import DISTRIBUTED_QUEUE_PATH
+    from webui.distributed import run_worker as worker_loop
+
+    state = {"finetuned_model_name": judge, "proprietary_model_name": proprietary,
+             "model": None, "tokenizer": None, "num_workers": workers}
+    if judge:
+        from local_model import get_local_model, get_draft_model
+
+        model_path = FINETUNED_JUDGE_MODELS[judge]
+        print(f"Loading model {judge} from {model_path}")
+        # 与界面一致经 get_local_model 加载：按配置编译并预热，首行评估不再承担懒加载开销
+        state["model"], state["tokenizer"] = get_local_model(model_path)
+        state["model_path"] = model_path
+        state["draft_model"] = get_draft_model(judge)
+    return worker_loop(state, judge or proprietary, queue_path=queue or DISTRIBUTED_QUEUE_PATH,
+                       exit_when_idle=exit_when_idle)
+
+
+def build_distributed_parser():
+    parser = argparse.ArgumentParser(
+        description="分布式批量评估：协调进程切分任务并合并报告，各节点的工作进程加载裁判模型领取分片")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    coordinator = subparsers.add_parser("coordinator", help="切分输入并提交到工作队列，等待完成后合并报告")
+    coordinator.add_argument("input", nargs="?", help="输入文件（CSV / JSON）；与 --job 二选一")
+    coordinator.add_argument("--job", help="不提交新任务，继续等待并合并已有任务")
+    coordinator.add_argument("--mode", default="direct", choices=sorted(MODE_ALIASES))
+    coordinator.add_argument("--shard-size", type=int, help="每个分片的行数，默认取配置 DISTRIBUTED_SHARD_SIZE")
+    coordinator.add_argument("--submit-only", action="store_true", help="只提交任务，稍后用 --job 合并")
+    coordinator.add_argument("--poll-interval", type=float, default=5.0, help="检查任务进度的间隔（秒）")
+    coordinator.add_argument("--output", help="报告输出路径（默认写入报告目录）")
+    worker = subparsers.add_parser("worker", help="加载裁判模型并持续领取分片评估")
+    worker.add_argument("--workers", type=int, default=LOCAL_BATCH_WORKERS,
+                        help="本地模型在 CPU 上的数据并行进程数")
+    worker.add_argument("--exit-when-idle", action="store_true", help="队列中没有可领取的分片时退出")
+    for subparser in (coordinator, worker):
+        judges = subparser.add_mutually_exclusive_group()
+        judges.add_argument("--judge", choices=list(FINETUNED_JUDGE_MODELS), help="微调裁判模型名称")
+        judges.add_argument("--proprietary", choices=list(PROPRIETARY_MODELS), help="专有模型名称")
+        subparser.add_argument("--queue", help="共享工作队列（SQLite）路径，默认取配置 DISTRIBUTED_QUEUE_PATH")
+    return parser
+
+
+def distributed_main(argv):
+    args = build_distributed_parser().parse_args(argv)
+    if args.command == "worker":
+        if not args.judge and not args.proprietary:
+            print("请指定微调裁判模型或专有模型")
+            return 1
+        completed = run_worker(args.judge, args.proprietary, args.queue, args.exit_when_idle, args.workers)
+        print(f"工作进程退出，完成 {completed} 个分片")
+        return 0
+    message, result = run_coordinator(
+        args.input, args.mode, args.judge or args.proprietary, args.job, args.shard_size, args.queue,
+        args.output, args.submit_only, args.poll_interval)
+    print(message)
+    if result is None:
+        return 1
+    if not args.submit_only:
+        print(result)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="LLM-as-a-Judge 批量评估（无界面）")
+    parser.add_argument("input", help="输入文件（CSV / JSON，包含 instruction, answer1, answer2）")
+    parser.add_argument("--mode", default="direct", choices=sorted(MODE_ALIASES),
+                        help="推理策略：direct（直接评估）或 cot（思维链）")
+    parser.add_argument("--judge", choices=list(FINETUNED_JUDGE_MODELS),
+                        help="微调裁判模型名称")
+    parser.add_argument("--proprietary", choices=list(PROPRIETARY_MODELS),
+                        help="专有模型名称")
+    parser.add_argument("--cascade", action="store_true",
+                        help="级联评估：低置信度的行交给专有模型重新评估")
+    parser.add_argument("--calibration", action="store_true",
+                        help="启用表面质量校准（仅专有模型）")
+    parser.add_argument("--explanations", action="store_true",
+                        help="级联评估报告中包含本地模型对未升级行的解释")
+    parser.add_argument("--ensemble", nargs="+", choices=list(PROPRIETARY_MODELS),
+                        help="集成评估：多个专有模型并发评估每一对（可用 --judge 加入本地裁判模型）")
+    parser.add_argument("--aggregation", default="majority", choices=["majority", "mean"],
+                        help="集成评估的聚合方式：多数投票或平均分")
+    parser.add_argument("--max-tokens", type=int,
+                        help="专有模型单次回复的 token 上限（含推理内容），覆盖配置中的生成预算")
+    parser.add_argument("--reasoning-effort", choices=["low", "medium", "high"],
+                        help="推理强度，仅对支持该参数的模型有效")
+    parser.add_argument("--pointwise", action="store_true",
+                        help="逐答案评分：每个答案单独评分并缓存，成对结论由两侧分数得出")
+    parser.add_argument("--estimate", action="store_true",
+                        help="估计模式：随机顺序逐行评估，胜率置信区间足够窄或胜负已定即停止")
+    parser.add_argument("--target-width", type=float, default=0.1,
+                        help="估计模式的目标置信区间宽度")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="估计模式的显著性水平（置信度为 1 - alpha）")
+    parser.add_argument("--seed", type=int, help="估计模式的抽样随机种子")
+    parser.add_argument("--threshold", type=float,
+                        help="级联评估的置信度阈值（默认 0.5；重算时默认沿用报告中的阈值）")
+    parser.add_argument("--recompute", action="store_true",
+                        help="离线重算：input 为校准或级联评估的报告，按 --calibration-weight / --threshold 重新得出结论")
+    parser.add_argument("--calibration-weight", type=float,
+                        help="重算使用的表面质量扣减权重（默认沿用报告中的权重）")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="离线批处理：把所有行打包提交到提供方的批处理接口，完成后合并为报告（需配合 --proprietary）")
+    parser.add_argument("--collect", action="store_true",
+                        help="继续收取批处理结果：input 为提交时生成的任务清单（JSON）")
+    parser.add_argument("--poll-interval", type=float,
+                        help="批处理的轮询间隔（秒），默认取配置 BATCH_POLL_INTERVAL")
+    parser.add_argument("--workers", type=int, default=LOCAL_BATCH_WORKERS,
+                        help="本地模型在 CPU 上的数据并行进程数")
+    parser.add_argument("--output", help="报告输出路径（默认写入报告目录或临时目录）")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in ("coordinator", "worker"):
+        return distributed_main(argv)
+    args = build_parser().parse_args(argv)
+    if args.recompute or args.collect:
+        if args.recompute:
+            message, report_path = run_recompute(
+                args.input, args.calibration_weight, args.threshold, args.output)
+        else:
+            message, report_path = run_collect(args.input, args.output, args.poll_interval)
+        print(message)
+        if report_path is None:
+            return 1
+        print(report_path)
+        return 0
+    message, report_path = run_batch(
+        args.input, args.mode, judge=args.judge, proprietary=args.proprietary,
+        cascade=args.cascade, calibration=args.calibration,
+        threshold=0.5 if args.threshold is None else args.threshold,
+        workers=args.workers, output=args.output, explanations=args.explanations,
+        estimate=args.estimate, target_width=args.target_width, alpha=args.alpha, seed=args.seed,
+        pointwise=args.pointwise, ensemble=args.ensemble, aggregation=args.aggregation,
+        max_tokens=args.max_tokens, reasoning_effort=args.reasoning_effort,
+        batch_api=args.batch_api, poll_interval=args.poll_interval)
+    print(message)
+    if report_path is None:
+        return 1
+    print(report_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
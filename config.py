@@ -1,3 +1,8 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()  # 以下配置项同样可以写在 .env 文件中
+
 # 模型选项
 FINETUNED_JUDGE_MODELS = {
     "JudgeLM-7B": "BAAI/JudgeLM-7B-v1.0",
@@ -9,3 +14,177 @@ PROPRIETARY_MODELS = {
     "DeepSeek-V3": "deepseek-v3-250324",
     "DeepSeek-R1": "deepseek-r1-250120",
 }
+
+# 本地裁判模型批量评估的数据并行进程数（仅 CPU 生效，1 表示单进程）。
+# 模型在父进程加载一次并放入共享内存，各 spawn 工作进程共用同一份权重；进程池按模型路径常驻，只在首次使用时有启动开销
+LOCAL_BATCH_WORKERS = int(os.getenv("LOCAL_BATCH_WORKERS", "1"))
+
+# 进程启动时预加载并预热的微调裁判模型（FINETUNED_JUDGE_MODELS 中的名称或模型路径），为空则不预加载
+PRELOAD_JUDGE_MODEL = os.getenv("PRELOAD_JUDGE_MODEL", "")
+
+# 本地模型在 CPU 上的权重精度；auto 沿用权重文件的精度，不会把半精度权重展开为完整的 fp32 副本，
+# 也可设为 float32 / bfloat16 等 torch 精度名称
+LOCAL_CPU_DTYPE = os.getenv("LOCAL_CPU_DTYPE", "auto")
+
+# 集成评估中同时进行的 (行, 裁判) 请求数上限；各提供方的并发仍受其 max_concurrency 限制
+ENSEMBLE_MAX_WORKERS = int(os.getenv("ENSEMBLE_MAX_WORKERS", "16"))
+
+# 逐答案评分模式的分数缓存（SQLite），按 (指令, 答案, 裁判模型, 推理策略) 缓存单答案分数
+SCORE_CACHE_PATH = os.getenv("SCORE_CACHE_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "webui", "cache", "scores.sqlite3"))
+
+# 校准评估中表面质量得分的扣减权重：校准分 = 原分数 - CALIBRATION_WEIGHT × 表面质量得分。
+# 报告保存了原分数与表面质量得分，修改权重后可用离线重算得到新结论，无需重新调用模型
+CALIBRATION_WEIGHT = float(os.getenv("CALIBRATION_WEIGHT", "0.8"))
+
+# 会话状态的存活时间（秒）：会话在此时长内没有任何操作时释放其加载的本地模型，0 表示不过期
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+
+# 辅助（推测）解码：小草稿模型先连续猜出若干 token，由裁判模型一次前向验证，贪心解码下输出与普通解码一致。
+# 草稿模型必须与裁判模型使用相同的词表（JudgeLM 基于 LLaMA，可搭配 LLaMA 词表的小模型）
+ASSISTED_DECODING = os.getenv("ASSISTED_DECODING", "0") == "1"
+DRAFT_MODELS = {
+    "JudgeLM-7B": os.getenv("JUDGELM_DRAFT_MODEL", "JackFram/llama-160m"),
+    "JudgeLM-7B-Debiased": os.getenv("JUDGELM_DRAFT_MODEL", "JackFram/llama-160m"),
+}
+
+# 编译解码：本地裁判模型的前向经 torch.compile 编译，并使用按长度分桶的静态 KV 缓存，减少逐 token 的 Python 开销。
+# 静态缓存长度为 (提示 + 生成上限) 向上取整到 STATIC_CACHE_BUCKET 的倍数（不超过模型的位置长度），同一长度桶复用缓存与编译结果；
+# 编译产物（inductor FX 图缓存）写入 COMPILE_CACHE_DIR，重启后直接复用。启用后不再使用辅助解码的草稿模型
+COMPILED_DECODING = os.getenv("COMPILED_DECODING", "0") == "1"
+STATIC_CACHE_BUCKET = int(os.getenv("STATIC_CACHE_BUCKET", "256"))
+COMPILE_CACHE_DIR = os.getenv("COMPILE_CACHE_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "webui", "cache", "inductor"))
+
+# 本地裁判模型批量评估时每次 generate 的行数；大于 1 时按提示长度分桶后左填充批量生成，
+# 为 1 时逐行生成并复用同一指令的公共前缀 KV 缓存
+LOCAL_BATCH_SIZE = int(os.getenv("LOCAL_BATCH_SIZE", "1"))
+
+# 本地提示的 token 上限，0 表示取模型的 max_position_embeddings 减去 LOCAL_RESERVED_NEW_TOKENS
+LOCAL_MAX_PROMPT_TOKENS = int(os.getenv("LOCAL_MAX_PROMPT_TOKENS", "0"))
+LOCAL_RESERVED_NEW_TOKENS = int(os.getenv("LOCAL_RESERVED_NEW_TOKENS", "512"))
+
+# 提示超长时的截断策略：head 保留答案开头，tail 保留答案结尾，middle 保留首尾、省略中间，skip 不截断并跳过该行
+LOCAL_TRUNCATION_POLICY = os.getenv("LOCAL_TRUNCATION_POLICY", "head")
+
+# 本地裁判模型 HTTP 服务（serve.py）的地址，例如 http://127.0.0.1:8000/v1。
+# 设置后微调裁判模型以 "<名称> (服务)" 的形式出现在专有模型列表中，通过 call_model 调用
+LOCAL_JUDGE_BASE_URL = os.getenv("LOCAL_JUDGE_BASE_URL", "")
+
+# 模型服务提供方（OpenAI 兼容接口）：
+#   base_url          接口地址
+#   api_key_env       读取 API Key 的环境变量名
+#   max_concurrency   同时进行的请求数上限
+#   rate_limit        每分钟请求数上限，0 表示不限
+#   timeout           单次请求超时（秒）
+#   price             每千 token 价格（元），input / output 分别计价，请按服务商实际价格配置
+#   batch             是否支持 OpenAI 格式的离线批处理接口（/files + /batches），支持的提供方可用批处理模式提交大批量评估
+PROVIDERS = {
+    "dashscope": {
+        "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1",
+        "api_key_env": "DASHSCOPE_API_KEY",
+        "max_concurrency": 8,
+        "rate_limit": 0,
+        "timeout": 120,
+        "price": {"input": 0.0, "output": 0.0},
+        "batch": True,
+    },
+    "ark": {
+        "base_url": "https://ark.cn-beijing.volces.com/api/v3",
+        "api_key_env": "ARK_API_KEY",
+        "max_concurrency": 8,
+        "rate_limit": 0,
+        "timeout": 600,
+        "price": {"input": 0.0, "output": 0.0},
+    },
+    # serve.py 或其他自建 vLLM 类 OpenAI 兼容服务
+    "local": {
+        "base_url": LOCAL_JUDGE_BASE_URL or "http://127.0.0.1:8000/v1",
+        "api_key_env": "LOCAL_JUDGE_API_KEY",
+        "max_concurrency": 32,
+        "rate_limit": 0,
+        "timeout": 600,
+        "price": {"input": 0.0, "output": 0.0},
+    },
+    # mock_server.py，用于压测和离线调试
+    "mock": {
+        "base_url": os.getenv("MOCK_BASE_URL", "http://127.0.0.1:8100/v1"),
+        "api_key_env": "MOCK_API_KEY",
+        "max_concurrency": 64,
+        "rate_limit": 0,
+        "timeout": 60,
+        "price": {"input": 0.0, "output": 0.0},
+        "batch": True,
+    },
+}
+
+# 模型 ID -> 提供方
+MODEL_PROVIDERS = {
+    "qwen-plus": "dashscope",
+    "deepseek-v3-250324": "ark",
+    "deepseek-r1-250120": "ark",
+}
+
+if LOCAL_JUDGE_BASE_URL:
+    PROPRIETARY_MODELS.update(
+        {f"{name} (服务)": name for name in FINETUNED_JUDGE_MODELS})
+    MODEL_PROVIDERS.update({name: "local" for name in FINETUNED_JUDGE_MODELS})
+
+# 每个模型 ID 的生成预算：
+#   max_tokens         单次回复的 token 上限（推理模型的推理内容也计入）
+#   reasoning_effort   推理强度 low / medium / high，仅对支持该参数的模型和服务有效
+# 未配置的模型不限制。命令行的 --max-tokens / --reasoning-effort 可在单次批量任务中覆盖
+JUDGE_GENERATION = {
+    "deepseek-r1-250120": {"max_tokens": 4096},
+}
+
+# 额外的提供方配置文件（JSON），格式：
+#   {"providers": {名称: {...}}, "models": {显示名称: {"model": 模型 ID, "provider": 提供方, "generation": {...}}}}
+# 其中的提供方与同名内置配置合并，模型追加到 PROPRIETARY_MODELS，generation 为可选的生成预算
+PROVIDERS_FILE = os.getenv("PROVIDERS_FILE", "")
+if PROVIDERS_FILE:
+    import json
+
+    with open(PROVIDERS_FILE, 'r', encoding='utf-8') as f:
+        _providers_config = json.load(f)
+    for _name, _provider in _providers_config.get("providers", {}).items():
+        PROVIDERS[_name] = {**PROVIDERS.get(_name, {}), **_provider}
+    for _display_name, _model in _providers_config.get("models", {}).items():
+        PROPRIETARY_MODELS[_display_name] = _model["model"]
+        MODEL_PROVIDERS[_model["model"]] = _model["provider"]
+        if "generation" in _model:
+            JUDGE_GENERATION[_model["model"]] = _model["generation"]
+
+# 把所有模型的请求改发到指定提供方（例如 mock），无需改代码即可压测或切换到自建服务
+PROVIDER_OVERRIDE = os.getenv("PROVIDER_OVERRIDE", "")
+
+# 请求对冲：调用耗时超过该模型近期延迟的 HEDGE_QUANTILE 分位数仍未返回时，再发一个相同的请求，
+# 取先返回且能解析出分数的结果。分位数在积累 HEDGE_MIN_SAMPLES 次延迟后才启用
+HEDGING = os.getenv("HEDGING", "0") == "1"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# 对冲请求数占请求总数的比例上限，即额外花费的上限
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+# 模型 ID -> (备用提供方, 备用提供方上的模型 ID)；未配置的模型对冲到同一提供方。
+# 备用提供方需要单独的 API Key，默认不配置，例如 {"deepseek-r1-250120": ("dashscope", "deepseek-r1")}
+HEDGE_FALLBACKS = {}
+
+# 离线批处理模式：单个批处理文件的请求数上限（OpenAI 格式的上限为 50000）、轮询间隔（秒），
+# 以及任务清单的存放目录（记录已提交的批处理 ID，轮询中断后可据此继续收取结果）
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "50000"))
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "30"))
+BATCH_JOB_DIR = os.getenv("BATCH_JOB_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "webui", "cache", "batch_jobs"))
+
+# 分布式批量评估：协调进程把输入切成分片写入共享的 SQLite 工作队列，各节点的工作进程领取分片评估。
+# 队列文件与任务目录需位于所有节点都能访问、支持文件锁的共享存储上。
+# 工作进程每 DISTRIBUTED_HEARTBEAT_INTERVAL 秒更新心跳，超过 DISTRIBUTED_HEARTBEAT_TIMEOUT 秒没有心跳的分片
+# 视为工作进程已退出，重新排队；同一分片最多尝试 DISTRIBUTED_MAX_ATTEMPTS 次
+DISTRIBUTED_QUEUE_PATH = os.getenv("DISTRIBUTED_QUEUE_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "webui", "cache", "queue.sqlite3"))
+DISTRIBUTED_JOB_DIR = os.getenv("DISTRIBUTED_JOB_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "webui", "cache", "jobs"))
+DISTRIBUTED_SHARD_SIZE = int(os.getenv("DISTRIBUTED_SHARD_SIZE", "500"))
+DISTRIBUTED_HEARTBEAT_INTERVAL = float(os.getenv("DISTRIBUTED_HEARTBEAT_INTERVAL", "10"))
+DISTRIBUTED_HEARTBEAT_TIMEOUT = float(os.getenv("DISTRIBUTED_HEARTBEAT_TIMEOUT", "60"))
+DISTRIBUTED_MAX_ATTEMPTS = int(os.getenv("DISTRIBUTED_MAX_ATTEMPTS", "3"))
@@ -0,0 +1,173 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+# Elo 刻度：与常见排行榜一致，基准分 1000，400 分差对应 10 倍胜率比
+ELO_BASE = 1000.0
+ELO_SCALE = 400.0 / np.log(10)
+
+# 每个出现过对局的模型对双向各加的伪胜场，避免全胜/全负模型的 BT 分数发散
+BT_PRIOR = 0.1
+
+
+def load_outcomes(report_paths, judge=None):
+    """
+    读取多个评估报告，返回规范化的对局表（model_a, model_b, judge, outcome）。
+    outcome 为 1（model_a 胜）、0.5（平局）、0（model_b 胜），报告中须包含 model1 / model2 列。
+    """
+    frames = []
+    for path in report_paths:
+        df = pd.read_csv(path)
+        if 'model1' not in df.columns or 'model2' not in df.columns or 'winner' not in df.columns:
+            print(f"跳过报告 {os.path.basename(path)}：缺少 model1 / model2 / winner 列")
+            continue
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=['model_a', 'model_b', 'judge', 'outcome'])
+    df = pd.concat(frames, ignore_index=True)
+    if 'judge' not in df.columns:
+        df['judge'] = None
+    if judge is not None:
+        df = df[df['judge'] == judge]
+    df = df[df['winner'].isin(['model1', 'model2', 'draw'])]
+    outcome = df['winner'].map({'model1': 1.0, 'draw': 0.5, 'model2': 0.0})
+    return pd.DataFrame({
+        'model_a': df['model1'].astype(str).to_numpy(),
+        'model_b': df['model2'].astype(str).to_numpy(),
+        'judge': df['judge'].to_numpy(),
+        'outcome': outcome.to_numpy(),
+    })
+
+
+def fit_bradley_terry(wins, draws, init=None, max_iter=500, tol=1e-8):
+    """
+    用 MM 算法拟合 Bradley–Terry 强度，平局记为双方各半场胜利。
+    wins / draws 可为 (N, N) 或批量的 (B, N, N) 矩阵，wins[i, j] 为 i 胜 j 的次数。
+    返回对数强度（均值为 0）。
+    """
+    games = wins + np.swapaxes(wins, -1, -2) + draws
+    played = games > 0
+    w = wins + 0.5 * draws + BT_PRIOR * played
+    games = games + 2 * BT_PRIOR * played
+    total_wins = w.sum(axis=-1)
+    n = wins.shape[-1]
+    if init is None:
+        p = np.ones(wins.shape[:-1])
+    else:
+        p = np.broadcast_to(np.exp(init), wins.shape[:-1]).copy()
+    for _ in range(max_iter):
+        denom = (games / (p[..., :, None] + p[..., None, :])).sum(axis=-1)
+        new_p = np.where(denom > 0, total_wins / np.where(denom > 0, denom, 1), p)
+        # 几何平均归一化，防止整体漂移
+        new_p = new_p / np.exp(np.log(new_p).mean(axis=-1, keepdims=True))
+        if np.max(np.abs(new_p - p)) < tol:
+            p = new_p
+            break
+        p = new_p
+    log_p = np.log(p)
+    return log_p - log_p.mean(axis=-1, keepdims=True) if n else log_p
+
+
+class Leaderboard:
+    """
+    多报告排行榜聚合器。对局按模型对汇总成 (N, N) 胜负矩阵，
+    新报告到达时只累加计数并以上次结果热启动重新拟合。
+    """
+
+    def __init__(self, bootstrap_rounds=200, confidence=0.95, seed=0):
+        self.bootstrap_rounds = bootstrap_rounds
+        self.confidence = confidence
+        self.seed = seed
+        self.models = []
+        self._index = {}
+        self._wins = np.zeros((0, 0))
+        self._draws = np.zeros((0, 0))
+        self._log_strength = np.zeros(0)
+
+    def _ensure_models(self, names):
+        new = [name for name in pd.unique(names) if name not in self._index]
+        if not new:
+            return
+        for name in new:
+            self._index[name] = len(self.models)
+            self.models.append(name)
+        n = len(self.models)
+        old = self._wins.shape[0]
+        for attr in ('_wins', '_draws'):
+            grown = np.zeros((n, n))
+            grown[:old, :old] = getattr(self, attr)
+            setattr(self, attr, grown)
+        self._log_strength = np.concatenate(
+            [self._log_strength, np.zeros(n - old)])
+
+    def add_outcomes(self, outcomes):
+        """累加对局表（见 load_outcomes）到胜负矩阵。"""
+        if len(outcomes) == 0:
+            return self
+        self._ensure_models(np.concatenate(
+            [outcomes['model_a'].to_numpy(), outcomes['model_b'].to_numpy()]))
+        a = outcomes['model_a'].map(self._index).to_numpy()
+        b = outcomes['model_b'].map(self._index).to_numpy()
+        result = outcomes['outcome'].to_numpy()
+        a_wins = result == 1.0
+        b_wins = result == 0.0
+        draw = result == 0.5
+        np.add.at(self._wins, (a[a_wins], b[a_wins]), 1)
+        np.add.at(self._wins, (b[b_wins], a[b_wins]), 1)
+        np.add.at(self._draws, (a[draw], b[draw]), 1)
+        np.add.at(self._draws, (b[draw], a[draw]), 1)
+        return self
+
+    def add_reports(self, report_paths, judge=None):
+        return self.add_outcomes(load_outcomes(report_paths, judge=judge))
+
+    def _bootstrap(self):
+        # 对 (i, j, 结果) 单元格做多项分布重采样，与逐条重采样对局等价但与对局数无关
+        rng = np.random.default_rng(self.seed)
+        n = len(self.models)
+        upper = np.triu(np.ones((n, n), dtype=bool), k=1)
+        win_cells = np.nonzero(self._wins)
+        draw_cells = np.nonzero(np.where(upper, self._draws, 0))
+        counts = np.concatenate(
+            [self._wins[win_cells], self._draws[draw_cells]])
+        total = int(counts.sum())
+        samples = rng.multinomial(
+            total, counts / total, size=self.bootstrap_rounds)
+        k = len(win_cells[0])
+        wins = np.zeros((self.bootstrap_rounds, n, n))
+        draws = np.zeros((self.bootstrap_rounds, n, n))
+        wins[:, win_cells[0], win_cells[1]] = samples[:, :k]
+        draws[:, draw_cells[0], draw_cells[1]] = samples[:, k:]
+        draws = draws + np.swapaxes(draws, -1, -2)
+        return fit_bradley_terry(wins, draws, init=self._log_strength, max_iter=100, tol=1e-6)
+
+    def compute(self):
+        """拟合并返回按 Elo 排序的排行榜 DataFrame。"""
+        columns = ['model', 'elo', 'elo_lower', 'elo_upper',
+                   'bt_strength', 'games', 'win_rate']
+        if not self.models:
+            return pd.DataFrame(columns=columns)
+        self._log_strength = fit_bradley_terry(
+            self._wins, self._draws, init=self._log_strength)
+        elo = ELO_BASE + ELO_SCALE * self._log_strength
+        if self.bootstrap_rounds > 0 and self._wins.sum() + self._draws.sum() > 0:
+            boot_elo = ELO_BASE + ELO_SCALE * self._bootstrap()
+            alpha = (1 - self.confidence) / 2
+            lower, upper = np.quantile(boot_elo, [alpha, 1 - alpha], axis=0)
+        else:
+            lower = upper = np.full(len(self.models), np.nan)
+        games = self._wins.sum(axis=1) + self._wins.sum(axis=0) + self._draws.sum(axis=1)
+        score = self._wins.sum(axis=1) + 0.5 * self._draws.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            win_rate = np.where(games > 0, score / games, np.nan)
+        board = pd.DataFrame({
+            'model': self.models,
+            'elo': elo,
+            'elo_lower': lower,
+            'elo_upper': upper,
+            'bt_strength': np.exp(self._log_strength),
+            'games': games.astype(int),
+            'win_rate': win_rate,
+        }, columns=columns)
+        return board.sort_values('elo', ascending=False, ignore_index=True)
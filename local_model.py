@@ -0,0 +1,300 @@
+import gc
+import math
+import os
+import threading
+from contextlib import contextmanager
+import torch
+from modelscope import AutoModelForCausalLM, AutoTokenizer
+from config import (
+    FINETUNED_JUDGE_MODELS, PRELOAD_JUDGE_MODEL, LOCAL_CPU_DTYPE, ASSISTED_DECODING, DRAFT_MODELS,
+    COMPILED_DECODING, STATIC_CACHE_BUCKET, COMPILE_CACHE_DIR
+)
+
+
+# 已加载模型缓存：(model_path, device) -> (model, tokenizer)，多个会话共享同一份权重
+_model_cache = {}
+_cache_lock = threading.Lock()
+_path_locks = {}
+# 启动时预加载的模型常驻内存，卸载时不从缓存移除
+_pinned = set()
+# 每个缓存模型被 get_local_model 取用的次数，release_local_model 减到 0 时才移出缓存
+_refs = {}
+
+
+def default_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _torch_dtype(device):
+    if device == "cuda":
+        return torch.float16
+    if LOCAL_CPU_DTYPE == "auto":
+        return "auto"
+    return getattr(torch, LOCAL_CPU_DTYPE)
+
+
+def load_local_model(model_path, device=None):
+    """
+    加载本地裁判模型，返回 (model, tokenizer)。加载失败时抛出原始异常，由调用方转换为提示信息。
+    low_cpu_mem_usage 下 safetensors 权重经 mmap 逐个读入并直接放到目标设备，不再先构造一份随机初始化的模型再整体 .to(device)。
+    """
+    device = device or default_device()
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(
+            model_path, trust_remote_code=True)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            torch_dtype=_torch_dtype(device),
+            low_cpu_mem_usage=True,
+            device_map=device,
+        )
+        return model, tokenizer
+    finally:
+        gc.collect()
+
+
+def configure_compile_cache(cache_dir=COMPILE_CACHE_DIR):
+    # inductor 在首次编译时读取这些环境变量；已由外部设置的不覆盖
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir)
+
+
+def compile_model(model):
+    """
+    编译解码模式：用 torch.compile 包装模型前向，之后的 generate 通过 decode_cache 使用按长度分桶的静态 KV 缓存，
+    解码阶段每步的张量形状固定，编译结果在同一长度桶内复用。重复调用不会重复编译。
+    """
+    if is_compiled(model):
+        return model
+    configure_compile_cache()
+    mode = "reduce-overhead" if model.device.type == "cuda" else None
+    model.forward = torch.compile(model.forward, mode=mode)
+    # 每个 (批大小, 缓存长度) 一个空闲静态缓存池；并发的 generate 各取一个，用完归还
+    model._static_caches = {}
+    model._static_cache_lock = threading.Lock()
+    return model
+
+
+def is_compiled(model):
+    return model is not None and hasattr(model, "_static_caches")
+
+
+def acquire_static_cache(model, batch_size, max_length):
+    """
+    从模型的缓存池取一个空 StaticCache（池中没有时新建），模型未编译时返回 None。用完后应调用 release_static_cache。
+    缓存长度为 max_length 向上取整到 STATIC_CACHE_BUCKET 的倍数，且不超过模型位置长度，
+    调用方应按 cache.max_cache_len 收紧生成长度。同一长度桶复用缓存张量与编译结果。
+    """
+    if not is_compiled(model):
+        return None
+    from transformers import StaticCache
+
+    length = math.ceil(max_length / STATIC_CACHE_BUCKET) * STATIC_CACHE_BUCKET
+    max_positions = getattr(model.config, "max_position_embeddings", None)
+    if max_positions:
+        length = min(length, max_positions)
+    with model._static_cache_lock:
+        pool = model._static_caches.setdefault((batch_size, length), [])
+        cache = pool.pop() if pool else None
+    if cache is None:
+        return StaticCache(config=model.config, batch_size=batch_size, max_cache_len=length,
+                           device=model.device, dtype=model.dtype)
+    cache.reset()
+    return cache
+
+
+def release_static_cache(model, cache):
+    # 把 acquire_static_cache 取出的缓存放回池中；cache 为 None 时什么也不做
+    if cache is None:
+        return
+    with model._static_cache_lock:
+        model._static_caches.setdefault((cache.batch_size, cache.max_cache_len), []).append(cache)
+
+
+def crop_static_cache(cache, length):
+    """
+    把 StaticCache 裁回前 length 个位置（原地清零其后的位置，缓存张量地址不变）。
+    StaticCache 按非零位置统计已缓存长度，generate 据此确定续写的起点。
+    """
+    for key_cache, value_cache in zip(cache.key_cache, cache.value_cache):
+        key_cache[:, :, length:].zero_()
+        value_cache[:, :, length:].zero_()
+
+
+@contextmanager
+def decode_cache(model, input_ids, max_new_tokens):
+    """
+    为一次 generate 提供生成参数 {"max_new_tokens"}，编译解码模式下另加静态 KV 缓存 "past_key_values"。
+    静态缓存不超过模型位置长度，max_new_tokens 相应收紧到缓存的剩余长度（与模型本身能生成的上限一致）；
+    提示已占满位置长度时退回动态缓存。
+    """
+    batch_size, input_length = input_ids.shape
+    cache = acquire_static_cache(model, batch_size, input_length + max_new_tokens)
+    if cache is not None and cache.max_cache_len <= input_length:
+        release_static_cache(model, cache)
+        cache = None
+    if cache is None:
+        yield {"max_new_tokens": max_new_tokens}
+        return
+    try:
+        yield {"max_new_tokens": min(max_new_tokens, cache.max_cache_len - input_length), "past_key_values": cache}
+    finally:
+        release_static_cache(model, cache)
+
+
+def warmup(model, tokenizer):
+    # 预热一次极短的生成，让首个用户请求不再承担算子初始化、内存分配等懒加载开销；
+    # 编译解码模式下再用另一长度的提示预热一次：第二个预填充长度会让 dynamo 改为动态形状重新编译，
+    # 之后任意提示长度都复用这份编译结果，不再由首个用户请求承担
+    # 缓存按评估时的生成上限（2048）取用，与实际请求落在同一长度桶，只生成 2 个 token
+    prompts = ["Hello", "Hello, please judge the two answers below."] if is_compiled(model) else ["Hello"]
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        with torch.no_grad(), decode_cache(model, inputs["input_ids"], 2048) as cache_kwargs:
+            model.generate(**inputs, do_sample=False, **{**cache_kwargs, "max_new_tokens": 2})
+
+
+def _take_cached(key, pin):
+    # 调用方须持有 _cache_lock：命中时计一次引用（并按需常驻）并返回 (model, tokenizer)，未命中返回 None
+    entry = _model_cache.get(key)
+    if entry is not None:
+        if pin:
+            _pinned.add(key)
+        _refs[key] = _refs.get(key, 0) + 1
+    return entry
+
+
+def get_local_model(model_path, device=None, pin=False):
+    """
+    取缓存中的模型，未命中时加载并预热。同一路径的并发加载只会执行一次。
+    每次调用计一次引用，用完后应调用 release_local_model。
+    缓存查询、计数与常驻标记都在 _cache_lock 内完成，路径锁只保护实际加载。
+    """
+    device = device or default_device()
+    key = (model_path, device)
+    with _cache_lock:
+        entry = _take_cached(key, pin)
+        if entry is not None:
+            return entry
+        path_lock = _path_locks.setdefault(key, threading.Lock())
+    with path_lock:
+        with _cache_lock:
+            # 等待路径锁期间其他会话可能已加载完成
+            entry = _take_cached(key, pin)
+            if entry is not None:
+                return entry
+        model, tokenizer = load_local_model(model_path, device)
+        if COMPILED_DECODING and model_path in FINETUNED_JUDGE_MODELS.values():
+            # 只编译裁判模型，草稿模型仍走普通路径
+            compile_model(model)
+        warmup(model, tokenizer)
+        with _cache_lock:
+            _model_cache[key] = (model, tokenizer)
+            return _take_cached(key, pin)
+
+
+def release_local_model(model_path, device=None):
+    # 释放一次引用；引用全部释放后把非常驻模型移出缓存，返回是否移出
+    key = (model_path, device or default_device())
+    with _cache_lock:
+        refs = max(0, _refs.get(key, 0) - 1)
+        _refs[key] = refs
+        if refs or key in _pinned:
+            return False
+        released = _model_cache.pop(key, None) is not None
+    if released:
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    return released
+
+
+def model_bytes(model):
+    # 模型参数与缓冲区占用的字节数
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def cache_usage():
+    """
+    返回已缓存模型的内存占用 [(model_path, device, bytes, refs, pinned), ...]。
+    """
+    with _cache_lock:
+        items = list(_model_cache.items())
+        refs = dict(_refs)
+        pinned = set(_pinned)
+    return [(path, device, model_bytes(model), refs.get((path, device), 0), (path, device) in pinned)
+            for (path, device), (model, _) in items]
+
+
+def draft_model_path(judge_name):
+    # 裁判模型对应的草稿模型路径；未启用辅助解码、启用了编译解码或未配置时返回 None
+    if not ASSISTED_DECODING or COMPILED_DECODING:
+        return None
+    return DRAFT_MODELS.get(judge_name) or None
+
+
+def get_draft_model(judge_name, device=None):
+    """
+    取辅助解码用的草稿模型（与裁判模型同样走进程内缓存），未启用时返回 None。
+    """
+    path = draft_model_path(judge_name)
+    if path is None:
+        return None
+    model, _ = get_local_model(path, device)
+    return model
+
+
+def preload_local_model(model_name=PRELOAD_JUDGE_MODEL):
+    """
+    进程启动时按配置预加载并预热模型（常驻）。model_name 可以是 FINETUNED_JUDGE_MODELS 中的名称或模型路径。
+    """
+    if not model_name:
+        return None
+    model_path = FINETUNED_JUDGE_MODELS.get(model_name, model_name)
+    print(f"Preloading judge model {model_name} from {model_path}")
+    return get_local_model(model_path, pin=True)
+
+
+def start_preload():
+    # 后台预加载，不阻塞界面启动；用户点击加载同一模型时会等待预加载完成而不是重复加载
+    if not PRELOAD_JUDGE_MODEL:
+        return None
+    thread = threading.Thread(target=preload_local_model, daemon=True)
+    thread.start()
+    return thread
+
+
+def generate_batch(model, tokenizer, prompts, max_new_tokens, add_special_tokens=True):
+    """
+    左填充后批量生成。max_new_tokens 可以是整数或与 prompts 等长的列表（按最大值统一生成，再按各自上限截断）。
+    返回 [(text, prompt_tokens, completion_tokens), ...]。
+    """
+    if isinstance(max_new_tokens, int):
+        max_new_tokens = [max_new_tokens] * len(prompts)
+    padding_side = tokenizer.padding_side
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    try:
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True,
+                           add_special_tokens=add_special_tokens).to(model.device)
+    finally:
+        tokenizer.padding_side = padding_side
+    with torch.no_grad(), decode_cache(model, inputs["input_ids"], max(max_new_tokens)) as generate_kwargs:
+        sequences = model.generate(
+            **inputs,
+            pad_token_id=tokenizer.pad_token_id,
+            **generate_kwargs
+        )
+    input_length = inputs["input_ids"].shape[1]
+    prompt_lengths = inputs["attention_mask"].sum(dim=1).tolist()
+    results = []
+    for row, limit, prompt_tokens in zip(sequences, max_new_tokens, prompt_lengths):
+        generated = row[input_length:][:limit].tolist()
+        if tokenizer.eos_token_id in generated:
+            generated = generated[:generated.index(tokenizer.eos_token_id) + 1]
+        text = tokenizer.decode(generated, skip_special_tokens=True)
+        results.append((text, prompt_tokens, len(generated)))
+    return results
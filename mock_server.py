@@ -0,0 +1,212 @@
+"""
+OpenAI 兼容的模拟裁判服务，用于压测与离线调试，不调用任何真实模型。
+
+按提示内容的哈希给出确定性的分数，输出格式与对应提示要求一致（直接评估分数在首行，
+思维链与表面质量评分分数在末行），可设置固定延迟与随机抖动。
+
+同时模拟 OpenAI 格式的离线批处理接口（/v1/files 与 /v1/batches）：批处理在创建 --batch-delay-s 秒后
+查询时一次性完成，结果保存在内存中。
+
+用法：python mock_server.py --port 8100 --latency-ms 200
+客户端设置 PROVIDER_OVERRIDE=mock（可选 MOCK_BASE_URL）即可把所有模型请求发往此服务。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+
+
+def mock_reply(messages):
+    prompt = "\n".join(str(msg.get("content", "")) for msg in messages)
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    score1, score2 = digest[0] % 10 + 1, digest[1] % 10 + 1
+    explanation = "This is a mock evaluation generated for load testing."
+    if "superficial quality" in prompt:
+        return f"{explanation}\n{score1}"
+    if "only one value indicating the score for the assistant" in prompt:
+        # 逐答案评分提示
+        if "In the subsequent line, please output a single line containing only one value" in prompt:
+            return f"{explanation}\n{score1}"
+        return f"{score1}\n{explanation}"
+    if "In the subsequent line, please output a single line containing only two values" in prompt:
+        return f"{explanation}\n{score1} {score2}"
+    return f"{score1} {score2}\n{explanation}"
+
+
+def mock_completion(body):
+    text = mock_reply(body.get("messages", []))
+    prompt_tokens = sum(len(str(msg.get("content", "")).split())
+                        for msg in body.get("messages", []))
+    completion_tokens = len(text.split())
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def to_jsonl(records):
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+
+def run_batch(input_text):
+    # 逐行生成批处理结果，返回 (输出 JSONL, 错误 JSONL, 完成数, 失败数)
+    outputs, errors = [], []
+    for line in input_text.splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        record = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request.get("custom_id")}
+        if request.get("url") != "/v1/chat/completions":
+            errors.append({**record, "response": None,
+                           "error": {"code": "invalid_url", "message": f"unsupported url {request.get('url')}"}})
+            continue
+        outputs.append({**record, "error": None, "response": {
+            "status_code": 200, "request_id": uuid.uuid4().hex, "body": mock_completion(request.get("body", {}))}})
+    return to_jsonl(outputs), to_jsonl(errors), len(outputs), len(errors)
+
+
+def create_app(latency_ms=0.0, jitter_ms=0.0, batch_delay_s=0.0):
+    from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+    from fastapi.responses import Response, StreamingResponse
+
+    app = FastAPI(title="LLMEvalWeb mock judge")
+    files = {}
+    batches = {}
+
+    def file_object(file_id):
+        stored = files[file_id]
+        return {"id": file_id, "object": "file", "bytes": len(stored["content"]),
+                "created_at": stored["created_at"], "filename": stored["filename"],
+                "purpose": stored["purpose"], "status": "processed"}
+
+    def store_file(content, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex}"
+        files[file_id] = {"content": content, "filename": filename, "purpose": purpose,
+                          "created_at": int(time.time())}
+        return file_id
+
+    def advance(batch):
+        # 到期的批处理在查询时一次性完成
+        if batch["status"] in ("validating", "in_progress") and time.time() - batch["created_at"] >= batch_delay_s:
+            output, error, completed, failed = run_batch(
+                files[batch["input_file_id"]]["content"].decode("utf-8"))
+            batch["output_file_id"] = store_file(output.encode("utf-8"), "output.jsonl", "batch_output")
+            if failed:
+                batch["error_file_id"] = store_file(error.encode("utf-8"), "errors.jsonl", "batch_output")
+            batch["request_counts"] = {"total": completed + failed, "completed": completed, "failed": failed}
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+        elif batch["status"] == "validating":
+            batch["status"] = "in_progress"
+        return batch
+
+    async def simulate_latency():
+        delay = latency_ms + random.uniform(0, jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+
+    @app.post("/v1/files")
+    async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        return file_object(store_file(await file.read(), file.filename, purpose))
+
+    @app.get("/v1/files/{file_id}")
+    async def retrieve_file(file_id: str):
+        if file_id not in files:
+            raise HTTPException(status_code=404, detail="file not found")
+        return file_object(file_id)
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        if file_id not in files:
+            raise HTTPException(status_code=404, detail="file not found")
+        return Response(files[file_id]["content"], media_type="application/jsonl")
+
+    @app.post("/v1/batches")
+    async def create_batch(body: dict):
+        if body.get("input_file_id") not in files:
+            raise HTTPException(status_code=400, detail="input file not found")
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"),
+            "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window", "24h"),
+            "status": "validating", "created_at": int(time.time()), "metadata": body.get("metadata"),
+            "output_file_id": None, "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        return batches[batch_id]
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        if batch_id not in batches:
+            raise HTTPException(status_code=404, detail="batch not found")
+        return advance(batches[batch_id])
+
+    @app.post("/v1/batches/{batch_id}/cancel")
+    async def cancel_batch(batch_id: str):
+        if batch_id not in batches:
+            raise HTTPException(status_code=404, detail="batch not found")
+        if batches[batch_id]["status"] not in ("completed", "failed", "expired"):
+            batches[batch_id]["status"] = "cancelled"
+        return batches[batch_id]
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        await simulate_latency()
+        response = mock_completion(body)
+        text = response["choices"][0]["message"]["content"]
+        if not body.get("stream"):
+            return response
+
+        def events():
+            for piece in text.splitlines(keepends=True):
+                chunk = {
+                    "id": response["id"],
+                    "object": "chat.completion.chunk",
+                    "created": response["created"],
+                    "model": response["model"],
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的模拟裁判服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个请求的固定延迟")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="在固定延迟上叠加的随机抖动上限")
+    parser.add_argument("--batch-delay-s", type=float, default=0.0, help="批处理创建后多久完成")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    uvicorn.run(create_app(args.latency_ms, args.jitter_ms, args.batch_delay_s),
+                host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
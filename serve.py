@@ -0,0 +1,171 @@
+"""
+本地裁判模型的 OpenAI 兼容 HTTP 服务（/v1/chat/completions）。
+
+多个评估客户端共享同一份已加载的模型：请求进入队列，由批处理调度器按
+最大批大小 / 最长等待时间合并成一批左填充生成，再分发结果。
+
+用法：python serve.py --model JudgeLM-7B --port 8000
+客户端设置 LOCAL_JUDGE_BASE_URL=http://<host>:8000/v1 后即可在 call_model 中像专有模型一样调用。
+"""
+import argparse
+import asyncio
+import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from config import FINETUNED_JUDGE_MODELS
+
+
+class BatchScheduler:
+    """
+    后台线程批处理调度器：取到第一个请求后最多再等待 max_wait_ms 凑批，批大小不超过 max_batch_size。
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=8, max_wait_ms=10):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, max_new_tokens):
+        future = Future()
+        self._queue.put((prompt, max_new_tokens, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        from local_model import generate_batch
+
+        while True:
+            batch = self._collect()
+            prompts = [prompt for prompt, _, _ in batch]
+            limits = [max_new_tokens for _, max_new_tokens, _ in batch]
+            try:
+                # 带对话模板时模板文本已包含起始符，不再重复添加
+                results = generate_batch(
+                    self.model, self.tokenizer, prompts, limits,
+                    add_special_tokens=self.tokenizer.chat_template is None)
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+
+
+def build_prompt(tokenizer, messages):
+    # 有对话模板时按模板渲染；JudgeLM 等无模板模型直接拼接消息内容（客户端通常只发送一条完整提示）
+    if tokenizer.chat_template is not None:
+        return tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True)
+    return "\n".join(msg["content"] for msg in messages)
+
+
+def completion_response(served_model_name, text, prompt_tokens, completion_tokens, max_new_tokens):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": served_model_name,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "length" if completion_tokens >= max_new_tokens else "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def stream_events(response):
+    # 批处理生成不逐 token 产出，流式请求以单个内容块加结束标记返回，兼容 OpenAI 客户端的 SSE 解析
+    choice = response["choices"][0]
+    chunk = {
+        "id": response["id"],
+        "object": "chat.completion.chunk",
+        "created": response["created"],
+        "model": response["model"],
+        "choices": [{
+            "index": 0,
+            "delta": {"role": "assistant", "content": choice["message"]["content"]},
+            "finish_reason": choice["finish_reason"],
+        }],
+    }
+    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def create_app(model, tokenizer, served_model_name, max_batch_size=8, max_wait_ms=10, default_max_tokens=2048):
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import StreamingResponse
+
+    scheduler = BatchScheduler(model, tokenizer, max_batch_size, max_wait_ms)
+    app = FastAPI(title="LLMEvalWeb local judge")
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [
+            {"id": served_model_name, "object": "model", "owned_by": "local"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        if body.get("model") not in (None, served_model_name):
+            raise HTTPException(
+                status_code=404, detail=f"model {body.get('model')} is not served here")
+        messages = body.get("messages")
+        if not messages:
+            raise HTTPException(status_code=400, detail="messages is required")
+        max_new_tokens = int(body.get("max_tokens") or default_max_tokens)
+        prompt = build_prompt(tokenizer, messages)
+        text, prompt_tokens, completion_tokens = await asyncio.wrap_future(
+            scheduler.submit(prompt, max_new_tokens))
+        response = completion_response(
+            served_model_name, text, prompt_tokens, completion_tokens, max_new_tokens)
+        if body.get("stream"):
+            return StreamingResponse(stream_events(response), media_type="text/event-stream")
+        return response
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地裁判模型的 OpenAI 兼容服务")
+    parser.add_argument("--model", required=True, choices=list(FINETUNED_JUDGE_MODELS),
+                        help="要加载的微调裁判模型")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    from local_model import get_local_model
+
+    model, tokenizer = get_local_model(
+        FINETUNED_JUDGE_MODELS[args.model], pin=True)
+    app = create_app(model, tokenizer, args.model,
+                     args.max_batch_size, args.max_wait_ms)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from openai import OpenAI
+from config import PROVIDERS
+import mock_server
+from webui import batch_api
+from webui.evaluation import api_messages, extract_scores
+
+JUDGE = "Qwen-Plus"
+
+
+@pytest.fixture
+def mock_batches(tmp_path, monkeypatch):
+    # 批处理客户端直接连到进程内的 mock_server，不经过网络
+    client = OpenAI(api_key="EMPTY", base_url="http://testserver/v1",
+                    http_client=TestClient(mock_server.create_app()))
+    monkeypatch.setattr(batch_api, "batch_client", lambda modelname: ("mock", PROVIDERS["mock"], client))
+    data = tmp_path / "in.csv"
+    pd.DataFrame({"instruction": ["q1", "q2", "q1", "q3"], "answer1": ["a", "b", "a", None],
+                  "answer2": ["c", "d", "c", "e"]}).to_csv(data, index=False)
+    return data
+
+
+def submit(data, tmp_path):
+    message, manifest = batch_api.submit_batch_job(str(data), "直接评估", JUDGE, job_dir=str(tmp_path / "jobs"),
+                                                   max_requests=1)
+    assert manifest is not None, message
+    return manifest
+
+
+def test_collect_merges_results_in_input_order(mock_batches, tmp_path):
+    manifest = submit(mock_batches, tmp_path)
+    message, path = batch_api.collect_batch_job(manifest, output_path=str(tmp_path / "out.csv"), poll_interval=0)
+    assert path is not None, message
+    report = pd.read_csv(path)
+    # 重复行共用同一结果，数据缺失的行不提交
+    expected = [tuple(extract_scores(mock_server.mock_reply(api_messages(q, a, b, "直接评估", JUDGE)), "直接评估"))
+                for q, a, b in [("q1", "a", "c"), ("q2", "b", "d")]]
+    assert list(zip(report['score1'], report['score2']))[:3] == [expected[0], expected[1], expected[0]]
+    assert report['verdict'].iloc[3] == "无效行：数据缺失"
+    assert "2 个批处理" in message
+
+
+def test_collect_reports_provider_errors(mock_batches, tmp_path, monkeypatch):
+    build = batch_api.build_batch_requests
+
+    def with_bad_url(unique_df, mode, model_name):
+        requests, errors = build(unique_df, mode, model_name)
+        requests[0]["url"] = "/v1/embeddings"
+        return requests, errors
+
+    with monkeypatch.context() as patch:
+        patch.setattr(batch_api, "build_batch_requests", with_bad_url)
+        manifest = submit(mock_batches, tmp_path)
+    message, path = batch_api.collect_batch_job(manifest, output_path=str(tmp_path / "out.csv"), poll_interval=0)
+    assert path is not None, message
+    report = pd.read_csv(path)
+    assert report['verdict'].iloc[0] == "错误：unsupported url /v1/embeddings"
+    assert report['winner'].iloc[1] != "error"
+
+
+def test_collect_refuses_changed_input(mock_batches, tmp_path):
+    manifest = submit(mock_batches, tmp_path)
+    with open(mock_batches, 'a', encoding='utf-8') as f:
+        f.write("q4,x,y\n")
+    message, path = batch_api.collect_batch_job(manifest, poll_interval=0)
+    assert path is None
+    assert "已被修改" in message
@@ -0,0 +1,34 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import numpy as np
+import pandas as pd
+from webui.evaluation import dedupe_rows, evaluate_batch
+
+
+def test_missing_cells_become_empty():
+    df = pd.DataFrame({"instruction": ["q", np.nan, "q "], "answer1": ["a", "b", "a"], "answer2": [np.nan, "c", None]})
+    unique_df, inverse = dedupe_rows(df)
+    assert list(inverse) == [0, 1, 0]
+    assert list(unique_df['instruction']) == ["q", ""]
+    assert list(unique_df['answer2']) == ["", "c"]
+
+
+def test_batch_marks_missing_cells_invalid(tmp_path, monkeypatch):
+    # 含缺失单元格的行不应发给模型评估，报告中记为无效行
+    from webui import evaluation
+
+    judged = []
+
+    def generate_judgment_detailed(instruction, answer1, answer2, mode, state, proprietary_model=None):
+        judged.append((instruction, answer1, answer2))
+        return "8 3", None, None, None
+
+    monkeypatch.setattr(evaluation, "generate_judgment_detailed", generate_judgment_detailed)
+    data = tmp_path / "in.csv"
+    pd.DataFrame({"instruction": ["q1", "q2"], "answer1": ["a", None], "answer2": ["c", "d"]}).to_csv(data, index=False)
+    message, path = evaluate_batch(str(data), "直接评估", {"proprietary_model_name": "Qwen-Plus"},
+                                   output_path=str(tmp_path / "out.csv"))
+    assert path is not None, message
+    assert judged == [("q1", "a", "c")]
+    assert list(pd.read_csv(path)['winner']) == ["model1", "error"]
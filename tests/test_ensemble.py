@@ -0,0 +1,25 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import pandas as pd
+import pytest
+from webui import ensemble
+
+
+@pytest.mark.parametrize("mode", ["直接评估", "思维链"])
+def test_judge_failing_every_row(tmp_path, monkeypatch, mode):
+    # 某个裁判在所有行都出错时只计为无效票，其余裁判的结论照常聚合
+    def judge_once(instruction, answer1, answer2, mode, judge, state):
+        if judge == "down":
+            raise ValueError("API 请求失败")
+        return "reasoning\n8 3" if judge == "a" else "reasoning\n7 2"
+
+    monkeypatch.setattr(ensemble, "judge_once", judge_once)
+    data = tmp_path / "in.csv"
+    pd.DataFrame({"instruction": ["q1", "q2"], "answer1": ["a", "b"], "answer2": ["c", "d"]}).to_csv(data, index=False)
+    message, path = ensemble.ensemble_evaluation_batch(
+        str(data), mode, {}, ["a", "b", "down"], output_path=str(tmp_path / "out.csv"))
+    assert path is not None, message
+    report = pd.read_csv(path)
+    assert list(report['winner']) == ["model1", "model1"]
+    assert list(report['winner_down']) == ["error", "error"]
@@ -0,0 +1,75 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import numpy as np
+import pandas as pd
+from webui import estimate
+
+
+def write_rows(tmp_path, n):
+    data = tmp_path / "in.csv"
+    pd.DataFrame({"instruction": [f"q{i}" for i in range(n)], "answer1": ["a"] * n,
+                  "answer2": ["b"] * n}).to_csv(data, index=False)
+    return str(data)
+
+
+def fake_judge(monkeypatch, outputs):
+    # 按指令编号返回预设的裁判输出，并记录被评估的行
+    judged = []
+
+    def generate_judgment(instruction, answer1, answer2, mode, state, model_name=None, proprietary_model=None):
+        judged.append(instruction)
+        return outputs(int(instruction[1:])), None, None
+
+    monkeypatch.setattr(estimate, "generate_judgment", generate_judgment)
+    return judged
+
+
+def test_stops_once_interval_excludes_half(tmp_path, monkeypatch):
+    judged = fake_judge(monkeypatch, lambda i: "9 2")
+    message, path = estimate.estimate_batch(write_rows(tmp_path, 200), "直接评估", {}, target_width=0.01,
+                                            seed=0, output_path=str(tmp_path / "out.csv"))
+    assert path is not None, message
+    # 全部判模型 1 胜时，停止于下界首次超过 0.5 的那一行
+    expected = next(k for k in range(1, 200)
+                    if estimate.win_rate_interval({"model1": k}, 0.05)[1] > 0.5)
+    assert len(judged) == expected
+    assert "胜负已定" in message
+    assert list(pd.read_csv(path)['sample_order']) == list(range(1, expected + 1))
+
+
+def test_stops_at_target_width(tmp_path, monkeypatch):
+    # 胜负各半时区间始终包含 0.5，只能因宽度达到目标而停止
+    judged = fake_judge(monkeypatch, lambda i: "9 2" if i % 2 else "2 9")
+    message, path = estimate.estimate_batch(write_rows(tmp_path, 2000), "直接评估", {}, target_width=0.4,
+                                            seed=1, output_path=str(tmp_path / "out.csv"))
+    assert path is not None, message
+    counts = pd.Series([int(q[1:]) % 2 for q in judged]).value_counts()
+    _, low, high = estimate.win_rate_interval({"model1": counts.get(1, 0), "model2": counts.get(0, 0)}, 0.05)
+    assert high - low <= 0.4
+    assert "已不超过目标" in message
+
+
+def test_unparsed_rows_are_not_counted(tmp_path, monkeypatch):
+    judged = fake_judge(monkeypatch, lambda i: "no scores" if i % 2 else "9 2")
+    message, _ = estimate.estimate_batch(write_rows(tmp_path, 40), "直接评估", {}, target_width=0.01,
+                                         seed=2, output_path=str(tmp_path / "out.csv"))
+    valid = sum(1 for q in judged if int(q[1:]) % 2 == 0)
+    assert f"有效 {valid} 行" in message
+    assert valid < len(judged)
+
+
+def test_interval_covers_true_rate_at_any_stopping_time():
+    # 随时有效：即使在每一步都检查并在首次不覆盖时停止，不覆盖真实胜率的比例也不超过 alpha
+    rng = np.random.default_rng(0)
+    alpha, steps, trials = 0.1, 300, 400
+    for rate in (0.2, 0.5, 0.7):
+        misses = 0
+        for _ in range(trials):
+            wins = np.cumsum(rng.random(steps) < rate)
+            for k in range(1, steps + 1):
+                _, low, high = estimate.win_rate_interval({"model1": wins[k - 1], "model2": k - wins[k - 1]}, alpha)
+                if not low <= rate <= high:
+                    misses += 1
+                    break
+        assert misses / trials <= alpha
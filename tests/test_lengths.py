@@ -0,0 +1,52 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import pytest
+from webui import lengths
+
+
+class WordTokenizer:
+    # 按空白切分的最简分词器，一个词即一个 token
+    chat_template = None
+
+    def __call__(self, text):
+        return {"input_ids": text.split()}
+
+    def encode(self, text, add_special_tokens=False):
+        return text.split()
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    def set_budget(value):
+        monkeypatch.setattr(lengths, "prompt_token_budget", lambda model: value)
+    return set_budget
+
+
+def prompt_length(row):
+    return lengths.local_prompt(row, "直接评估", WordTokenizer(), "JudgeLM-7B")[1]
+
+
+def test_truncates_answers_to_budget(budget):
+    row = ("q", " ".join(["a"] * 50), " ".join(["b"] * 10))
+    limit = prompt_length(row) - 20
+    budget(limit)
+    [(fitted, length, note)] = lengths.fit_rows([row], "直接评估", None, WordTokenizer(), "JudgeLM-7B",
+                                                policy="head")
+    assert fitted is not None and note
+    assert length <= limit
+    assert len(fitted[2].split()) == 10
+
+
+def test_row_still_over_budget_is_skipped(budget):
+    # 指令本身就超出上限时，削减答案无法满足，应跳过而不是交给模型
+    row = (" ".join(["q"] * 200), "a b c", "d e f")
+    budget(prompt_length(("q", "a", "d")) + 10)
+    [(fitted, length, note)] = lengths.fit_rows([row], "直接评估", None, WordTokenizer(), "JudgeLM-7B",
+                                                policy="middle")
+    assert fitted is None
+    assert length == prompt_length(row)
+    assert "已跳过" in note
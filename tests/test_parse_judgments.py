@@ -0,0 +1,26 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import pandas as pd
+import pytest
+from webui.evaluation import parse_judgments, PARSE_FAILED_VERDICT
+
+
+@pytest.mark.parametrize("mode", ["直接评估", "思维链"])
+def test_no_row_parses(mode):
+    # 整批都解析失败（如所有请求出错）时返回错误行，而不是抛出异常
+    parsed = parse_judgments(pd.Series([None, "no scores here", ""]), mode)
+    assert list(parsed['winner']) == ["error"] * 3
+    assert list(parsed['verdict']) == [PARSE_FAILED_VERDICT] * 3
+    assert parsed['score1'].isna().all() and parsed['score2'].isna().all()
+
+
+def test_cot_takes_last_score_line():
+    parsed = parse_judgments(pd.Series(["7 8\nreasoning\n9 3", None]), "思维链")
+    assert list(parsed['winner']) == ["model1", "error"]
+    assert parsed['score1'].iloc[0] == 9.0
+
+
+def test_direct_takes_first_score_line():
+    parsed = parse_judgments(pd.Series(["7 8\nreasoning\n9 3"]), "直接评估")
+    assert list(parsed['winner']) == ["model2"]
@@ -0,0 +1,61 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import pandas as pd
+import call_model
+from webui import pointwise
+
+JUDGE = "Qwen-Plus"
+
+
+def fingerprint():
+    return pointwise.judge_fingerprint(proprietary_model=JUDGE)
+
+
+def test_fingerprint_tracks_provider_model_and_budget(monkeypatch):
+    modelname = pointwise.PROPRIETARY_MODELS[JUDGE]
+    base = fingerprint()
+    assert fingerprint() == base
+    monkeypatch.setattr(call_model, "PROVIDER_OVERRIDE", "mock")
+    assert fingerprint() != base
+    monkeypatch.undo()
+
+    monkeypatch.setitem(pointwise.PROPRIETARY_MODELS, JUDGE, modelname + "-latest")
+    assert fingerprint() != base
+    monkeypatch.undo()
+
+    monkeypatch.setitem(call_model.JUDGE_GENERATION, modelname, {"max_tokens": 7})
+    assert fingerprint() != base
+    monkeypatch.undo()
+    assert fingerprint() == base
+
+
+def test_cache_hits_until_budget_changes(tmp_path, monkeypatch):
+    scored = []
+
+    def score_answer(instruction, answer, mode, state=None, model_name=None, proprietary_model=None):
+        scored.append(answer)
+        return float(len(answer)), str(len(answer))
+
+    monkeypatch.setattr(pointwise, "score_answer", score_answer)
+    data = tmp_path / "in.csv"
+    pd.DataFrame({"instruction": ["q", "q"], "answer1": ["long answer", "x"],
+                  "answer2": ["x", "long answer"]}).to_csv(data, index=False)
+    cache_path = str(tmp_path / "scores.sqlite3")
+
+    def run():
+        message, path = pointwise.pointwise_evaluation_batch(
+            str(data), "直接评估", {"proprietary_model_name": JUDGE},
+            output_path=str(tmp_path / "out.csv"), cache_path=cache_path)
+        assert path is not None, message
+        return message, list(pd.read_csv(path)['winner'])
+
+    # 两对共两个唯一答案，各评分一次
+    message, winners = run()
+    assert sorted(scored) == ["long answer", "x"] and winners == ["model1", "model2"]
+    message, _ = run()
+    assert len(scored) == 2 and "缓存命中 2" in message
+    # 生成预算改变后旧分数不再命中
+    monkeypatch.setitem(call_model.JUDGE_GENERATION, pointwise.PROPRIETARY_MODELS[JUDGE], {"max_tokens": 7})
+    message, _ = run()
+    assert len(scored) == 4 and "缓存命中 0" in message
@@ -0,0 +1,70 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import numpy as np
+import pandas as pd
+from webui.recompute import recompute_verdicts, recompute_report, NEEDS_PROPRIETARY_VERDICT
+
+BETTER1, BETTER2 = "大模型 1 更好", "大模型 2 更好"
+
+
+def calibration_report():
+    # 第 3 行请求出错，没有分数
+    return pd.DataFrame({
+        '评估结果': [BETTER1, BETTER2, "错误：超时"],
+        'score1': [8.0, 6.0, np.nan],
+        'score2': [7.0, 7.0, np.nan],
+        'surface1': [2.0, 0.0, np.nan],
+        'surface2': [0.0, 2.0, np.nan],
+        'calibration_weight': [0.0] * 3,
+    })
+
+
+def test_calibration_weight_rederives_verdicts():
+    report, needs = recompute_verdicts(calibration_report(), calibration_weight=1.0)
+    # 8 - 2 < 7 - 0；6 - 0 > 7 - 2
+    assert list(report['评估结果']) == [BETTER2, BETTER1, "错误：超时"]
+    assert needs == 0
+    assert (report['calibration_weight'] == 1.0).all()
+
+
+def test_weight_defaults_to_report_value():
+    report, _ = recompute_verdicts(calibration_report())
+    assert list(report['评估结果']) == [BETTER1, BETTER2, "错误：超时"]
+
+
+def cascade_report():
+    # 第 1 行本地置信（未升级），第 2 行已升级到专有模型，第 3 行数据缺失未评估
+    return pd.DataFrame({
+        '评估结果': [BETTER1, BETTER2, "无效行：数据缺失"],
+        'score1': [np.nan, 5.0, np.nan],
+        'score2': [np.nan, 9.0, np.nan],
+        'local_score1': [9.0, 8.0, np.nan],
+        'local_score2': [3.0, 3.0, np.nan],
+        'confidence': [0.7, 0.4, np.nan],
+        'escalated': [0.0, 1.0, np.nan],
+        'threshold': [0.5] * 3,
+    })
+
+
+def test_raising_threshold_marks_rows_needing_proprietary():
+    report, needs = recompute_verdicts(cascade_report(), threshold=0.8)
+    assert list(report['评估结果']) == [NEEDS_PROPRIETARY_VERDICT, BETTER2, "无效行：数据缺失"]
+    assert needs == 1
+
+
+def test_lowering_threshold_uses_local_verdict():
+    report, needs = recompute_verdicts(cascade_report(), threshold=0.3)
+    assert list(report['评估结果']) == [BETTER1, BETTER1, "无效行：数据缺失"]
+    assert needs == 0
+    assert (report['threshold'] == 0.3).all()
+
+
+def test_recompute_report_ignores_inapplicable_parameters(tmp_path):
+    path = tmp_path / "report.csv"
+    calibration_report().to_csv(path, index=False)
+    message, output = recompute_report(str(path), calibration_weight=1.0, threshold=0.9,
+                                       output_path=str(tmp_path / "out.csv"))
+    assert output is not None, message
+    assert "已忽略置信度阈值" in message and "2 行结论改变" in message
+    assert list(pd.read_csv(output)['评估结果']) == [BETTER2, BETTER1, "错误：超时"]
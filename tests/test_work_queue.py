@@ -0,0 +1,46 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import pytest
+from webui.distributed import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"))
+    queue.add_job("job", "in.csv", "直接评估", "JudgeLM-7B", str(tmp_path), ["s0.csv", "s1.csv"])
+    return queue
+
+
+def test_claim_filters_by_judge_and_takes_each_shard_once(queue):
+    assert queue.claim("w1", "Qwen-Plus") is None
+    assert queue.claim("w1", "JudgeLM-7B") == ("job", 0, "s0.csv", "直接评估")
+    assert queue.claim("w2", "JudgeLM-7B") == ("job", 1, "s1.csv", "直接评估")
+    assert queue.claim("w3", "JudgeLM-7B") is None
+    assert [status for _, status, _, _ in queue.shards("job")] == ["running", "running"]
+
+
+def test_stale_shard_is_requeued_and_old_owner_rejected(queue):
+    queue.claim("w1", "JudgeLM-7B")
+    assert queue.heartbeat("job", 0, "w1")
+    # 超时为负数时所有 running 分片都视为心跳超时
+    assert queue.requeue_stale(timeout=-1) == 1
+    assert queue.claim("w2", "JudgeLM-7B")[:2] == ("job", 0)
+    # 原领取者的心跳与结果都不再被接受，新领取者的结果生效
+    assert not queue.heartbeat("job", 0, "w1")
+    assert not queue.finish("job", 0, "w1", report="old.csv")
+    assert queue.finish("job", 0, "w2", report="new.csv")
+    assert queue.shards("job")[0] == (0, "done", "new.csv", None)
+
+
+def test_failures_requeue_until_attempts_run_out(queue):
+    for _ in range(2):
+        assert queue.claim("w1", "JudgeLM-7B")[:2] == ("job", 0)
+        assert queue.finish("job", 0, "w1", error="错误", max_attempts=2)
+    assert queue.shards("job")[0][1:] == ("failed", None, "错误")
+
+
+def test_stale_shard_fails_after_max_attempts(queue):
+    queue.claim("w1", "JudgeLM-7B")
+    assert queue.requeue_stale(timeout=-1, max_attempts=1) == 0
+    assert queue.shards("job")[0][1] == "failed"
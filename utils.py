@@ -1,15 +1,17 @@
 import gradio as gr
-import os
 import sys
+import threading
+from contextlib import contextmanager
 from config import FINETUNED_JUDGE_MODELS, PROPRIETARY_MODELS
-from webui.evaluation import evaluate, evaluate_batch, calibrated_evaluation, calibrated_evaluation_batch, evaluate_batch_with_api, calculate_confidence
-import pandas as pd
-import json
-from modelscope import AutoModelForCausalLM, AutoTokenizer
+from webui.evaluation import (
+    evaluate_stream, evaluate_batch, calibrated_evaluation, calibrated_evaluation_batch,
+    cascade_evaluation_batch, calculate_confidence, scores_come_first, judge_scores_only,
+    stream_explanation, partial_verdict, release_scores_context
+)
+from webui.estimate import estimate_batch
+from webui.pointwise import pointwise_evaluation_batch
+from webui.ensemble import ensemble_evaluation_batch
 import gc
-import torch
-import uuid
-import tempfile
 
 
 def enable_evaluate_button(load_status):
@@ -85,8 +87,7 @@ def load_model_based_on_type(model_type, finetuned_model_name, proprietary_model
                     return f"错误：专有模型路径必须是字符串，收到 {type(model_path)}", gr.update(interactive=True)
                 state["proprietary_model_name"] = proprietary_model_name
                 state["finetuned_model_name"] = None
-                state["model"] = None
-                state["tokenizer"] = None
+                release_session_models(state)
                 state["model_type"] = model_type
                 print(
                     f"Initialized proprietary model {proprietary_model_name} with path {model_path}")
@@ -138,72 +139,90 @@ def update_calibration_mode(model_type):
 
 
 def manual_evaluate(instruction, answer1, answer2, mode, state, calibration_mode):
+    # 生成器：流式输出评估结果，分数行出现后立即填入结论。
+    # 详情以结构化记录产出（存入界面状态），点击“显示详情”时才渲染为 HTML
     if not isinstance(state, dict):
-        return f"错误：state 不是字典，收到 {type(state)}", "", gr.update(visible=False)
-    finetuned_model_name = state.get("finetuned_model_name")
-    model_type = state.get("model_type")
-    proprietary_model_name = state.get("proprietary_model_name")
-    eval_mode = state.get("eval_mode")
-    if eval_mode == "级联评估":
-        llm = state.get("model")
-        tokenizer = state.get("tokenizer")
-        if llm is None or tokenizer is None:
-            return "请先加载微调模型", "", gr.update(visible=False)
-        verdict, details, logprobs, _, _ = evaluate(
-            instruction, answer1, answer2, mode, state, finetuned_model_name)
-        confidence = calculate_confidence(logprobs)
-        threshold = state.get("confidence_threshold", 0.5)
-        if confidence < threshold:
-            if proprietary_model_name:
-                if calibration_mode:
-                    proprietary_verdict, proprietary_details = calibrated_evaluation(
-                        instruction, answer1, answer2, mode, model_name=proprietary_model_name)
-                else:
-                    proprietary_verdict, proprietary_details, _, _, _ = evaluate(
-                        instruction, answer1, answer2, mode, state=state, proprietary_model=proprietary_model_name)
-                details = (
-                    "<div class='details-section'>"
-                    "<h3>级联评估详情</h3>"
-                    f"<p>置信度低于阈值 ({confidence:.4f} < {threshold:.4f})，已调用专有模型重新评估。</p>"
-                    f"{details}"
-                    "<h3>‍🧑‍⚖️ 专有模型评估结果</h3>"
-                    f"{proprietary_details}"
-                    "</div>"
-                )
-                verdict = proprietary_verdict
+        yield f"错误：state 不是字典，收到 {type(state)}", None, gr.update(visible=False)
+        return
+    with session_busy(state):
+        finetuned_model_name = state.get("finetuned_model_name")
+        model_type = state.get("model_type")
+        proprietary_model_name = state.get("proprietary_model_name")
+        eval_mode = state.get("eval_mode")
+        if eval_mode == "级联评估":
+            llm = state.get("model")
+            tokenizer = state.get("tokenizer")
+            if llm is None or tokenizer is None:
+                yield "请先加载微调模型", None, gr.update(visible=False)
+                return
+            threshold = state.get("confidence_threshold", 0.5)
+            if scores_come_first(mode, finetuned_model_name):
+                # 先只生成分数行计算置信度；需要升级到专有模型时跳过本地解释，否则再流式续写解释
+                try:
+                    score_text, logprobs, context = judge_scores_only(
+                        instruction, answer1, answer2, mode, state, finetuned_model_name)
+                except Exception as e:
+                    yield f"评估失败: {str(e)}", None, gr.update(visible=False)
+                    return
+                confidence = calculate_confidence(logprobs)
+                del logprobs
+                verdict = partial_verdict(score_text, mode, finished=True)
+                local = {"prompt": context["full_prompt"], "result": score_text}
+                try:
+                    yield verdict, local, gr.update(visible=True)
+                    if confidence >= threshold:
+                        for result in stream_explanation(state, context):
+                            local = {"prompt": context["full_prompt"], "result": result}
+                            yield verdict, local, gr.update(visible=True)
+                finally:
+                    release_scores_context(state, context)
+                del context
             else:
-                details = (
-                    "<div class='details-section'>"
-                    f"{details}"
-                    f"<p>置信度低于阈值 ({confidence:.4f} < {threshold:.4f})，但未加载专有模型。</p>"
-                    "</div>"
-                )
+                for verdict, local, logprobs in evaluate_stream(
+                        instruction, answer1, answer2, mode, state, finetuned_model_name):
+                    yield verdict, local, gr.update(visible=True)
+                confidence = calculate_confidence(logprobs)
+                # 逐步的整词表 logprobs 只用于计算置信度，调用专有模型前释放
+                del logprobs
+            cascade = {"local": local, "confidence": confidence, "threshold": threshold,
+                       "escalated": confidence < threshold, "proprietary_model": proprietary_model_name,
+                       "proprietary": None}
+            if confidence < threshold:
+                if proprietary_model_name:
+                    if calibration_mode:
+                        proprietary_stream = [calibrated_evaluation(
+                            instruction, answer1, answer2, mode, model_name=proprietary_model_name)]
+                    else:
+                        proprietary_stream = (
+                            (proprietary_verdict, proprietary_details)
+                            for proprietary_verdict, proprietary_details, _ in evaluate_stream(
+                                instruction, answer1, answer2, mode, state=state, proprietary_model=proprietary_model_name))
+                    for proprietary_verdict, proprietary_details in proprietary_stream:
+                        yield proprietary_verdict, {**cascade, "proprietary": proprietary_details}, gr.update(visible=True)
+                    return
+            yield verdict, cascade, gr.update(visible=True)
         else:
-            details = (
-                "<div class='details-section'>"
-                f"{details}"
-                f"<p>置信度: {confidence:.4f} (高于阈值 {threshold:.4f})</p>"
-                "</div>"
-            )
-        return verdict, details, gr.update(visible=True)
-    else:
-        if model_type == "专有模型":
-            if not proprietary_model_name:
-                return "请先加载模型", "", gr.update(visible=False)
-            if calibration_mode:
-                verdict, details = calibrated_evaluation(
-                    instruction, answer1, answer2, mode, model_name=proprietary_model_name)
-                return verdict, details, gr.update(visible=True)
-            verdict, details, _, _, _ = evaluate(
-                instruction, answer1, answer2, mode, state=state, proprietary_model=proprietary_model_name)
-            return verdict, details, gr.update(visible=True)
-        llm = state.get("model")
-        tokenizer = state.get("tokenizer")
-        if llm is None or tokenizer is None:
-            return "请先加载模型", "", gr.update(visible=False)
-        verdict, details, _, _, _ = evaluate(
-            instruction, answer1, answer2, mode, state=state, model_name=finetuned_model_name)
-        return verdict, details, gr.update(visible=True)
+            if model_type == "专有模型":
+                if not proprietary_model_name:
+                    yield "请先加载模型", None, gr.update(visible=False)
+                    return
+                if calibration_mode:
+                    verdict, details = calibrated_evaluation(
+                        instruction, answer1, answer2, mode, model_name=proprietary_model_name)
+                    yield verdict, details, gr.update(visible=True)
+                    return
+                for verdict, details, _ in evaluate_stream(
+                        instruction, answer1, answer2, mode, state=state, proprietary_model=proprietary_model_name):
+                    yield verdict, details, gr.update(visible=True)
+                return
+            llm = state.get("model")
+            tokenizer = state.get("tokenizer")
+            if llm is None or tokenizer is None:
+                yield "请先加载模型", None, gr.update(visible=False)
+                return
+            for verdict, details, _ in evaluate_stream(
+                    instruction, answer1, answer2, mode, state=state, model_name=finetuned_model_name):
+                yield verdict, details, gr.update(visible=True)
 
 
 def update_batch_calibration_mode(model_type):
@@ -212,95 +231,56 @@ def update_batch_calibration_mode(model_type):
     return gr.update(visible=False, value=False)
 
 
-def batch_evaluation(file, mode, state, calibration_mode):
+def batch_evaluation(file, mode, state, calibration_mode, explanations=False, estimate=False, target_width=0.1,
+                     pointwise=False, ensemble_judges=None, aggregation="majority"):
     if not isinstance(state, dict):
         return f"错误：state 不是字典，收到 {type(state)}", None
-    eval_mode = state.get("eval_mode")
-    if eval_mode == "级联评估":
-        llm = state.get("model")
-        tokenizer = state.get("tokenizer")
-        threshold = state.get("confidence_threshold", 0.5)
-        if llm is None or tokenizer is None:
-            return "请先加载微调裁判模型", None
-        proprietary_model_name = state.get("proprietary_model_name")
-        if not proprietary_model_name:
-            return "请先加载专有模型", None
-        try:
-            df = pd.read_csv(file.name) if file.name.endswith(
-                '.csv') else pd.DataFrame(json.load(open(file.name)))
-        except Exception as e:
-            return f"文件读取失败：{str(e)}", None
-        results = []
-        temp_dir = tempfile.gettempdir()
-        output_filename = f"eval_report_{uuid.uuid4().hex[:8]}.csv"
-        output_path = os.path.join(temp_dir, output_filename)
-        for _, row in df.iterrows():
-            instruction = row.get('instruction', '')
-            answer1 = row.get('answer1', '')
-            answer2 = row.get('answer2', '')
-            if not all([instruction, answer1, answer2]):
-                results.append("数据不完整")
-                continue
-            verdict, details, logprobs = evaluate(
-                instruction, answer1, answer2,
-                mode, state, state.get("finetuned_model_name")
-            )
-            confidence = calculate_confidence(logprobs)
-            if confidence < threshold:
+    with session_busy(state):
+        eval_mode = state.get("eval_mode")
+        if ensemble_judges and len(ensemble_judges) >= 2:
+            # 集成评估：所选裁判并发评估每一对，聚合结论；只选一个裁判时按普通评估处理
+            if calibration_mode or estimate or pointwise:
+                return "集成评估不能与校准、估计模式或逐答案评分同时使用", None
+            return ensemble_evaluation_batch(file, mode, state, list(ensemble_judges), aggregation)
+        if pointwise:
+            # 逐答案评分：每个答案单独评分并缓存，成对结论由两侧分数得出
+            if eval_mode == "级联评估" or calibration_mode or estimate:
+                return "逐答案评分仅支持单模型评估（不含校准、估计模式）", None
+            if state.get("model_type") == "专有模型":
+                if not state.get("proprietary_model_name"):
+                    return "请先加载专有模型", None
+                return pointwise_evaluation_batch(file, mode, {**state, "finetuned_model_name": None})
+            if state.get("model") is None or state.get("tokenizer") is None:
+                return "请先加载模型", None
+            return pointwise_evaluation_batch(file, mode, {**state, "proprietary_model_name": None})
+        if estimate:
+            # 估计模式：随机抽样逐行评估，置信区间足够窄或胜负已定即停止
+            if eval_mode == "级联评估" or calibration_mode:
+                return "估计模式仅支持单模型评估（不含校准）", None
+            if state.get("model_type") == "专有模型":
+                if not state.get("proprietary_model_name"):
+                    return "请先加载专有模型", None
+            elif state.get("model") is None or state.get("tokenizer") is None:
+                return "请先加载模型", None
+            return estimate_batch(file, mode, state, target_width=target_width)
+        if eval_mode == "级联评估":
+            return cascade_evaluation_batch(file, mode, state, calibration_mode, explanations=explanations)
+        else:
+            model_type = state.get("model_type")
+            if model_type == "专有模型":
+                model_name = state.get("proprietary_model_name")
+                if not model_name:
+                    return "请先加载专有模型", None
                 if calibration_mode:
-                    proprietary_verdict, proprietary_details = calibrated_evaluation(
-                        instruction, answer1, answer2,
-                        mode, model_name=proprietary_model_name
-                    )
-                else:
-                    proprietary_verdict, proprietary_details, _ = evaluate(
-                        instruction, answer1, answer2,
-                        mode, state=state,
-                        proprietary_model=proprietary_model_name
-                    )
-                verdict = proprietary_verdict
-                details = (
-                    "<div class='details-section'>"
-                    f"{details}"
-                    f"<p>置信度低于阈值 ({confidence:.4f} < {threshold:.4f})，已使用专有模型重新评估</p>"
-                    f"{proprietary_details}"
-                    "</div>"
-                )
-            else:
-                details = (
-                    "<div class='details-section'>"
-                    f"{details}"
-                    f"<p>置信度: {confidence:.4f} (高于阈值 {threshold:.4f})</p>"
-                    "</div>"
-                )
-            results.append(verdict)
-        output_df = pd.DataFrame({
-            '指令': df.get('instruction', []),
-            '答案 1': df.get('answer1', []),
-            '答案 2': df.get('answer2', []),
-            '评估结果': results
-        })
-        try:
-            output_df.to_csv(output_path, index=False, encoding='utf-8')
-            return f"评估完成，点击下方下载报告", output_path
-        except Exception as e:
-            return f"保存结果失败：{str(e)}", None
-    else:
-        model_type = state.get("model_type")
-        if model_type == "专有模型":
-            model_name = state.get("proprietary_model_name")
-            if not model_name:
-                return "请先加载专有模型", None
+                    return calibrated_evaluation_batch(file, mode, model_name=model_name)
+                return evaluate_batch(file, mode, state)
+            llm = state.get("model")
+            tokenizer = state.get("tokenizer")
+            if llm is None or tokenizer is None:
+                return "请先加载模型", None
             if calibration_mode:
-                return calibrated_evaluation_batch(file, mode, model_name=model_name)
-            return evaluate_batch(file, mode, state)
-        llm = state.get("model")
-        tokenizer = state.get("tokenizer")
-        if llm is None or tokenizer is None:
-            return "请先加载模型", None
-        if calibration_mode:
-            return "校准模式只能用于专有模型", None
-        return evaluate_batch(file, mode, state)
+                return "校准模式只能用于专有模型", None
+            return evaluate_batch(file, mode, state, num_workers=state.get("num_workers"))
 
 
 def update_eval_mode(mode, state):
@@ -331,16 +311,27 @@ def update_eval_mode(mode, state):
 
 
 def load_model(model_path, state):
+    # 按需导入 torch / modelscope，只使用专有模型时不加载
+    from local_model import get_local_model, get_draft_model, draft_model_path
+
     try:
-        tokenizer = AutoTokenizer.from_pretrained(
-            model_path, trust_remote_code=True)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-        ).to(device)
+        model, tokenizer = get_local_model(model_path)
+        # 先取得新模型的引用再释放会话原有的引用，重复加载同一模型时不会被移出缓存
+        release_session_models(state)
         state["model"] = model
+        state["model_path"] = model_path
         state["tokenizer"] = tokenizer
+        try:
+            state["draft_model"] = get_draft_model(state.get("finetuned_model_name"))
+            if state["draft_model"] is not None:
+                state["draft_model_path"] = draft_model_path(state.get("finetuned_model_name"))
+        except Exception as e:
+            # 草稿模型只影响解码速度，加载失败时退回普通解码
+            print(f"Draft model loading failed: {e}")
+            state["draft_model"] = None
+            return "模型加载成功！（草稿模型加载失败，使用普通解码）", gr.update(interactive=True)
+        if state["draft_model"] is not None:
+            return "模型加载成功！（已启用辅助解码）", gr.update(interactive=True)
         return "模型加载成功！", gr.update(interactive=True)
     except RuntimeError as re:
         print(f"RuntimeError during model loading: {re}")
@@ -363,6 +354,102 @@ def load_model(model_path, state):
         gc.collect()
 
 
+def release_session_models(state):
+    """
+    释放会话对缓存中本地模型（裁判模型与草稿模型）的引用，返回是否释放了模型。
+    """
+    if not isinstance(state, dict):
+        return False
+    paths = [state.get("model_path"), state.get("draft_model_path")]
+    for key in ("model", "tokenizer", "model_path", "draft_model", "draft_model_path"):
+        state[key] = None
+    if not any(paths):
+        return False
+    from local_model import release_local_model
+
+    for path in paths:
+        if path:
+            release_local_model(path)
+    gc.collect()
+    # 从未加载过本地模型时 torch 不在 sys.modules 中，无需为清理显存而导入
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    return True
+
+
+def touch_session(state):
+    # gr.State 只有作为事件输出时才重新开始计时；在操作前后原样返回会话状态，让存活时间从最近一次操作算起
+    return state
+
+
+# 保护会话的 busy 计数与 expired 标记，过期回调与评估可能在不同线程中运行
+_session_lock = threading.Lock()
+
+
+@contextmanager
+def session_busy(state):
+    """
+    评估期间标记会话忙碌：期间会话过期不会释放模型，而是在最后一个评估结束时再释放。
+    """
+    with _session_lock:
+        state["busy"] = state.get("busy", 0) + 1
+    try:
+        yield
+    finally:
+        with _session_lock:
+            state["busy"] -= 1
+            expired = not state["busy"] and state.pop("expired", False)
+        if expired:
+            expire_session(state)
+
+
+def expire_session(state):
+    # gr.State 过期（会话闲置超过 SESSION_TTL_SECONDS 或页面关闭后被回收）时的回调；
+    # 会话仍有评估在运行（如长时间的批量评估）时只做标记，由 session_busy 在评估结束后释放
+    if isinstance(state, dict):
+        with _session_lock:
+            if state.get("busy"):
+                state["expired"] = True
+                return
+    if release_session_models(state):
+        print(f"Session expired, released model {state.get('finetuned_model_name')}")
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
+        size /= 1024
+
+
+def memory_report(state):
+    """
+    当前会话与进程的内存占用（Markdown），未加载过本地模型时不导入 torch。
+    """
+    local_model = sys.modules.get("local_model")
+    session_bytes = 0
+    if local_model is not None and isinstance(state, dict):
+        for model in (state.get("model"), state.get("draft_model")):
+            if model is not None:
+                session_bytes += local_model.model_bytes(model)
+    lines = [f"- 本会话引用的模型：{format_bytes(session_bytes)}"]
+    if local_model is not None:
+        for path, device, size, refs, pinned in local_model.cache_usage():
+            lines.append(f"- 已缓存 `{path}`（{device}）：{format_bytes(size)}，"
+                         f"{refs} 个会话引用{'，常驻' if pinned else ''}")
+    try:
+        import psutil
+
+        lines.append(f"- 进程常驻内存：{format_bytes(psutil.Process().memory_info().rss)}")
+    except ImportError:
+        pass
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        lines.append(f"- 显存占用：{format_bytes(torch.cuda.memory_allocated())}")
+    return "\n".join(lines)
+
+
 def clear_model(state):
     model_names = []
     if state.get("finetuned_model_name"):
@@ -370,17 +457,7 @@ def clear_model(state):
     if state.get("proprietary_model_name"):
         model_names.append(state.get("proprietary_model_name"))
 
-    if state.get("model"):
-        del state["model"]
-        state["model"] = None
-    if state.get("tokenizer"):
-        del state["tokenizer"]
-        state["tokenizer"] = None
-
-    if model_names:
-        torch.cuda.empty_cache()
-        gc.collect()
-
+    release_session_models(state)
     state["finetuned_model_name"] = None
     state["proprietary_model_name"] = None
 
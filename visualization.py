@@ -1,14 +1,17 @@
 import os
-import pandas as pd
 import gradio as gr
 import re
 from datetime import datetime
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 
-# 使用指定字体
-plt.rcParams['axes.unicode_minus'] = False
+def _plotting():
+    # 绘图库仅在结果可视化时导入，避免拖慢网页启动
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # 使用指定字体
+    plt.rcParams['axes.unicode_minus'] = False
+    return plt, sns
 
 # 报告存储目录，与 evaluation.py 保持一致
 REPORT_DIR = os.path.abspath(os.path.join(
@@ -45,6 +48,51 @@ def update_report_list():
         return gr.update(choices=[], visible=False, value=f"无法加载报告列表：{str(e)}")
 
 
+# 排行榜聚合器缓存：新增报告时只增量累加，不重复读取已聚合的报告
+_leaderboard = None
+_leaderboard_reports = []
+
+
+def update_leaderboard_report_list():
+    """
+    刷新排行榜可选的报告列表（多选）。
+    """
+    report_files = sorted(
+        (f for f in os.listdir(REPORT_DIR)
+         if f.startswith("eval_report_") and f.endswith(".csv")),
+        reverse=True
+    )
+    return gr.update(choices=report_files, value=[])
+
+
+def generate_leaderboard(report_names):
+    """
+    聚合所选报告中的全部两两对局，返回 Elo / Bradley–Terry 排行榜及置信区间。
+    """
+    global _leaderboard, _leaderboard_reports
+    if not report_names:
+        return "请先选择评估报告", None
+    try:
+        from leaderboard import Leaderboard
+
+        if _leaderboard is None or not set(_leaderboard_reports) <= set(report_names):
+            _leaderboard = Leaderboard()
+            _leaderboard_reports = []
+        new_reports = [
+            name for name in report_names if name not in _leaderboard_reports]
+        _leaderboard.add_reports(
+            [os.path.join(REPORT_DIR, name) for name in new_reports])
+        _leaderboard_reports.extend(new_reports)
+        board = _leaderboard.compute()
+        if board.empty:
+            return "所选报告中没有包含 model1 / model2 列的有效对局", None
+        board = board.round({'elo': 1, 'elo_lower': 1, 'elo_upper': 1,
+                             'bt_strength': 3, 'win_rate': 3})
+        return f"共 {len(board)} 个模型，{int(board['games'].sum() // 2)} 场对局", board
+    except Exception as e:
+        return f"生成排行榜时出错: {str(e)}", None
+
+
 def analyze_results(report_path):
     if not report_path:
         return "请先选择评估报告", None
@@ -55,6 +103,8 @@ def analyze_results(report_path):
         full_path = os.path.join(REPORT_DIR, report_filename)
         print("Full path:", full_path)  # 打印完整路径以检查
 
+        import pandas as pd
+
         df = pd.read_csv(full_path)
         print("df:", df)  # 打印数据以检查
 
@@ -114,6 +164,8 @@ def generate_stats_summary(df):
 
 
 def generate_comparison_plot(df):
+    plt, sns = _plotting()
+
     # 设置 Seaborn 样式
     sns.set(style="whitegrid", palette="pastel")
 
@@ -3,17 +3,29 @@ import os
 import sys
 import gradio as gr
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
-from config import FINETUNED_JUDGE_MODELS, PROPRIETARY_MODELS
+from config import (
+    FINETUNED_JUDGE_MODELS, PROPRIETARY_MODELS, LOCAL_BATCH_WORKERS, PRELOAD_JUDGE_MODEL, SESSION_TTL_SECONDS,
+    CALIBRATION_WEIGHT
+)
 from utils import (
-    update_batch_calibration_mode, clear_model,
+    update_batch_calibration_mode, clear_model, expire_session, touch_session, memory_report,
     update_calibration_mode, update_model_choices, load_model_based_on_type,
     manual_evaluate, enable_evaluate_button, batch_evaluation, update_model_type, update_eval_mode
 )
 from helpers import (
     show_batch_calibration_mode, show_calibration_mode
 )
+from webui.ensemble import LOCAL_JUDGE as ENSEMBLE_LOCAL_JUDGE
+from webui.recompute import recompute_report
+from webui.details import render_details
 from webui.theme import Seafoam, css
-from visualization import analyze_results, update_report_list
+from visualization import (
+    analyze_results, update_report_list, generate_leaderboard, update_leaderboard_report_list
+)
+
+# 配置了预加载模型时默认选中它，点击加载即可直接使用常驻模型
+DEFAULT_FINETUNED_MODEL = PRELOAD_JUDGE_MODEL if PRELOAD_JUDGE_MODEL in FINETUNED_JUDGE_MODELS else list(
+    FINETUNED_JUDGE_MODELS.keys())[0]
 
 # 在 gr.Tabs 外部定义可视化组件
 stats_html = gr.HTML(visible=True)
@@ -32,9 +44,10 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
         "model_type": "微调裁判模型",
         "eval_mode": "单模型评估",
         "confidence_threshold": 0.5,
-        "finetuned_model_name": list(FINETUNED_JUDGE_MODELS.keys())[0],
+        "num_workers": LOCAL_BATCH_WORKERS,
+        "finetuned_model_name": DEFAULT_FINETUNED_MODEL,
         "proprietary_model_name": list(PROPRIETARY_MODELS.keys())[0]
-    })
+    }, time_to_live=SESSION_TTL_SECONDS or None, delete_callback=expire_session)
 
     with gr.Row():
         with gr.Column(scale=1):
@@ -57,7 +70,7 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
                 model_selector = gr.Dropdown(
                     label="选择微调裁判模型",
                     choices=list(FINETUNED_JUDGE_MODELS.keys()),
-                    value=list(FINETUNED_JUDGE_MODELS.keys())[0],
+                    value=DEFAULT_FINETUNED_MODEL,
                     interactive=True,
                     elem_classes=["dropdown"]
                 )
@@ -89,6 +102,10 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
                     interactive=False,
                     elem_classes=["textbox"]
                 )
+                with gr.Accordion("内存占用", open=False):
+                    memory_output = gr.Markdown()
+                    memory_refresh_btn = gr.Button(
+                        "刷新", variant="secondary", elem_classes=["secondary-button"])
 
     with gr.Tabs() as tabs:
         with gr.TabItem("📝 手动评估"):
@@ -160,22 +177,28 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
                     close_button = gr.Button("", elem_classes=["close-button"])
                     details_output = gr.HTML(label="评估详情", elem_classes=[
                                              "modal-content", "pretty-scroll"])
+                # 评估核心返回的结构化详情，点击“显示详情”时才渲染为 HTML
+                details_state = gr.State(None)
 
             def show_details(verdict, details):
-                return verdict, details, gr.update(visible=True), gr.update(visible=True)
+                return verdict, render_details(details), gr.update(visible=True), gr.update(visible=True)
 
             def hide_details():
                 return gr.update(visible=False), gr.update(visible=False)
 
             evaluate_btn.click(
+                fn=touch_session, inputs=[state], outputs=[state]
+            ).then(
                 fn=manual_evaluate,
                 inputs=[instruction_input, answer1_input, answer2_input,
                         evaluation_mode_selector, state, calibration_mode],
-                outputs=[result_output, details_output]
+                outputs=[result_output, details_state, details_button]
+            ).then(
+                fn=touch_session, inputs=[state], outputs=[state]
             )
             details_button.click(
-                fn=lambda verdict, details: show_details(verdict, details),
-                inputs=[result_output, details_output],
+                fn=show_details,
+                inputs=[result_output, details_state],
                 outputs=[result_output, details_output,
                          modal_overlay, details_panel]
             )
@@ -195,15 +218,67 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
                 )
                 batch_calibration_mode = gr.Checkbox(
                     label="启用校准", value=False, visible=False)
+                batch_explanations = gr.Checkbox(
+                    label="级联评估报告包含本地模型解释（较慢）", value=False)
+                with gr.Row():
+                    batch_ensemble_judges = gr.Dropdown(
+                        choices=[ENSEMBLE_LOCAL_JUDGE] + list(PROPRIETARY_MODELS.keys()),
+                        multiselect=True,
+                        label="集成评估裁判（选择两个及以上时启用，本地裁判使用已加载的微调模型）"
+                    )
+                    batch_aggregation = gr.Radio(
+                        choices=[("多数投票", "majority"), ("平均分", "mean")],
+                        value="majority",
+                        label="集成聚合方式"
+                    )
+                batch_pointwise = gr.Checkbox(
+                    label="逐答案评分：每个答案单独评分并缓存，适合多模型循环比较", value=False)
+                with gr.Row():
+                    batch_estimate = gr.Checkbox(
+                        label="估计模式：随机抽样评估，胜率置信区间足够窄或胜负已定即停止", value=False)
+                    batch_target_width = gr.Slider(
+                        label="目标置信区间宽度",
+                        value=0.1,
+                        minimum=0.02,
+                        maximum=0.5,
+                        step=0.01,
+                        interactive=True
+                    )
+                batch_workers_input = gr.Slider(
+                    label="本地模型并行进程数（仅 CPU）",
+                    value=LOCAL_BATCH_WORKERS,
+                    minimum=1,
+                    maximum=os.cpu_count() or 1,
+                    step=1,
+                    interactive=True
+                )
             batch_evaluate_btn = gr.Button("开始批量评估", interactive=False)
             batch_result_output = gr.Textbox(label="批量评估结果", interactive=False)
             report_download = gr.File(
                 label="评估报告下载", visible=False, interactive=False)
+            with gr.Accordion("离线重算（校准 / 级联评估报告）", open=False):
+                recompute_file = gr.File(label="上传评估报告 (CSV)")
+                with gr.Row():
+                    recompute_weight = gr.Number(
+                        label="校准权重", value=CALIBRATION_WEIGHT)
+                    recompute_threshold = gr.Slider(
+                        label="置信度阈值",
+                        value=0.5,
+                        minimum=0,
+                        maximum=1,
+                        step=0.01,
+                        interactive=True
+                    )
+                recompute_btn = gr.Button("重新计算结论")
+                recompute_output = gr.Textbox(label="重算结果", interactive=False)
+                recompute_download = gr.File(
+                    label="重算报告下载", visible=False, interactive=False)
             gr.Markdown(
                 """
                 #### 📋 支持的文件格式
                 - CSV 文件: 包含 instruction, answer1, answer2 列
                 - JSON 文件: 包含相应字段的数组
+                - 可选 model1, model2 列：被评估模型名称，写入报告后可用于排行榜
                 """
             )
 
@@ -228,10 +303,16 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
             )
 
             batch_evaluate_btn.click(
+                fn=touch_session, inputs=[state], outputs=[state]
+            ).then(
                 fn=batch_evaluation,
                 inputs=[file_input, batch_mode_selector,
-                        state, batch_calibration_mode],
+                        state, batch_calibration_mode, batch_explanations,
+                        batch_estimate, batch_target_width, batch_pointwise,
+                        batch_ensemble_judges, batch_aggregation],
                 outputs=[batch_result_output, report_download]
+            ).then(
+                fn=touch_session, inputs=[state], outputs=[state]
             ).then(
                 fn=lambda: gr.update(visible=True),
                 outputs=report_download
@@ -240,6 +321,14 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
                 inputs=report_download,
                 outputs=[stats_html, comp_plot]
             )
+            recompute_btn.click(
+                fn=recompute_report,
+                inputs=[recompute_file, recompute_weight, recompute_threshold],
+                outputs=[recompute_output, recompute_download]
+            ).then(
+                fn=lambda: gr.update(visible=True),
+                outputs=recompute_download
+            )
             model_load_output.change(
                 enable_evaluate_button, inputs=model_load_output, outputs=batch_evaluate_btn)
         with gr.TabItem("📈 结果可视化", id="visualization_tab"):
@@ -260,10 +349,33 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
                     comp_plot = gr.Plot(
                         label="模型对比分析", visible=True, elem_id="comp_plot")
 
+            with gr.Row():
+                with gr.Column(scale=1):
+                    leaderboard_selector = gr.Dropdown(
+                        label="选择用于排行榜的评估报告（多选）",
+                        multiselect=True,
+                        interactive=True
+                    )
+                    leaderboard_btn = gr.Button("🏆 生成排行榜", size="sm")
+                    leaderboard_status = gr.Textbox(
+                        label="排行榜状态", interactive=False)
+                with gr.Column(scale=2):
+                    leaderboard_table = gr.Dataframe(
+                        label="模型排行榜（Elo / Bradley–Terry，95% 置信区间）", interactive=False)
+
             # 刷新报告列表
             refresh_btn.click(
                 fn=update_report_list,
                 outputs=report_selector
+            ).then(
+                fn=update_leaderboard_report_list,
+                outputs=leaderboard_selector
+            )
+
+            leaderboard_btn.click(
+                fn=generate_leaderboard,
+                inputs=leaderboard_selector,
+                outputs=[leaderboard_status, leaderboard_table]
             )
 
             # 选择报告后分析结果
@@ -307,12 +419,36 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
         inputs=[model_type_selector, model_selector,
                 proprietary_model_selector, eval_mode_selector, state],
         outputs=[model_load_output, load_model_btn]
+    ).then(
+        fn=touch_session, inputs=[state], outputs=[state]
+    ).then(
+        fn=memory_report,
+        inputs=[state],
+        outputs=[memory_output]
     )
 
     unload_model_btn.click(
         fn=clear_model,
         inputs=[state],
         outputs=[model_load_output]
+    ).then(
+        fn=touch_session, inputs=[state], outputs=[state]
+    ).then(
+        fn=memory_report,
+        inputs=[state],
+        outputs=[memory_output]
+    )
+
+    memory_refresh_btn.click(
+        fn=memory_report,
+        inputs=[state],
+        outputs=[memory_output]
+    )
+
+    batch_workers_input.change(
+        fn=lambda workers, s: {**s, "num_workers": int(workers)},
+        inputs=[batch_workers_input, state],
+        outputs=state
     )
 
     threshold_input.change(
@@ -322,4 +458,8 @@ with gr.Blocks(theme=Seafoam(), css=css) as demo:
     )
 
 if __name__ == "__main__":
+    if PRELOAD_JUDGE_MODEL:
+        from local_model import start_preload
+
+        start_preload()
     demo.launch()
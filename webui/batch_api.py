@@ -0,0 +1,245 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import hashlib
+import json
+import time
+import pandas as pd
+from config import PROPRIETARY_MODELS, BATCH_MAX_REQUESTS, BATCH_POLL_INTERVAL, BATCH_JOB_DIR
+from call_model import batch_client, batch_request_body, completion_details, record_usage
+from webui.evaluation import (
+    REPORT_DIR, USAGE_COLUMNS, load_batch_file, api_messages, build_report, add_model_columns,
+    add_usage_columns, dedupe_rows, fan_out, dedup_summary
+)
+
+
+# 批处理的终止状态；expired / cancelled 的批处理仍可能带有部分结果
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def file_digest(path):
+    # 输入文件内容的 sha256，收取结果时据此确认输入文件在提交后未被修改
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_batch_requests(unique_df, mode, model_name):
+    """
+    把去重后的每一行转成 OpenAI 批处理格式的请求，custom_id 为 "row-<行号>"。
+    返回 (requests, errors)，errors 与行对应，数据缺失的行不生成请求。
+    """
+    requests = []
+    errors = []
+    for i, (_, row) in enumerate(unique_df.iterrows()):
+        instruction = row.get('instruction', '')
+        answer1 = row.get('answer1', '')
+        answer2 = row.get('answer2', '')
+        if not instruction or not answer1 or not answer2 or any(pd.isna([instruction, answer1, answer2])):
+            errors.append("无效行：数据缺失")
+            continue
+        errors.append(None)
+        requests.append({
+            "custom_id": f"row-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": batch_request_body(
+                api_messages(instruction, answer1, answer2, mode, model_name), PROPRIETARY_MODELS[model_name]),
+        })
+    return requests, errors
+
+
+def submit_batch_job(file, mode, model_name, job_dir=BATCH_JOB_DIR, max_requests=BATCH_MAX_REQUESTS):
+    """
+    打包并提交批处理任务：请求按 max_requests 分成若干 JSONL 文件，逐个上传并创建批处理。
+    任务清单（输入文件、模型、批处理 ID）写入 job_dir，返回 (message, manifest_path)。
+    """
+    if model_name not in PROPRIETARY_MODELS:
+        return f"错误：无效的专有模型 {model_name}", None
+    df, error = load_batch_file(file)
+    if error:
+        return error, None
+    try:
+        _, _, client = batch_client(PROPRIETARY_MODELS[model_name])
+    except ValueError as e:
+        return f"错误：{e}", None
+    unique_df, _ = dedupe_rows(df)
+    requests, _ = build_batch_requests(unique_df, mode, model_name)
+    if not requests:
+        return "没有可提交的有效行", None
+
+    job_id = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
+    os.makedirs(job_dir, exist_ok=True)
+    batch_ids = []
+    try:
+        for part, start in enumerate(range(0, len(requests), max_requests)):
+            input_path = os.path.join(job_dir, f"batch_{job_id}_{part}.jsonl")
+            with open(input_path, 'w', encoding='utf-8') as f:
+                for request in requests[start:start + max_requests]:
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            with open(input_path, 'rb') as f:
+                uploaded = client.files.create(file=f, purpose="batch")
+            batch = client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+                metadata={"job": job_id, "part": str(part)},
+            )
+            batch_ids.append(batch.id)
+            print(f"已提交批处理 {batch.id}（{len(requests[start:start + max_requests])} 个请求）")
+    except Exception as e:
+        if not batch_ids:
+            return f"提交批处理失败：{e}", None
+        # 已提交的部分仍写入清单，便于收取或取消
+        print(f"提交批处理中断：{e}")
+    input_path = os.path.abspath(getattr(file, "name", file))
+    manifest = {
+        "job": job_id,
+        "input": input_path,
+        "input_sha256": file_digest(input_path),
+        "rows": len(df),
+        "mode": mode,
+        "model_name": model_name,
+        "requests": len(requests),
+        "batches": batch_ids,
+    }
+    manifest_path = os.path.join(job_dir, f"batch_{job_id}.json")
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    message = f"已提交 {len(batch_ids)} 个批处理，共 {len(requests)} 个请求（{dedup_summary(len(df), len(unique_df))}）"
+    return message, manifest_path
+
+
+def wait_for_batches(client, batch_ids, poll_interval=BATCH_POLL_INTERVAL, timeout=None):
+    # 轮询直到所有批处理进入终止状态，返回 {batch_id: batch}；超时时抛出 TimeoutError
+    start = time.monotonic()
+    batches = {}
+    while True:
+        for batch_id in batch_ids:
+            if batch_id not in batches or batches[batch_id].status not in BATCH_FINAL_STATUSES:
+                batches[batch_id] = client.batches.retrieve(batch_id)
+        pending = [b for b in batches.values() if b.status not in BATCH_FINAL_STATUSES]
+        done = sum(b.request_counts.completed + b.request_counts.failed
+                   for b in batches.values() if b.request_counts)
+        total = sum(b.request_counts.total for b in batches.values() if b.request_counts)
+        print(f"批处理进度：{len(batch_ids) - len(pending)}/{len(batch_ids)} 个完成，请求 {done}/{total}")
+        if not pending:
+            return batches
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"等待批处理超时：{', '.join(b.id for b in pending)}")
+        time.sleep(poll_interval)
+
+
+def read_batch_output(client, file_id):
+    # 逐行读取批处理输出或错误文件，返回 {custom_id: 记录}
+    if not file_id:
+        return {}
+    records = {}
+    for line in client.files.content(file_id).text.splitlines():
+        if line.strip():
+            record = json.loads(line)
+            records[record["custom_id"]] = record
+    return records
+
+
+def record_result(record):
+    """
+    解析单条批处理结果，返回 (raw_result, error, usage, completion_usage)：usage 为报告中的用量列，
+    completion_usage 为接口返回的 usage 对象，用于累计费用。请求失败时只有 error 不为 None。
+    """
+    from openai.types.chat import ChatCompletion
+
+    response = record.get("response") or {}
+    if record.get("error") or response.get("status_code") != 200:
+        error = record.get("error") or (response.get("body") or {}).get("error") or {}
+        return None, f"错误：{error.get('message') or error or '批处理请求失败'}", None, None
+    completion = ChatCompletion.model_validate(response["body"])
+    details = completion_details(completion)
+    return details["content"], None, {key: details.get(key) for key in USAGE_COLUMNS}, completion.usage
+
+
+def collect_batch_job(manifest_path, output_path=None, poll_interval=BATCH_POLL_INTERVAL, timeout=None):
+    """
+    等待任务清单中的批处理完成，下载结果并按原输入文件的行序合并为标准报告。返回 (message, report_path)。
+    结果按行号对应到输入文件，输入文件在提交后被修改时拒绝合并。
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        return f"读取任务清单时出错：{e}", None
+    try:
+        digest = file_digest(manifest["input"])
+    except Exception as e:
+        return f"读取输入文件时出错：{e}", None
+    if "input_sha256" not in manifest:
+        print("任务清单未记录输入文件校验值，无法确认输入文件未被修改")
+    elif digest != manifest["input_sha256"]:
+        return f"错误：输入文件 {manifest['input']} 在提交批处理后已被修改，无法把结果对应到原来的行", None
+    df, error = load_batch_file(manifest["input"])
+    if error:
+        return error, None
+    mode, model_name = manifest["mode"], manifest["model_name"]
+    try:
+        name, provider, client = batch_client(PROPRIETARY_MODELS[model_name])
+    except Exception as e:
+        return f"错误：{e}", None
+    try:
+        batches = wait_for_batches(client, manifest["batches"], poll_interval, timeout)
+    except Exception as e:
+        return f"等待批处理时出错：{e}", None
+
+    records = {}
+    for batch in batches.values():
+        records.update(read_batch_output(client, batch.error_file_id))
+        records.update(read_batch_output(client, batch.output_file_id))
+    statuses = sorted({batch.status for batch in batches.values()})
+
+    unique_df, inverse = dedupe_rows(df)
+    _, errors = build_batch_requests(unique_df, mode, model_name)
+    raw_results = [None] * len(unique_df)
+    usages = [None] * len(unique_df)
+    missing = 0
+    for i in range(len(unique_df)):
+        if errors[i]:
+            continue
+        record = records.get(f"row-{i}")
+        if record is None:
+            missing += 1
+            errors[i] = f"错误：批处理未返回结果（状态 {'/'.join(statuses)}）"
+            continue
+        try:
+            raw_results[i], errors[i], usages[i], usage = record_result(record)
+        except Exception as e:
+            errors[i] = f"错误：无法解析批处理结果：{e}"
+            continue
+        record_usage(name, provider, usage)
+
+    output_df = build_report(df, fan_out(raw_results, inverse), fan_out(errors, inverse), mode)
+    add_model_columns(output_df, df, model_name)
+    add_usage_columns(output_df, fan_out(usages, inverse))
+    if output_path is None:
+        output_filename = f"eval_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        output_path = os.path.join(REPORT_DIR, output_filename)
+    message = (f"批处理评估完成（{len(batches)} 个批处理，状态 {'/'.join(statuses)}；"
+               f"{dedup_summary(len(df), len(unique_df))}），点击下方下载报告")
+    if missing:
+        message += f"\n{missing} 个请求没有返回结果"
+    try:
+        output_df.to_csv(output_path, index=False, encoding='utf-8')
+        return message, output_path
+    except Exception as e:
+        return f"保存文件时出错：{str(e)}", None
+
+
+def batch_api_evaluation(file, mode, model_name, output_path=None, poll_interval=BATCH_POLL_INTERVAL, timeout=None):
+    """
+    离线批处理模式：提交、轮询并合并结果，与 evaluate_batch_with_api 得到相同格式的报告。返回 (message, report_path)。
+    """
+    message, manifest_path = submit_batch_job(file, mode, model_name)
+    print(message)
+    if manifest_path is None:
+        return message, None
+    return collect_batch_job(manifest_path, output_path, poll_interval, timeout)
@@ -0,0 +1,80 @@
+def escape_html(text):
+    return text.replace('>', '&gt;').replace('<', '&lt;').replace('\n', '<br>')
+
+
+def render_judgment(judgment):
+    # judgment 为 {"prompt", "result"}
+    return (
+        "<div class='details-section'>"
+        "<h3>👨 用户</h3>"
+        "<pre>%s</pre>"
+        "<h3>⚖️ 裁判模型</h3>"
+        "<pre>%s</pre>"
+        "</div>"
+    ) % (escape_html(judgment["prompt"]), judgment["result"].replace('\n', '<br>'))
+
+
+def render_calibration(components):
+    # components 为 calibrated_evaluation 返回的中间结果
+    return """
+        <div class="details-section">
+            <h3>‍👨🏽‍💻 用户</h3>
+            <pre>{prompt}</pre>
+            <h3>‍🧑‍⚖️ 裁判模型（原评估结果）</h3>
+            <pre>{result}</pre>
+            <h3>🔧 校准详情</h3>
+            <ul class="calibration-details">
+                <li><b>原分数：</b>{score1:.2f} {score2:.2f}</li>
+                <li><b>表面质量得分：</b>{surf1:.2f} {surf2:.2f}</li>
+                <li><b>最终得分：</b>{final1:.2f} {final2:.2f}</li>
+            </ul>
+            <p>评估结果：{verdict}</p>
+        </div>
+        """.format(
+        prompt=escape_html(components["prompt"]),
+        result=components["raw"].replace('\n', '<br>'),
+        score1=components["score1"],
+        score2=components["score2"],
+        surf1=components["surface1"],
+        surf2=components["surface2"],
+        final1=components["adjusted1"],
+        final2=components["adjusted2"],
+        verdict=components["verdict"]
+    )
+
+
+def render_cascade(cascade):
+    """
+    cascade 为 {"local", "confidence", "threshold", "escalated", "proprietary_model", "proprietary"}，
+    proprietary 为专有模型的详情（未升级或出错时为 None）。
+    """
+    confidence, threshold = cascade["confidence"], cascade["threshold"]
+    local = render_details(cascade["local"])
+    if cascade["escalated"] and cascade["proprietary_model"]:
+        return (
+            "<div class='details-section'>"
+            "<h3>级联评估详情</h3>"
+            f"<p>置信度低于阈值 ({confidence:.4f} < {threshold:.4f})，已调用专有模型重新评估。</p>"
+            f"{local}"
+            "<h3>‍🧑‍⚖️ 专有模型评估结果</h3>"
+            f"{render_details(cascade['proprietary'])}"
+            "</div>"
+        )
+    if cascade["escalated"]:
+        note = f"<p>置信度低于阈值 ({confidence:.4f} < {threshold:.4f})，但未加载专有模型。</p>"
+    else:
+        note = f"<p>置信度: {confidence:.4f} (高于阈值 {threshold:.4f})</p>"
+    return f"<div class='details-section'>{local}{note}</div>"
+
+
+def render_details(record):
+    """
+    把评估核心返回的结构化详情渲染为 HTML，仅在界面展示详情时调用。
+    """
+    if not record:
+        return ""
+    if "confidence" in record:
+        return render_cascade(record)
+    if "surface1" in record:
+        return render_calibration(record)
+    return render_judgment(record)
@@ -0,0 +1,268 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import pandas as pd
+from config import (
+    DISTRIBUTED_QUEUE_PATH, DISTRIBUTED_JOB_DIR, DISTRIBUTED_SHARD_SIZE, DISTRIBUTED_HEARTBEAT_INTERVAL,
+    DISTRIBUTED_HEARTBEAT_TIMEOUT, DISTRIBUTED_MAX_ATTEMPTS
+)
+from webui.evaluation import REPORT_DIR, load_batch_file, evaluate_batch
+
+
+class WorkQueue:
+    """
+    SQLite 工作队列：jobs 表记录任务（输入、推理策略、裁判模型），shards 表记录每个分片的状态
+    pending / running / done / failed、领取者与心跳。每次操作使用独立连接，可跨线程、跨进程（节点）共享。
+    """
+
+    def __init__(self, path=DISTRIBUTED_QUEUE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, input TEXT, mode TEXT, judge TEXT, job_dir TEXT, shards INTEGER, created REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS shards ("
+                "job_id TEXT, shard INTEGER, input TEXT, status TEXT, worker TEXT, heartbeat REAL, "
+                "attempts INTEGER, report TEXT, error TEXT, PRIMARY KEY (job_id, shard))")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # isolation_level=None 时由下面的 BEGIN IMMEDIATE 显式加写锁，领取分片不会被两个进程同时拿到
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def add_job(self, job_id, input_path, mode, judge, job_dir, shard_inputs):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (job_id, input_path, mode, judge, job_dir, len(shard_inputs), time.time()))
+            conn.executemany(
+                "INSERT INTO shards VALUES (?, ?, ?, 'pending', NULL, NULL, 0, NULL, NULL)",
+                [(job_id, shard, path) for shard, path in enumerate(shard_inputs)])
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def job(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT input, mode, judge, job_dir, shards FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return dict(zip(("input", "mode", "judge", "job_dir", "shards"), row))
+
+    def requeue_stale(self, timeout=DISTRIBUTED_HEARTBEAT_TIMEOUT, max_attempts=DISTRIBUTED_MAX_ATTEMPTS):
+        """
+        心跳超时的 running 分片重新排队；已达到尝试次数上限的记为 failed。返回重新排队的分片数。
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            deadline = time.time() - timeout
+            conn.execute(
+                "UPDATE shards SET status = 'failed', error = '工作进程多次失联，已放弃' "
+                "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?", (deadline, max_attempts))
+            requeued = conn.execute(
+                "UPDATE shards SET status = 'pending', worker = NULL "
+                "WHERE status = 'running' AND heartbeat < ?", (deadline,)).rowcount
+            conn.execute("COMMIT")
+            return requeued
+        finally:
+            conn.close()
+
+    def claim(self, worker, judge):
+        """
+        领取一个待评估分片（只领取裁判模型与自己相同的任务），返回 (job_id, shard, input, mode)；没有时返回 None。
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT s.job_id, s.shard, s.input, j.mode FROM shards s JOIN jobs j ON s.job_id = j.job_id "
+                "WHERE s.status = 'pending' AND j.judge = ? ORDER BY j.created, s.shard LIMIT 1",
+                (judge,)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE shards SET status = 'running', worker = ?, heartbeat = ?, attempts = attempts + 1 "
+                    "WHERE job_id = ? AND shard = ?", (worker, time.time(), row[0], row[1]))
+            conn.execute("COMMIT")
+            return row
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id, shard, worker):
+        # 返回该分片是否仍归本工作进程所有（心跳超时后可能已被重新排队并由其他进程领取）
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "UPDATE shards SET heartbeat = ? WHERE job_id = ? AND shard = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, shard, worker)).rowcount > 0
+        finally:
+            conn.close()
+
+    def finish(self, job_id, shard, worker, report=None, error=None, max_attempts=DISTRIBUTED_MAX_ATTEMPTS):
+        """
+        提交分片结果。出错时未达到尝试次数上限的分片重新排队，否则记为 failed；已不归本进程所有的分片不做修改。
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if report is not None:
+                updated = conn.execute(
+                    "UPDATE shards SET status = 'done', report = ?, error = NULL "
+                    "WHERE job_id = ? AND shard = ? AND worker = ? AND status = 'running'",
+                    (report, job_id, shard, worker)).rowcount
+            else:
+                updated = conn.execute(
+                    "UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                    "worker = NULL, error = ? "
+                    "WHERE job_id = ? AND shard = ? AND worker = ? AND status = 'running'",
+                    (max_attempts, error, job_id, shard, worker)).rowcount
+            conn.execute("COMMIT")
+            return updated > 0
+        finally:
+            conn.close()
+
+    def shards(self, job_id):
+        # 按分片顺序返回 [(shard, status, report, error), ...]
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT shard, status, report, error FROM shards WHERE job_id = ? ORDER BY shard",
+                (job_id,)).fetchall()
+        finally:
+            conn.close()
+
+
+def submit_job(file, mode, judge, queue_path=DISTRIBUTED_QUEUE_PATH, job_dir=DISTRIBUTED_JOB_DIR,
+               shard_size=DISTRIBUTED_SHARD_SIZE):
+    """
+    协调进程：把输入按 shard_size 行切成分片文件写入任务目录，并登记到工作队列。返回 (message, job_id)。
+    judge 为裁判模型名称，只有加载了同名裁判的工作进程会领取这些分片。
+    """
+    df, error = load_batch_file(file)
+    if error:
+        return error, None
+    if df.empty:
+        return "输入文件没有数据", None
+    job_id = f"{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    job_dir = os.path.join(os.path.abspath(job_dir), job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    shard_inputs = []
+    for shard, start in enumerate(range(0, len(df), shard_size)):
+        path = os.path.join(job_dir, f"shard_{shard:05d}_input.csv")
+        df.iloc[start:start + shard_size].to_csv(path, index=False, encoding='utf-8')
+        shard_inputs.append(path)
+    WorkQueue(queue_path).add_job(
+        job_id, os.path.abspath(getattr(file, "name", file)), mode, judge, job_dir, shard_inputs)
+    return f"已提交任务 {job_id}：{len(df)} 行，{len(shard_inputs)} 个分片", job_id
+
+
+def merge_job(job_id, queue_path=DISTRIBUTED_QUEUE_PATH, output_path=None, poll_interval=5.0,
+              heartbeat_timeout=DISTRIBUTED_HEARTBEAT_TIMEOUT, timeout=None):
+    """
+    协调进程：等待任务的所有分片完成或失败（期间把心跳超时的分片重新排队），
+    再按分片顺序拼接各分片报告，得到与单进程评估相同行序的报告。返回 (message, report_path)。
+    """
+    queue = WorkQueue(queue_path)
+    job = queue.job(job_id)
+    if job is None:
+        return f"任务不存在：{job_id}", None
+    start = time.monotonic()
+    while True:
+        requeued = queue.requeue_stale(heartbeat_timeout)
+        if requeued:
+            print(f"{requeued} 个分片的工作进程失联，已重新排队")
+        shards = queue.shards(job_id)
+        counts = {}
+        for _, status, _, _ in shards:
+            counts[status] = counts.get(status, 0) + 1
+        print(f"任务 {job_id} 进度：完成 {counts.get('done', 0)} / 评估中 {counts.get('running', 0)} / "
+              f"等待 {counts.get('pending', 0)} / 失败 {counts.get('failed', 0)}（共 {len(shards)} 个分片）")
+        if not counts.get('pending') and not counts.get('running'):
+            break
+        if timeout is not None and time.monotonic() - start > timeout:
+            return f"等待任务 {job_id} 超时", None
+        time.sleep(poll_interval)
+
+    reports = []
+    failed = []
+    for shard, status, report, error in shards:
+        if status == 'done':
+            reports.append(pd.read_csv(report))
+        else:
+            failed.append(f"分片 {shard}：{error}")
+    if not reports:
+        return "所有分片均评估失败：\n" + "\n".join(failed), None
+    output_df = pd.concat(reports, ignore_index=True)
+    if output_path is None:
+        output_filename = f"eval_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        output_path = os.path.join(REPORT_DIR, output_filename)
+    message = f"分布式评估完成：{len(shards)} 个分片，合并 {len(output_df)} 行，点击下方下载报告"
+    if failed:
+        message += f"\n{len(failed)} 个分片失败，报告中缺少这些行：\n" + "\n".join(failed)
+    try:
+        output_df.to_csv(output_path, index=False, encoding='utf-8')
+        return message, output_path
+    except Exception as e:
+        return f"保存文件时出错：{str(e)}", None
+
+
+def _heartbeat_loop(queue, job_id, shard, worker, stop, interval):
+    while not stop.wait(interval):
+        if not queue.heartbeat(job_id, shard, worker):
+            print(f"分片 {job_id}/{shard} 已被重新排队，本进程的结果将被丢弃")
+            return
+
+
+def run_worker(state, judge, queue_path=DISTRIBUTED_QUEUE_PATH, worker_id=None, poll_interval=5.0,
+               heartbeat_interval=DISTRIBUTED_HEARTBEAT_INTERVAL, heartbeat_timeout=DISTRIBUTED_HEARTBEAT_TIMEOUT,
+               exit_when_idle=False):
+    """
+    工作进程：循环领取裁判模型为 judge 的分片，用 state 中已加载的模型调用 evaluate_batch 评估，
+    分片报告写在输入分片旁边。评估期间后台线程定期更新心跳。
+    exit_when_idle 为真时队列中没有可领取的分片即退出。返回评估完成的分片数。
+    """
+    queue = WorkQueue(queue_path)
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    completed = 0
+    while True:
+        # 领取前顺带回收失联的分片，协调进程不在线时也能恢复
+        queue.requeue_stale(heartbeat_timeout)
+        claimed = queue.claim(worker_id, judge)
+        if claimed is None:
+            if exit_when_idle:
+                return completed
+            time.sleep(poll_interval)
+            continue
+        job_id, shard, input_path, mode = claimed
+        print(f"[{worker_id}] 领取分片 {job_id}/{shard}")
+        stop = threading.Event()
+        beat = threading.Thread(target=_heartbeat_loop, daemon=True,
+                                args=(queue, job_id, shard, worker_id, stop, heartbeat_interval))
+        beat.start()
+        # 每次尝试写入独立的报告文件，失联后仍在运行的旧进程不会覆盖新领取者的结果
+        report_path = input_path.replace("_input.csv", f"_report_{uuid.uuid4().hex[:8]}.csv")
+        try:
+            message, report = evaluate_batch(
+                input_path, mode, state, num_workers=state.get("num_workers"), output_path=report_path)
+        except Exception as e:
+            message, report = f"错误：{str(e)}", None
+        finally:
+            stop.set()
+            beat.join()
+        if queue.finish(job_id, shard, worker_id, report=report, error=None if report else message):
+            completed += report is not None
+            print(f"[{worker_id}] 分片 {job_id}/{shard}：{message}")
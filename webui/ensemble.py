@@ -0,0 +1,167 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from config import ENSEMBLE_MAX_WORKERS
+from webui.evaluation import (
+    REPORT_DIR, PARSE_FAILED_VERDICT, load_batch_file, generate_judgment, parse_judgments,
+    add_model_columns, dedupe_rows, fan_out, dedup_summary
+)
+
+
+# 集成中代表会话已加载的本地微调裁判模型的名称
+LOCAL_JUDGE = "本地微调裁判模型"
+AGGREGATIONS = ("majority", "mean")
+OUTCOMES = ("model1", "draw", "model2")
+VERDICTS = {"model1": "大模型 1 更好", "model2": "大模型 2 更好", "draw": "两个大模型表现相当！"}
+
+# 本地模型一次只跑一个 generate，多个线程的本地请求在此排队；专有模型的并发由 call_model 按提供方限制
+_local_lock = threading.Lock()
+
+
+def judge_once(instruction, answer1, answer2, mode, judge, state):
+    # 单个裁判的原始输出，出错时抛出 ValueError
+    if judge == LOCAL_JUDGE:
+        with _local_lock:
+            result, _, _ = generate_judgment(
+                instruction, answer1, answer2, mode, state, model_name=state.get("finetuned_model_name"))
+        return result
+    result, _, _ = generate_judgment(
+        instruction, answer1, answer2, mode, state, proprietary_model=judge)
+    return result
+
+
+def aggregate(scores1, scores2, winners, aggregation):
+    """
+    按行聚合多个裁判的结论，输入为 (行数, 裁判数) 的数组，未解析的裁判为 NaN / "error"。
+    majority 取多数结论（并列或没有有效结论时记为平局 / 错误），mean 比较平均分。返回 (score1, score2, winner)。
+    """
+    with warnings.catch_warnings():
+        # 某行所有裁判都未解析时 nanmean 给出 NaN 并告警，这里按错误行处理
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean1 = np.nanmean(scores1, axis=1)
+        mean2 = np.nanmean(scores2, axis=1)
+    valid = ~np.isnan(mean1) & ~np.isnan(mean2)
+    if aggregation == "mean":
+        winner = np.select([~valid, mean1 > mean2, mean2 > mean1],
+                           ["error", "model1", "model2"], default="draw")
+        return mean1, mean2, winner
+    votes = np.stack([(winners == outcome).sum(axis=1) for outcome in OUTCOMES], axis=1)
+    top = votes.max(axis=1)
+    unique_top = (votes == top[:, None]).sum(axis=1) == 1
+    winner = np.where(top == 0, "error",
+                      np.where(unique_top, np.array(OUTCOMES)[votes.argmax(axis=1)], "draw"))
+    return mean1, mean2, winner
+
+
+def fleiss_kappa(winners):
+    """
+    多个裁判在 胜 / 平 / 负 三类上的 Fleiss' kappa，只统计所有裁判都给出有效结论的行；行数不足时返回 None。
+    """
+    complete = winners[(winners != "error").all(axis=1)]
+    if len(complete) < 2 or complete.shape[1] < 2:
+        return None
+    counts = np.stack([(complete == outcome).sum(axis=1) for outcome in OUTCOMES], axis=1).astype(float)
+    raters = complete.shape[1]
+    p_row = ((counts * (counts - 1)).sum(axis=1)) / (raters * (raters - 1))
+    p_class = counts.sum(axis=0) / counts.sum()
+    p_mean, p_expected = p_row.mean(), (p_class ** 2).sum()
+    if p_expected == 1:
+        return 1.0
+    return (p_mean - p_expected) / (1 - p_expected)
+
+
+def pairwise_agreement(winners, judges):
+    # 每两个裁判在双方都有效的行上结论一致的比例
+    agreement = {}
+    for i in range(len(judges)):
+        for j in range(i + 1, len(judges)):
+            both = (winners[:, i] != "error") & (winners[:, j] != "error")
+            if both.any():
+                agreement[(judges[i], judges[j])] = float((winners[both, i] == winners[both, j]).mean())
+    return agreement
+
+
+def ensemble_evaluation_batch(file, mode, state, judges, aggregation="majority", output_path=None,
+                              max_workers=ENSEMBLE_MAX_WORKERS):
+    """
+    集成评估：每一对同时交给多个裁判（PROPRIETARY_MODELS 中的名称，或 LOCAL_JUDGE 表示已加载的本地模型），
+    所有 (行, 裁判) 请求并发执行，按 aggregation 聚合结论并统计裁判间一致性。返回 (message, report_path)。
+    """
+    if aggregation not in AGGREGATIONS:
+        return f"不支持的聚合方式：{aggregation}", None
+    if len(judges) < 2:
+        return "集成评估至少需要两个裁判模型", None
+    if LOCAL_JUDGE in judges and (state.get("model") is None or state.get("tokenizer") is None):
+        return "集成评估包含本地裁判模型，请先加载微调裁判模型", None
+    df, error = load_batch_file(file)
+    if error:
+        return error, None
+    if output_path is None:
+        output_filename = f"eval_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        output_path = os.path.join(REPORT_DIR, output_filename)
+
+    unique_df, inverse = dedupe_rows(df)
+    rows = [(row.get('instruction', ''), row.get('answer1', ''), row.get('answer2', ''))
+            for _, row in unique_df.iterrows()]
+    raw = np.full((len(rows), len(judges)), None, dtype=object)
+    errors = np.full((len(rows), len(judges)), None, dtype=object)
+
+    def run(i, j):
+        try:
+            raw[i, j] = judge_once(*rows[i], mode, judges[j], state)
+        except Exception as e:
+            errors[i, j] = f"错误：{str(e)}"
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run, i, j)
+                   for i, row in enumerate(rows) if all(row)
+                   for j in range(len(judges))]
+        for future in futures:
+            future.result()
+
+    parsed = [parse_judgments(pd.Series(raw[:, j]), mode) for j in range(len(judges))]
+    scores1 = np.stack([p['score1'].to_numpy() for p in parsed], axis=1) if rows else np.empty((0, len(judges)))
+    scores2 = np.stack([p['score2'].to_numpy() for p in parsed], axis=1) if rows else np.empty((0, len(judges)))
+    winners = np.stack([p['winner'].to_numpy() for p in parsed], axis=1) if rows else np.empty((0, len(judges)), dtype=object)
+    score1, score2, winner = aggregate(scores1, scores2, winners, aggregation)
+    valid_votes = (winners != "error").sum(axis=1)
+    agreeing = (winners == winner[:, None]).sum(axis=1)
+    row_agreement = np.where(valid_votes > 0, agreeing / np.maximum(valid_votes, 1), np.nan)
+
+    verdict = np.array([VERDICTS.get(w, PARSE_FAILED_VERDICT) for w in winner], dtype=object)
+    for i, row in enumerate(rows):
+        if not all(row):
+            verdict[i] = "无效行：数据缺失"
+        elif winner[i] == "error":
+            verdict[i] = next((e for e in errors[i] if e), PARSE_FAILED_VERDICT)
+
+    output_df = pd.DataFrame({
+        'instruction': df.get('instruction', pd.Series(dtype=object)).to_numpy(),
+        'answer1': df.get('answer1', pd.Series(dtype=object)).to_numpy(),
+        'answer2': df.get('answer2', pd.Series(dtype=object)).to_numpy(),
+        'score1': fan_out(score1, inverse),
+        'score2': fan_out(score2, inverse),
+        'winner': fan_out(winner, inverse),
+        'verdict': fan_out(verdict, inverse),
+        'agreement': fan_out(row_agreement, inverse),
+    })
+    for j, judge in enumerate(judges):
+        output_df[f'winner_{judge}'] = fan_out(winners[:, j], inverse)
+    add_model_columns(output_df, df, f"ensemble({'+'.join(judges)})")
+
+    kappa = fleiss_kappa(winners)
+    pairs = pairwise_agreement(winners, judges)
+    lines = [f"评估完成（{len(judges)} 个裁判，{aggregation} 聚合；{dedup_summary(len(df), len(unique_df))}），点击下方下载报告",
+             "Fleiss' kappa：" + (f"{kappa:.3f}" if kappa is not None else "有效行不足，无法计算")]
+    lines += [f"{a} 与 {b} 一致率：{rate:.1%}" for (a, b), rate in pairs.items()]
+    message = "\n".join(lines)
+    try:
+        output_df.to_csv(output_path, index=False, encoding='utf-8')
+        return message, output_path
+    except Exception as e:
+        return f"保存文件时出错：{str(e)}", None
@@ -0,0 +1,115 @@
+import os
+import sys
+import math
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import numpy as np
+import pandas as pd
+from webui.evaluation import (
+    REPORT_DIR, load_batch_file, generate_judgment, extract_scores, build_report, add_model_columns
+)
+
+
+def judgment_outcome(result, mode):
+    # 单行裁判输出的胜负（"model1" / "model2" / "draw"），解析失败返回 None
+    try:
+        score1, score2 = extract_scores(result or "", mode)
+    except ValueError:
+        return None
+    return "model1" if score1 > score2 else ("model2" if score2 > score1 else "draw")
+
+
+# 单行结果折算为模型 1 的得分：胜 1，平 0.5，负 0
+OUTCOME_SCORES = {"model1": 1.0, "draw": 0.5, "model2": 0.0}
+
+
+def anytime_radius(k, alpha):
+    """
+    第 k 个样本时置信区间的半宽。得分在 [0, 1] 内，用 Hoeffding 界并在第 k 步取 alpha_k = alpha / (k (k + 1))，
+    各步的 alpha_k 之和为 alpha，因此任意时刻（包括依据数据决定的时刻）停止，区间仍以 1 - alpha 的概率覆盖真实胜率。
+    """
+    alpha_k = alpha / (k * (k + 1))
+    return math.sqrt(math.log(2 / alpha_k) / (2 * k))
+
+
+def win_rate_interval(counts, alpha):
+    # 返回 (胜率估计, 下界, 上界)，胜率中平局计半
+    k = sum(counts.values())
+    if not k:
+        return 0.5, 0.0, 1.0
+    mean = sum(OUTCOME_SCORES[outcome] * n for outcome, n in counts.items()) / k
+    radius = anytime_radius(k, alpha)
+    return mean, max(0.0, mean - radius), min(1.0, mean + radius)
+
+
+def estimate_batch(file, mode, state, target_width=0.1, alpha=0.05, seed=None, output_path=None):
+    """
+    估计模式：按随机顺序逐行评估，持续更新模型 1 相对模型 2 的胜率估计与随时有效的置信区间，
+    区间宽度不超过 target_width 或区间已不含 0.5（胜负已定）时停止，其余行不再评估。
+    报告只包含已评估的行，返回 (message, report_path)。
+    """
+    df, error = load_batch_file(file)
+    if error:
+        return error, None
+    if output_path is None:
+        output_filename = f"estimate_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        output_path = os.path.join(REPORT_DIR, output_filename)
+    proprietary_model_name = state.get("proprietary_model_name")
+    finetuned_model_name = state.get("finetuned_model_name")
+
+    order = np.random.default_rng(seed).permutation(len(df))
+    counts = {"model1": 0, "draw": 0, "model2": 0}
+    positions, raw_results, errors = [], [], []
+    stop_reason = "已评估全部行，区间仍未达到目标"
+    for position in order:
+        row = df.iloc[position]
+        instruction = row.get('instruction', '')
+        answer1 = row.get('answer1', '')
+        answer2 = row.get('answer2', '')
+        positions.append(position)
+        if not all([instruction, answer1, answer2]) or any(pd.isna([instruction, answer1, answer2])):
+            raw_results.append(None)
+            errors.append("无效行：数据缺失")
+            continue
+        try:
+            if proprietary_model_name:
+                result, _, _ = generate_judgment(
+                    instruction, answer1, answer2, mode, state, proprietary_model=proprietary_model_name)
+            else:
+                result, _, _ = generate_judgment(
+                    instruction, answer1, answer2, mode, state, model_name=finetuned_model_name)
+        except Exception as e:
+            raw_results.append(None)
+            errors.append(f"错误：{str(e)}")
+            continue
+        raw_results.append(result)
+        errors.append(None)
+        # 解析失败的行不计入估计
+        outcome = judgment_outcome(result, mode)
+        if outcome is None:
+            continue
+        counts[outcome] += 1
+        _, low, high = win_rate_interval(counts, alpha)
+        if high - low <= target_width:
+            stop_reason = f"置信区间宽度 {high - low:.3f} 已不超过目标 {target_width}"
+            break
+        if low > 0.5 or high < 0.5:
+            stop_reason = "置信区间已不含 0.5，胜负已定"
+            break
+
+    judged_df = df.iloc[positions].reset_index(drop=True)
+    output_df = build_report(judged_df, raw_results, errors, mode)
+    add_model_columns(output_df, judged_df, proprietary_model_name or finetuned_model_name)
+    output_df['sample_order'] = np.arange(1, len(positions) + 1)
+
+    mean, low, high = win_rate_interval(counts, alpha)
+    n = sum(counts.values())
+    message = (
+        f"估计完成：评估 {len(positions)} 行，跳过 {len(df) - len(positions)} 行（{stop_reason}）。\n"
+        f"模型 1 胜率（平局计半）：{mean:.3f}，{1 - alpha:.0%} 置信区间 [{low:.3f}, {high:.3f}]；"
+        f"胜 / 平 / 负：{counts['model1']} / {counts['draw']} / {counts['model2']}（有效 {n} 行）"
+    )
+    try:
+        output_df.to_csv(output_path, index=False, encoding='utf-8')
+        return message, output_path
+    except Exception as e:
+        return f"保存文件时出错：{str(e)}", None
@@ -1,13 +1,14 @@
-from config import PROPRIETARY_MODELS
+from config import PROPRIETARY_MODELS, LOCAL_BATCH_WORKERS, LOCAL_BATCH_SIZE, CALIBRATION_WEIGHT
 import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
-from call_model import call_model
+from call_model import call_model, call_model_detailed, call_model_stream
 import pandas as pd
+import numpy as np
 import json
-
-import torch
+import re
 import tempfile
+import threading
 import uuid
 
 
@@ -58,394 +59,1059 @@ Please first output a single line containing only two values indicating the scor
             raise ValueError(f"Unsupported mode: {mode}")
 
 
-def extract_scores(result, mode):
-    result = result.strip()
-    try:
-        if mode == "直接评估":
-            return list(map(float, result.splitlines()[0].split()))
-        elif mode == "思维链":
-            return list(map(float, result.splitlines()[-1].split()))
-        else:
-            raise ValueError("Unsupported mode for score extraction.")
-    except (IndexError, ValueError):
-        raise ValueError("Failed to parse scores from the evaluation result.")
+def score_line_pattern(count):
+    """
+    由 count 个分数组成的分数行（每个分数可带 "/10" 后缀，以空格或逗号分隔），可带 "Score:"、"评分：" 等前缀及 Markdown 加粗。
+    成对评估为两个分数，逐答案评分为一个分数。
+    """
+    prefix = r"^[^\S\n]*[*#]*[^\S\n]*(?:(?:final[^\S\n]+)?(?:scores?|评分|分数)[^\S\n]*[*]*[^\S\n]*[:：][*]*[^\S\n]*)?[*]*"
+    score = r"(\d+(?:\.\d+)?)(?:[^\S\n]*/[^\S\n]*10)?"
+    separator = r"(?:[^\S\n]*[,，;；][^\S\n]*|[^\S\n]+)"
+    suffix = r"[*]*[^\S\n]*[.。]?[^\S\n]*$"
+    return re.compile(prefix + separator.join([score] * count) + suffix, re.IGNORECASE | re.MULTILINE)
 
 
-def evaluate(instruction, answer1, answer2, mode, state=None, model_name=None, proprietary_model=None):
-    try:
-        conversation = create_prompt(
-            instruction, answer1, answer2, mode, model_name)
-        if not proprietary_model:
-            model = state.get("model")
-            tokenizer = state.get("tokenizer")
-            if model is None or tokenizer is None or model_name is None:
-                return "请先加载模型", "", []
-
-            if tokenizer.chat_template is None:
-                inputs = tokenizer(
-                    conversation, return_tensors="pt").to(model.device)
-                input_ids = inputs["input_ids"]
-                full_prompt = conversation
-            else:
-                if not isinstance(conversation, list) or not all(isinstance(msg, dict) for msg in conversation):
-                    raise ValueError(
-                        "Conversation must be a list of dictionaries with 'role' and 'content' keys.")
-                full_prompt = "\n".join(
-                    [msg["content"] for msg in create_prompt(instruction, answer1, answer2, mode)])
-                input_ids = tokenizer.apply_chat_template(
-                    conversation, add_generation_prompt=True, return_tensors="pt").to(model.device)
-                inputs = {"input_ids": input_ids}
+SCORE_LINE_PATTERN = score_line_pattern(2)
 
-            with torch.no_grad():
-                outputs = model.generate(
-                    **inputs,
-                    max_new_tokens=2048,
+PARSE_FAILED_VERDICT = "解析分数失败。请检查评估模型的输出。"
+
+
+def extract_scores(result, mode):
+    # 直接评估取第一条分数行，思维链取最后一条分数行
+    if mode not in ("直接评估", "思维链"):
+        raise ValueError("Unsupported mode for score extraction.")
+    matches = SCORE_LINE_PATTERN.findall(result.strip())
+    if not matches:
+        raise ValueError("Failed to parse scores from the evaluation result.")
+    match = matches[0] if mode == "直接评估" else matches[-1]
+    return [float(match[0]), float(match[1])]
+
+
+def verdict_from_scores(score1, score2):
+    return "大模型 1 更好" if score1 > score2 else (
+        "大模型 2 更好" if score2 > score1 else "两个大模型表现相当！")
+
+
+def compare_scores(score1, score2):
+    """
+    verdict_from_scores 的向量化版本：score1 / score2 为等长数组，NaN 视为解析失败。返回 (winner, verdict) 两个数组。
+    """
+    score1 = np.asarray(score1, dtype=float)
+    score2 = np.asarray(score2, dtype=float)
+    parsed = ~np.isnan(score1) & ~np.isnan(score2)
+    winner = np.select(
+        [~parsed, score1 > score2, score2 > score1],
+        ["error", "model1", "model2"], default="draw")
+    verdict = np.select(
+        [~parsed, score1 > score2, score2 > score1],
+        [PARSE_FAILED_VERDICT, "大模型 1 更好", "大模型 2 更好"], default="两个大模型表现相当！")
+    return winner, verdict
+
+
+def parse_judgments(results, mode):
+    """
+    对整批裁判输出做向量化解析，一次性得到 score1 / score2 / winner / verdict 四列。
+    results 为原始输出的 Series，缺失值视为解析失败。
+    """
+    if mode not in ("直接评估", "思维链"):
+        raise ValueError("Unsupported mode for score extraction.")
+    results = pd.Series(results, dtype=object)
+    texts = results.fillna("").astype(str).str.strip()
+    if mode == "直接评估":
+        picked = texts.str.extract(SCORE_LINE_PATTERN)
+    else:
+        # 整批都没有分数行时 findall 的结果不含字符串，不能再用 .str 取元素，逐行取最后一条匹配
+        last = [matches[-1] if matches else (None, None)
+                for matches in texts.str.findall(SCORE_LINE_PATTERN)]
+        picked = pd.DataFrame(last, columns=[0, 1], index=results.index)
+    score1 = pd.to_numeric(picked[0], errors="coerce").astype(float)
+    score2 = pd.to_numeric(picked[1], errors="coerce").astype(float)
+    parsed = score1.notna() & score2.notna()
+    winner, verdict = compare_scores(score1, score2)
+    return pd.DataFrame({
+        'score1': score1.where(parsed),
+        'score2': score2.where(parsed),
+        'winner': winner,
+        'verdict': verdict,
+    }, index=results.index)
+
+
+def prepare_local_inputs(conversation, tokenizer, model, instruction, answer1, answer2, mode):
+    # 按分词器是否带对话模板构造本地模型输入，返回 (inputs, input_ids, full_prompt)
+    if tokenizer.chat_template is None:
+        inputs = tokenizer(
+            conversation, return_tensors="pt").to(model.device)
+        return inputs, inputs["input_ids"], conversation
+    if not isinstance(conversation, list) or not all(isinstance(msg, dict) for msg in conversation):
+        raise ValueError(
+            "Conversation must be a list of dictionaries with 'role' and 'content' keys.")
+    full_prompt = "\n".join(
+        [msg["content"] for msg in create_prompt(instruction, answer1, answer2, mode)])
+    input_ids = tokenizer.apply_chat_template(
+        conversation, add_generation_prompt=True, return_tensors="pt").to(model.device)
+    return {"input_ids": input_ids}, input_ids, full_prompt
+
+
+def api_messages(instruction, answer1, answer2, mode, proprietary_model):
+    # 经 HTTP 服务调用的 JudgeLM 使用其训练时的提示格式，作为单条用户消息发送
+    conversation = create_prompt(
+        instruction, answer1, answer2, mode, PROPRIETARY_MODELS[proprietary_model])
+    if isinstance(conversation, str):
+        return [{"role": "user", "content": conversation}]
+    return conversation
+
+
+# 报告中记录的逐行用量列；reasoning 为推理模型的推理内容
+USAGE_COLUMNS = ("prompt_tokens", "completion_tokens", "reasoning_tokens", "reasoning")
+
+
+def add_usage_columns(output_df, usages):
+    # usages 与报告逐行对应，无用量的行为 None；整批都没有用量时不添加
+    if not any(usages):
+        return output_df
+    for column in USAGE_COLUMNS:
+        output_df[column] = [usage.get(column) if usage else None for usage in usages]
+    return output_df
+
+
+def check_proprietary_model(proprietary_model):
+    if not isinstance(proprietary_model, str):
+        raise ValueError(f"错误：专有模型名称必须是字符串，收到 {type(proprietary_model)}")
+    if proprietary_model not in PROPRIETARY_MODELS:
+        raise ValueError(f"错误：无效的专有模型 {proprietary_model}")
+
+
+def assisted_generation_kwargs(state):
+    # 会话加载了草稿模型时启用辅助解码（transformers 的 assistant_model，仅支持单行生成）
+    draft_model = state.get("draft_model") if state else None
+    return {"assistant_model": draft_model} if draft_model is not None else {}
+
+
+def generate_judgment(instruction, answer1, answer2, mode, state=None, model_name=None, proprietary_model=None):
+    """
+    调用裁判模型生成原始输出，返回 (result, logprobs, full_prompt)；出错时抛出 ValueError。
+    专有模型的 logprobs 为 None。
+    """
+    result, logprobs, full_prompt, _ = generate_judgment_detailed(
+        instruction, answer1, answer2, mode, state, model_name, proprietary_model)
+    return result, logprobs, full_prompt
+
+
+def generate_judgment_detailed(instruction, answer1, answer2, mode, state=None, model_name=None, proprietary_model=None):
+    """
+    同 generate_judgment，另返回本次调用的 usage：prompt_tokens / completion_tokens / reasoning_tokens 与推理内容 reasoning。
+    """
+    conversation = create_prompt(
+        instruction, answer1, answer2, mode, model_name)
+    if not proprietary_model:
+        # torch 仅在使用本地模型时导入，专有模型部署不加载
+        import torch
+        from local_model import decode_cache
+
+        model = state.get("model") if state else None
+        tokenizer = state.get("tokenizer") if state else None
+        if model is None or tokenizer is None or model_name is None:
+            raise ValueError("请先加载模型")
+
+        inputs, input_ids, full_prompt = prepare_local_inputs(
+            conversation, tokenizer, model, instruction, answer1, answer2, mode)
+
+        with torch.no_grad(), decode_cache(model, inputs["input_ids"], 2048) as cache_kwargs:
+            outputs = model.generate(
+                **inputs,
+                return_dict_in_generate=True,
+                output_scores=True,
+                **assisted_generation_kwargs(state),
+                **cache_kwargs
+            )
+
+        generated_token_ids = outputs.sequences[0]
+        input_length = input_ids.shape[1]
+        output_token_ids = generated_token_ids[input_length:]
+        result = tokenizer.decode(
+            output_token_ids, skip_special_tokens=True)
+
+        logprobs = []
+        for scores in outputs.scores:
+            logits = scores.log_softmax(dim=-1)
+            logprobs.append(logits)
+
+        confidence = calculate_confidence(logprobs)
+        print(f"置信度: {confidence}")
+        usage = {"prompt_tokens": input_length, "completion_tokens": len(output_token_ids),
+                 "reasoning_tokens": None, "reasoning": None}
+        return result, logprobs, full_prompt, usage
+
+    check_proprietary_model(proprietary_model)
+    print(
+        f"Calling call_model with proprietary_model: {proprietary_model}")
+    messages = api_messages(instruction, answer1, answer2, mode, proprietary_model)
+    full_prompt = "\n".join([msg["content"] for msg in messages])
+    details = call_model_detailed(
+        messages, PROPRIETARY_MODELS[proprietary_model],
+        validate=lambda text: extract_scores(text, mode))
+    if details is None or details["content"] is None:
+        raise ValueError("错误：call_model 返回空结果")
+    result = details["content"]
+    print(f"call_model returned: {result}")
+    usage = {key: details.get(key) for key in USAGE_COLUMNS}
+    return result, None, full_prompt, usage
+
+
+def stream_generate(model, tokenizer, **generate_kwargs):
+    """
+    在后台线程中运行 generate，逐段产出 (已生成文本, outputs)；outputs 仅在最后一次产出时给出。
+    未传入 past_key_values 时，编译解码模式下在生成线程内取用静态 KV 缓存。
+    """
+    import torch
+    from contextlib import nullcontext
+    from transformers import TextIteratorStreamer
+    from local_model import decode_cache
+
+    streamer = TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=True)
+    generation = {}
+
+    if "past_key_values" in generate_kwargs:
+        cache = nullcontext({})
+    else:
+        cache = decode_cache(model, generate_kwargs["input_ids"], generate_kwargs["max_new_tokens"])
+
+    def run_generate():
+        try:
+            with torch.no_grad(), cache as cache_kwargs:
+                # cache_kwargs 中收紧后的 max_new_tokens 覆盖调用方给出的值
+                generation["outputs"] = model.generate(
+                    **{**generate_kwargs, **cache_kwargs},
                     return_dict_in_generate=True,
-                    output_scores=True
+                    output_scores=True,
+                    streamer=streamer
                 )
+        except Exception as e:
+            generation["error"] = e
+            streamer.end()
+
+    thread = threading.Thread(target=run_generate, daemon=True)
+    thread.start()
+    result = ""
+    for text in streamer:
+        result += text
+        yield result, None
+    thread.join()
+    if "error" in generation:
+        raise ValueError(f"生成失败：{generation['error']}")
+    yield result, generation["outputs"]
+
+
+def stream_judgment(instruction, answer1, answer2, mode, state=None, model_name=None, proprietary_model=None):
+    """
+    流式生成裁判输出，逐步产出 (已生成文本, logprobs, full_prompt)。
+    生成过程中 logprobs 为 None；本地模型在最后一次产出时附带完整 logprobs。
+    """
+    conversation = create_prompt(
+        instruction, answer1, answer2, mode, model_name)
+    if not proprietary_model:
+        model = state.get("model") if state else None
+        tokenizer = state.get("tokenizer") if state else None
+        if model is None or tokenizer is None or model_name is None:
+            raise ValueError("请先加载模型")
+
+        inputs, _, full_prompt = prepare_local_inputs(
+            conversation, tokenizer, model, instruction, answer1, answer2, mode)
+        for result, outputs in stream_generate(model, tokenizer, **inputs, max_new_tokens=2048,
+                                               **assisted_generation_kwargs(state)):
+            if outputs is None:
+                yield result, None, full_prompt
+        logprobs = [scores.log_softmax(dim=-1) for scores in outputs.scores]
+        yield result, logprobs, full_prompt
+        return
+
+    check_proprietary_model(proprietary_model)
+    messages = api_messages(instruction, answer1, answer2, mode, proprietary_model)
+    full_prompt = "\n".join([msg["content"] for msg in messages])
+    result = ""
+    for delta in call_model_stream(messages, PROPRIETARY_MODELS[proprietary_model]):
+        result += delta
+        yield result, None, full_prompt
+    if not result:
+        raise ValueError("错误：call_model 返回空结果")
+
+
+# 仅生成分数行时的最大 token 数，分数行之后即停止
+SCORE_MAX_NEW_TOKENS = 16
+
+
+def scores_come_first(mode, model_name):
+    # JudgeLM 提示与直接评估均要求首行输出分数；思维链（非 JudgeLM）分数在末尾，无法只生成分数
+    return mode == "直接评估" or bool(model_name and "judgelm" in model_name.lower())
+
+
+def score_line_stopping_criteria(tokenizer, input_length):
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class ScoreLineComplete(StoppingCriteria):
+        # 生成内容中出现非空首行后的换行即停止
+        def __call__(self, input_ids, scores, **kwargs):
+            text = tokenizer.decode(
+                input_ids[0, input_length:], skip_special_tokens=True)
+            done = "\n" in text.lstrip()
+            return torch.full((input_ids.shape[0],), done, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([ScoreLineComplete()])
+
+
+def judge_scores_only(instruction, answer1, answer2, mode, state, model_name):
+    """
+    本地裁判模型只生成首行分数，返回 (score_text, logprobs, context)。
+    context 保存提示、已生成序列与 KV 缓存，供 explain_judgment 按需续写解释；
+    编译解码模式下 KV 缓存为按解释所需长度取用的静态缓存，用完后应调用 release_scores_context 归还。
+    """
+    import torch
+    from local_model import acquire_static_cache, release_static_cache
+
+    model = state.get("model")
+    tokenizer = state.get("tokenizer")
+    if model is None or tokenizer is None or model_name is None:
+        raise ValueError("请先加载模型")
+    conversation = create_prompt(
+        instruction, answer1, answer2, mode, model_name)
+    inputs, input_ids, full_prompt = prepare_local_inputs(
+        conversation, tokenizer, model, instruction, answer1, answer2, mode)
+    input_length = input_ids.shape[1]
+    # 静态缓存按 "分数行 + 解释" 的总长度取用，续写解释时沿用同一缓存；放不下分数行时退回动态缓存
+    static_cache = acquire_static_cache(model, 1, input_length + 2048)
+    if static_cache is not None and static_cache.max_cache_len <= input_length + SCORE_MAX_NEW_TOKENS:
+        release_static_cache(model, static_cache)
+        static_cache = None
+    cache_kwargs = {"past_key_values": static_cache} if static_cache is not None else {}
+    try:
+        with torch.no_grad():
+            outputs = model.generate(
+                **inputs,
+                max_new_tokens=SCORE_MAX_NEW_TOKENS,
+                return_dict_in_generate=True,
+                output_scores=True,
+                stopping_criteria=score_line_stopping_criteria(
+                    tokenizer, input_length),
+                **cache_kwargs
+            )
+    except Exception:
+        release_static_cache(model, static_cache)
+        raise
+    score_text = tokenizer.decode(
+        outputs.sequences[0][input_length:], skip_special_tokens=True)
+    logprobs = [scores.log_softmax(dim=-1) for scores in outputs.scores]
+    context = {
+        "full_prompt": full_prompt,
+        "input_length": input_length,
+        "sequences": outputs.sequences,
+        "past_key_values": outputs.past_key_values,
+        "static_cache": static_cache,
+    }
+    return score_text, logprobs, context
+
+
+def release_scores_context(state, context):
+    # 不再续写解释时归还分数阶段取用的静态 KV 缓存；未使用静态缓存时什么也不做
+    if context and context.get("static_cache") is not None:
+        from local_model import release_static_cache
+
+        release_static_cache(state.get("model"), context["static_cache"])
+        context["static_cache"] = None
+
+
+def explanation_inputs(context):
+    # 以提示 + 分数行为前缀续写，复用分数阶段的 KV 缓存，不再重复预填充提示
+    import torch
+
+    sequences = context["sequences"]
+    max_new_tokens = 2048 - (sequences.shape[1] - context["input_length"])
+    if context.get("static_cache") is not None:
+        # 静态缓存的长度不超过模型位置长度，解释不能超出缓存的剩余长度
+        max_new_tokens = min(max_new_tokens, context["static_cache"].max_cache_len - sequences.shape[1])
+    return {
+        "input_ids": sequences,
+        "attention_mask": torch.ones_like(sequences),
+        "past_key_values": context["past_key_values"],
+        "max_new_tokens": max_new_tokens,
+    }
+
+
+def explain_judgment(state, context):
+    """
+    在分数行之后续写解释，返回完整输出文本（分数行 + 解释）。
+    """
+    import torch
+
+    model = state.get("model")
+    tokenizer = state.get("tokenizer")
+    with torch.no_grad():
+        sequences = model.generate(
+            **explanation_inputs(context), **assisted_generation_kwargs(state))
+    return tokenizer.decode(
+        sequences[0][context["input_length"]:], skip_special_tokens=True)
+
+
+def stream_explanation(state, context):
+    # explain_judgment 的流式版本，逐步产出完整输出文本（分数行 + 已生成的解释）
+    model = state.get("model")
+    tokenizer = state.get("tokenizer")
+    score_text = tokenizer.decode(
+        context["sequences"][0][context["input_length"]:], skip_special_tokens=True)
+    for text, _ in stream_generate(model, tokenizer, **explanation_inputs(context),
+                                   **assisted_generation_kwargs(state)):
+        yield score_text + text
+
+
+def partial_verdict(result, mode, finished):
+    # 直接评估的分数行在首行，首行完整即可给出结论；思维链的分数行在末尾，需等生成结束
+    if mode == "直接评估" and not finished:
+        if "\n" not in result.lstrip():
+            return None
+        result = result.lstrip().split("\n", 1)[0]
+    elif not finished:
+        return None
+    try:
+        return verdict_from_scores(*extract_scores(result, mode))
+    except ValueError:
+        return PARSE_FAILED_VERDICT if finished else None
+
+
+def evaluate_stream(instruction, answer1, answer2, mode, state=None, model_name=None, proprietary_model=None):
+    """
+    evaluate 的流式版本，逐步产出 (verdict, judgment, logprobs)；分数行出现后立即给出结论。
+    judgment 为 {"prompt", "result"}，出错时为 None，HTML 由界面层在展示时渲染。
+    """
+    verdict = None
+    result, logprobs, full_prompt = "", None, ""
+    try:
+        for result, logprobs, full_prompt in stream_judgment(
+                instruction, answer1, answer2, mode, state, model_name, proprietary_model):
+            if verdict is None:
+                verdict = partial_verdict(result, mode, finished=False)
+            yield verdict or "评估中……", {"prompt": full_prompt, "result": result}, None
+        if verdict is None:
+            verdict = partial_verdict(result, mode, finished=True)
+        yield verdict, {"prompt": full_prompt, "result": result}, logprobs or []
+    except ValueError as e:
+        yield str(e), None, []
+    except Exception as e:
+        yield f"评估失败: {str(e)}", None, []
 
-            generated_token_ids = outputs.sequences[0]
-            input_length = input_ids.shape[1]
-            output_token_ids = generated_token_ids[input_length:]
-            result = tokenizer.decode(
-                output_token_ids, skip_special_tokens=True)
 
-            logprobs = []
-            for scores in outputs.scores:
-                logits = scores.log_softmax(dim=-1)
-                logprobs.append(logits)
+def evaluate(instruction, answer1, answer2, mode, state=None, model_name=None, proprietary_model=None):
+    """
+    返回 (verdict, judgment, logprobs, score1, score2)，judgment 同 evaluate_stream。
+    """
+    try:
+        try:
+            result, logprobs, full_prompt = generate_judgment(
+                instruction, answer1, answer2, mode, state, model_name, proprietary_model)
+        except ValueError as e:
+            return str(e), None, [], None, None
 
-            confidence = calculate_confidence(logprobs)
-            print(f"置信度: {confidence}")
-        else:
-            if not isinstance(proprietary_model, str):
-                return f"错误：专有模型名称必须是字符串，收到 {type(proprietary_model)}", "", []
-            if proprietary_model not in PROPRIETARY_MODELS:
-                return f"错误：无效的专有模型 {proprietary_model}", "", []
-            print(
-                f"Calling call_model with proprietary_model: {proprietary_model}")
-            full_prompt = "\n".join(
-                [msg["content"] for msg in create_prompt(instruction, answer1, answer2, mode)])
-            result = call_model(
-                conversation, PROPRIETARY_MODELS[proprietary_model])
-            if result is None:
-                return "错误：call_model 返回空结果", "", []
-            print(f"call_model returned: {result}")
-            logprobs = None
-
-        scores = extract_scores(result, mode)
-        if len(scores) == 2:
-            score1, score2 = scores
-            verdict = "大模型 1 更好" if score1 > score2 else (
-                "大模型 2 更好" if score2 > score1 else "两个大模型表现相当！")
-        else:
-            verdict = "解析分数失败。请检查评估模型的输出。"
-
-        details = (
-            "<div class='details-section'>"
-            "<h3>👨 用户</h3>"
-            "<pre>%s</pre>"
-            "<h3>⚖️ 裁判模型</h3>"
-            "<pre>%s</pre>"
-            "</div>"
-        ) % (
-            full_prompt.replace('>', '&gt;').replace(
-                '<', '&lt;').replace('\n', '<br>'),
-            result.replace('\n', '<br>')
-        )
-        return verdict, details, logprobs, score1, score2
+        try:
+            score1, score2 = extract_scores(result, mode)
+            verdict = verdict_from_scores(score1, score2)
+        except ValueError:
+            score1 = score2 = None
+            verdict = PARSE_FAILED_VERDICT
+
+        return verdict, {"prompt": full_prompt, "result": result}, logprobs, score1, score2
     except Exception as e:
-        return f"评估失败: {str(e)}", "", []
+        return f"评估失败: {str(e)}", None, [], None, None
+
+
+def add_model_columns(output_df, df, judge_name):
+    # 输入文件若带有 model1 / model2 列（被评估模型名称），原样写入报告，供排行榜聚合使用
+    for column in ('model1', 'model2'):
+        if column in df.columns:
+            output_df[column] = df[column].to_numpy()
+    output_df['judge'] = judge_name
+    return output_df
+
+
+def build_report(df, raw_results, errors, mode):
+    # 整批解析原始输出；读取或调用出错的行保留错误信息
+    parsed = parse_judgments(raw_results, mode)
+    errors = pd.Series(errors, dtype=object)
+    parsed['verdict'] = errors.where(errors.notna(), parsed['verdict'])
+    return pd.DataFrame({
+        'instruction': df.get('instruction', pd.Series(dtype=object)).to_numpy(),
+        'answer1': df.get('answer1', pd.Series(dtype=object)).to_numpy(),
+        'answer2': df.get('answer2', pd.Series(dtype=object)).to_numpy(),
+        'score1': parsed['score1'].to_numpy(),
+        'score2': parsed['score2'].to_numpy(),
+        'winner': parsed['winner'].to_numpy(),
+        'verdict': parsed['verdict'].to_numpy()  # 保留原始文本结果
+    })
 
 
-def evaluate_batch(file, mode, state):
+def load_batch_file(file):
+    """
+    读取批量评估的输入文件，返回 (df, 错误信息)。file 可以是 Gradio 上传对象或文件路径。
+    """
     if file is None:
-        return "请上传文件", None
-
+        return None, "请上传文件"
+    path = getattr(file, "name", file)
     try:
-        temp_dir = tempfile.gettempdir()
-        output_filename = f"eval_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        output_path = os.path.join(REPORT_DIR, output_filename)  # 保存到专用目录
-        if file.name.endswith('.csv'):
-            df = pd.read_csv(file.name)
-        elif file.name.endswith('.json'):
-            with open(file.name, 'r', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            df = pd.read_csv(path)
+        elif path.endswith('.json'):
+            with open(path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
             df = pd.DataFrame(data)
         else:
-            return "仅支持 CSV 或 JSON 格式的文件", None
+            return None, "仅支持 CSV 或 JSON 格式的文件"
     except (pd.errors.ParserError, json.JSONDecodeError) as e:
-        return f"文件解析错误：{e}", None
+        return None, f"文件解析错误：{e}"
     except Exception as e:
-        return f"读取文件时出错：{e}", None
-
-    results = []
-    scores1 = []
-    scores2 = []
-    winners = []
-    for _, row in df.iterrows():
-        instruction = row.get('instruction', '')
-        answer1 = row.get('answer1', '')
-        answer2 = row.get('answer2', '')
+        return None, f"读取文件时出错：{e}"
+    return df, None
+
+
+def normalize_text(values):
+    # 统一空白：首尾空白去掉，连续空白（含换行）合并为一个空格
+    return values.fillna("").astype(str).str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+def dedupe_rows(df):
+    """
+    按规范化后的 (instruction, answer1, answer2) 的哈希去重，返回 (unique_df, inverse)。
+    unique_df 保留每组重复行中首次出现的一行（原始文本），inverse[i] 为原第 i 行对应的 unique_df 行号。
+    缺失的单元格（NaN）在 unique_df 中置为空字符串，各批量路径统一按空值判为无效行。
+    """
+    columns = ['instruction', 'answer1', 'answer2']
+    normalized = pd.DataFrame({
+        column: normalize_text(df[column] if column in df.columns else pd.Series("", index=df.index))
+        for column in columns})
+    keys = pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+    inverse, _ = pd.factorize(keys)
+    _, first = np.unique(inverse, return_index=True)
+    unique_df = df.iloc[first].reset_index(drop=True)
+    present = [column for column in columns if column in unique_df.columns]
+    unique_df[present] = unique_df[present].astype(object).where(unique_df[present].notna(), "")
+    return unique_df, inverse
+
+
+def fan_out(values, inverse):
+    # 把按唯一行得到的结果展开回原始的每一行
+    return [values[j] for j in inverse]
+
+
+def dedup_summary(total, unique):
+    if not total:
+        return ""
+    return f"去重：{total} 行中 {unique} 行唯一，省去 {total - unique} 次重复评估，重复率 {(total - unique) / total:.1%}"
+
+
+def group_by_instruction(rows):
+    """
+    按指令分组，返回按首次出现顺序排列的下标列表 [[i, ...], ...]。
+    """
+    groups = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(row[0], []).append(i)
+    return list(groups.values())
+
+
+def common_prefix_length(token_lists):
+    # 多个 token 序列的最长公共前缀长度
+    shortest = min(token_lists, key=len)
+    for i, token in enumerate(shortest):
+        if any(tokens[i] != token for tokens in token_lists):
+            return i
+    return len(shortest)
+
+
+def judge_group_shared_prefix(rows, mode, state, model_name):
+    """
+    本地裁判模型评估同一指令下的多行：公共提示前缀（系统提示 + 问题）只预填充一次，
+    其 KV 缓存在组内逐行复用，每行只需预填充答案部分。返回 [(raw_result, error), ...]。
+    """
+    import torch
+    from contextlib import nullcontext
+    from transformers import DynamicCache
+    from local_model import acquire_static_cache, release_static_cache, crop_static_cache, decode_cache
+
+    model = state.get("model")
+    tokenizer = state.get("tokenizer")
+    outputs = [None] * len(rows)
+    prepared = []
+    for i, (instruction, answer1, answer2) in enumerate(rows):
+        try:
+            conversation = create_prompt(
+                instruction, answer1, answer2, mode, model_name)
+            _, input_ids, _ = prepare_local_inputs(
+                conversation, tokenizer, model, instruction, answer1, answer2, mode)
+            prepared.append((i, input_ids))
+        except Exception as e:
+            outputs[i] = (None, f"错误：{str(e)}")
+    if not prepared:
+        return outputs
+
+    # 前缀按 token 比较而不是按文本截取，避免前缀末尾的分词边界与整句分词不一致；至少给每行留一个未缓存的 token
+    token_lists = [input_ids[0].tolist() for _, input_ids in prepared]
+    prefix_length = min(common_prefix_length(token_lists),
+                        min(len(tokens) for tokens in token_lists) - 1)
+    cache = static_cache = None
+    if len(prepared) > 1 and prefix_length > 0:
+        # 编译解码模式下公共前缀预填充到能容纳组内最长一行的静态缓存中，解码阶段形状固定
+        longest = max(len(tokens) for tokens in token_lists)
+        static_cache = acquire_static_cache(model, 1, longest + 2048)
+        if static_cache is not None and static_cache.max_cache_len <= longest:
+            release_static_cache(model, static_cache)
+            static_cache = None
+        cache = static_cache if static_cache is not None else DynamicCache()
 
-        if not instruction or not answer1 or not answer2:
-            results.append("无效行：数据缺失")
-            scores1.append(None)
-            scores2.append(None)
-            winners.append("error")
-            continue
+    try:
+        if cache is not None:
+            with torch.no_grad():
+                model(input_ids=prepared[0][1][:, :prefix_length],
+                      past_key_values=cache, use_cache=True)
+        for i, input_ids in prepared:
+            try:
+                # 单行的组没有公共前缀，编译解码模式下单独取用静态缓存；静态缓存的剩余长度限制生成长度
+                if static_cache is not None:
+                    row_cache = nullcontext({"past_key_values": cache, "max_new_tokens": min(
+                        2048, static_cache.max_cache_len - input_ids.shape[1])})
+                elif cache is not None:
+                    row_cache = nullcontext({"past_key_values": cache, "max_new_tokens": 2048})
+                else:
+                    row_cache = decode_cache(model, input_ids, 2048)
+                with torch.no_grad(), row_cache as cache_kwargs:
+                    sequences = model.generate(
+                        input_ids=input_ids,
+                        attention_mask=torch.ones_like(input_ids),
+                        **assisted_generation_kwargs(state),
+                        **cache_kwargs
+                    )
+                result = tokenizer.decode(
+                    sequences[0][input_ids.shape[1]:], skip_special_tokens=True)
+                outputs[i] = (result, None)
+            except Exception as e:
+                outputs[i] = (None, f"错误：{str(e)}")
+            finally:
+                # generate 会在缓存后追加本行的 token，裁回公共前缀供下一行使用
+                if static_cache is not None:
+                    crop_static_cache(static_cache, prefix_length)
+                elif cache is not None:
+                    cache.crop(prefix_length)
+    finally:
+        release_static_cache(model, static_cache)
+    return outputs
+
+
+def judge_rows_local(rows, mode, state, model_name):
+    """
+    本地裁判模型按指令分组评估 rows（(instruction, answer1, answer2) 列表），结果按原顺序返回。
+    """
+    outputs = [None] * len(rows)
+    for group in group_by_instruction(rows):
+        group_outputs = judge_group_shared_prefix(
+            [rows[i] for i in group], mode, state, model_name)
+        for i, output in zip(group, group_outputs):
+            outputs[i] = output
+    return outputs
+
+
+def evaluate_batch(file, mode, state, num_workers=None, output_path=None):
+    df, error = load_batch_file(file)
+    if error:
+        return error, None
+    if output_path is None:
+        output_filename = f"eval_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        output_path = os.path.join(REPORT_DIR, output_filename)  # 保存到专用目录
 
-        try:
-            if state.get("proprietary_model_name"):
-                verdict, _, _, score1, score2 = evaluate(
+    # 重复行（含仅空白不同的行）只评估一次，结果再展开到每一行
+    unique_df, inverse = dedupe_rows(df)
+    rows = [(row.get('instruction', ''), row.get('answer1', ''), row.get('answer2', ''))
+            for _, row in unique_df.iterrows()]
+    valid = [i for i, row in enumerate(rows) if all(row)]
+    raw_results = [None] * len(rows)
+    errors = ["无效行：数据缺失"] * len(rows)
+    truncation = [None] * len(rows)
+    usages = [None] * len(rows)
+
+    model = state.get("model")
+    num_workers = num_workers or LOCAL_BATCH_WORKERS
+    if state.get("proprietary_model_name"):
+        outputs = []
+        for i in valid:
+            instruction, answer1, answer2 = rows[i]
+            try:
+                result, _, _, usages[i] = generate_judgment_detailed(
                     instruction, answer1, answer2, mode, state, proprietary_model=state.get("proprietary_model_name"))
+                outputs.append((result, None))
+            except Exception as e:
+                outputs.append((None, f"错误：{str(e)}"))
+    elif (model is None or state.get("tokenizer") is None
+          or state.get("finetuned_model_name") is None):
+        outputs = [(None, "错误：请先加载模型")] * len(valid)
+    else:
+        from webui.lengths import fit_rows, judge_rows_bucketed
+
+        finetuned_model_name = state.get("finetuned_model_name")
+        # 预先计算整批提示的 token 长度，超长的行按截断策略处理，截断情况写入报告
+        lengths = {}
+        fitted = fit_rows([rows[i] for i in valid], mode, model,
+                          state.get("tokenizer"), finetuned_model_name)
+        for i, (row, length, note) in zip(valid, fitted):
+            truncation[i] = note
+            if row is None:
+                errors[i] = "错误：提示超出上下文长度，已跳过"
             else:
-                verdict, _, _, score1, score2 = evaluate(
-                    instruction, answer1, answer2, mode, state, model_name=state.get("finetuned_model_name"))
-
-            if score1 and score2:
-                winner = "model1" if score1 > score2 else (
-                    "model2" if score2 > score1 else "draw")
-            else:
-                score1 = None
-                score2 = None
-                winner = "error"
-
-            results.append(verdict)
-            scores1.append(score1)
-            scores2.append(score2)
-            winners.append(winner)
-        except Exception as e:
-            results.append(f"错误：{str(e)}")
-            scores1.append(None)
-            scores2.append(None)
-            winners.append("error")
+                rows[i] = row
+                lengths[i] = length
+        valid = [i for i in valid if i in lengths]
+        # 同一指令的行排在一起，便于复用公共前缀的 KV 缓存；并行时同组的行也尽量落在同一分片
+        valid = [valid[i] for group in group_by_instruction([rows[i] for i in valid])
+                 for i in group]
+        if num_workers > 1 and model.device.type == "cpu":
+            # 本地模型在 CPU 上时按进程数据并行，结果按原顺序合并
+            from webui.parallel import judge_rows_parallel
+
+            outputs = judge_rows_parallel(
+                [rows[i] for i in valid], mode, finetuned_model_name, num_workers, state.get("model_path"))
+        elif LOCAL_BATCH_SIZE > 1:
+            outputs = judge_rows_bucketed(
+                [rows[i] for i in valid], [lengths[i] for i in valid], mode, state,
+                finetuned_model_name, LOCAL_BATCH_SIZE)
+        else:
+            outputs = judge_rows_local(
+                [rows[i] for i in valid], mode, state, finetuned_model_name)
+    for i, (result, error) in zip(valid, outputs):
+        raw_results[i] = result
+        errors[i] = error
 
     # 保存时采用结构化存储
-    output_df = pd.DataFrame({
-        'instruction': df.get('instruction', []),
-        'answer1': df.get('answer1', []),
-        'answer2': df.get('answer2', []),
-        'score1': scores1,
-        'score2': scores2,
-        'winner': winners,
-        'verdict': results  # 保留原始文本结果
-    })
+    output_df = build_report(df, fan_out(raw_results, inverse), fan_out(errors, inverse), mode)
+    add_model_columns(output_df, df, state.get(
+        "proprietary_model_name") or state.get("finetuned_model_name"))
+    add_usage_columns(output_df, fan_out(usages, inverse))
+    notes = [dedup_summary(len(df), len(unique_df))]
+    truncation = fan_out(truncation, inverse)
+    truncated_count = sum(note is not None for note in truncation)
+    if truncated_count:
+        output_df['truncation'] = truncation
+        notes.append(f"{truncated_count} 行提示超长，详见报告 truncation 列")
+    message = f"评估完成（{'；'.join(note for note in notes if note)}），点击下方下载报告"
 
     try:
         output_df.to_csv(output_path, index=False, encoding='utf-8')
-        return f"评估完成，点击下方下载报告", output_path
+        return message, output_path
     except Exception as e:
         return f"保存文件时出错：{str(e)}", None
 
 
+def surface_quality_prompt(answer):
+    return [
+        {"role": "system", "content": "You are a meticulous evaluator whose task is to assess the superficial quality of an AI assistant's response, and you should focus specifically on language expression without considering the factual accuracy of the information provided."},
+        {"role": "user", "content": f"""[The Start of Answer]\n{answer}\n[The End of Answer]\n\n[System]\nEvaluate the superficial quality of the provided answer in terms of linguistic expression and stylistic presentation. Provide a score between 1 and 10, where 10 signifies exceptional superficial articulation encompassing aspects such as lexical diversity, structural coherence, stylistic elegance, and overall fluidity. \nOn the first line, offer a detailed rationale for your score, explaining how well the answer demonstrates each assessed quality aspect. Your analysis should be thorough and impartial, focusing solely on superficial elements.\nOn the subsequent line, your rating should be presented as a numerical value without any other comments or explanations. There should be nothing on this line except a score."""}
+    ]
+
+
+def surface_score(answer, model_name):
+    # 表面质量得分取回复的最后一行，解析失败按 0 分计
+    def surface_score_valid(text):
+        return float(text.strip().splitlines()[-1].strip())
+
+    response = call_model(surface_quality_prompt(answer), PROPRIETARY_MODELS[model_name],
+                          validate=surface_score_valid)
+    if response is None:
+        raise ValueError("表面质量评分请求失败")
+    try:
+        return surface_score_valid(response)
+    except (ValueError, IndexError):
+        return 0.0
+
+
+def calibration_components(instruction, answer1, answer2, mode, model_name):
+    """
+    校准评估的全部中间结果：{raw, score1, score2, surface1, surface2, prompt}，
+    raw 为专有模型的原始输出，原分数解析失败时 score1 / score2 为 None。请求失败时抛出 ValueError。
+    """
+    surface1 = surface_score(answer1, model_name)
+    surface2 = surface_score(answer2, model_name)
+    conversation = api_messages(instruction, answer1, answer2, mode, model_name)
+    response = call_model(conversation, PROPRIETARY_MODELS[model_name],
+                          validate=lambda text: extract_scores(text, mode))
+    if not response:
+        raise ValueError("API 请求失败")
+    result = response.strip()
+    try:
+        score1, score2 = extract_scores(result, mode)
+    except ValueError:
+        score1 = score2 = None
+    return {
+        "raw": result, "score1": score1, "score2": score2,
+        "surface1": surface1, "surface2": surface2,
+        "prompt": "\n".join([msg["content"] for msg in conversation]),
+    }
+
+
+def calibrated_scores(score1, score2, surface1, surface2, weight=CALIBRATION_WEIGHT):
+    # 标量与数组均可，离线重算时整列计算
+    return score1 - weight * surface1, score2 - weight * surface2
+
+
 def calibrated_evaluation(instruction, answer1, answer2, mode, model_name=None):
+    """
+    返回 (verdict, components)：components 为 calibration_components 的结果另加校准分 adjusted1 / adjusted2 与 verdict，
+    出错时为 None。
+    """
     if not instruction or not answer1 or not answer2:
         raise ValueError(
             "Instruction, Answer 1, and Answer 2 cannot be empty.")
 
-    def surface_quality_prompt(answer):
-        return [
-            {"role": "system", "content": "You are a meticulous evaluator whose task is to assess the superficial quality of an AI assistant's response, and you should focus specifically on language expression without considering the factual accuracy of the information provided."},
-            {"role": "user", "content": f"""[The Start of Answer]\n{answer}\n[The End of Answer]\n\n[System]\nEvaluate the superficial quality of the provided answer in terms of linguistic expression and stylistic presentation. Provide a score between 1 and 10, where 10 signifies exceptional superficial articulation encompassing aspects such as lexical diversity, structural coherence, stylistic elegance, and overall fluidity. \nOn the first line, offer a detailed rationale for your score, explaining how well the answer demonstrates each assessed quality aspect. Your analysis should be thorough and impartial, focusing solely on superficial elements.\nOn the subsequent line, your rating should be presented as a numerical value without any other comments or explanations. There should be nothing on this line except a score."""}
-        ]
-
     try:
         if not isinstance(model_name, str):
-            return f"错误：模型名称必须是字符串，收到 {type(model_name)}", ""
-        surface_score_1 = call_model(surface_quality_prompt(
-            answer1), PROPRIETARY_MODELS[model_name]).strip().splitlines()[-1].strip()
-        surface_score_2 = call_model(surface_quality_prompt(
-            answer2), PROPRIETARY_MODELS[model_name]).strip().splitlines()[-1].strip()
-        try:
-            surface_score_1 = float(surface_score_1)
-        except (ValueError, TypeError):
-            surface_score_1 = 0.0
+            return f"错误：模型名称必须是字符串，收到 {type(model_name)}", None
         try:
-            surface_score_2 = float(surface_score_2)
-        except (ValueError, TypeError):
-            surface_score_2 = 0.0
-
-        conversation = create_prompt(
-            instruction, answer1, answer2, mode, model_name)
-        response = call_model(conversation, PROPRIETARY_MODELS[model_name])
-        if response:
-            result = response.strip()
-        else:
-            return "API 请求失败", ""
-
-        original_scores = extract_scores(result, mode)
-        if len(original_scores) == 2:
-            adjusted_score1 = original_scores[0] - 0.8 * surface_score_1
-            adjusted_score2 = original_scores[1] - 0.8 * surface_score_2
-            verdict = "大模型 1 更好" if adjusted_score1 > adjusted_score2 else (
-                "大模型 2 更好" if adjusted_score2 > adjusted_score1 else "两个大模型表现相当！")
-        else:
-            verdict = "解析分数失败"
-
-        full_prompt = "\n".join([msg["content"] for msg in conversation])
-        formatted_prompt = full_prompt.replace(
-            '>', '&gt;').replace('<', '&lt;').replace('\n', '<br>')
-        formatted_result = result.replace('\n', '<br>')
-
-        details = """
-        <div class="details-section">
-            <h3>‍👨🏽‍💻 用户</h3>
-            <pre>{prompt}</pre>
-            <h3>‍🧑‍⚖️ 裁判模型（原评估结果）</h3>
-            <pre>{result}</pre>
-            <h3>🔧 校准详情</h3>
-            <ul class="calibration-details">
-                <li><b>原分数：</b>{score1:.2f} {score2:.2f}</li>
-                <li><b>表面质量得分：</b>{surf1:.2f} {surf2:.2f}</li>
-                <li><b>最终得分：</b>{final1:.2f} {final2:.2f}</li>
-            </ul>
-            <p>评估结果：{verdict}</p>
-        </div>
-        """.format(
-            prompt=formatted_prompt,
-            result=formatted_result,
-            score1=original_scores[0],
-            score2=original_scores[1],
-            surf1=surface_score_1,
-            surf2=surface_score_2,
-            final1=adjusted_score1,
-            final2=adjusted_score2,
-            verdict=verdict
-        )
-        return verdict, details
+            components = calibration_components(
+                instruction, answer1, answer2, mode, model_name)
+        except ValueError as e:
+            return str(e), None
+        if components["score1"] is None:
+            return "解析分数失败", None
+        components["adjusted1"], components["adjusted2"] = calibrated_scores(
+            components["score1"], components["score2"], components["surface1"], components["surface2"])
+        components["verdict"] = verdict_from_scores(components["adjusted1"], components["adjusted2"])
+        return components["verdict"], components
     except Exception as e:
-        return f"校准评估失败: {str(e)}", ""
+        return f"校准评估失败: {str(e)}", None
 
 
-def calibrated_evaluation_batch(file, mode, model_name=None):
-    if file is None:
-        return "请上传文件", None
+# 报告中保存的校准中间结果列，离线重算据此得出新权重下的结论
+CALIBRATION_COLUMNS = ("score1", "score2", "surface1", "surface2", "raw")
+# 级联报告中保存的本地评估中间结果列；escalated 为 1 表示该行已交给专有模型，数据不完整的行为空
+CASCADE_COLUMNS = ("local_raw", "local_score1", "local_score2", "confidence", "escalated")
 
-    try:
-        temp_dir = tempfile.gettempdir()
+
+def calibrated_evaluation_batch(file, mode, model_name=None, output_path=None):
+    df, error = load_batch_file(file)
+    if error:
+        return error, None
+    if output_path is None:
         output_filename = f"eval_report_{uuid.uuid4().hex[:8]}.csv"
-        output_path = os.path.join(temp_dir, output_filename)
-        if file.name.endswith('.csv'):
-            df = pd.read_csv(file.name)
-        elif file.name.endswith('.json'):
-            with open(file.name, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            df = pd.DataFrame(data)
-        else:
-            return "仅支持 CSV 或 JSON 格式的文件", None
-    except (pd.errors.ParserError, json.JSONDecodeError) as e:
-        return f"文件解析错误：{e}", None
-    except Exception as e:
-        return f"读取文件时出错：{e}", None
+        output_path = os.path.join(tempfile.gettempdir(), output_filename)
 
+    unique_df, inverse = dedupe_rows(df)
     results = []
-    for _, row in df.iterrows():
+    components = []
+    for _, row in unique_df.iterrows():
         instruction = row.get('instruction', '')
         answer1 = row.get('answer1', '')
         answer2 = row.get('answer2', '')
 
         if not instruction or not answer1 or not answer2:
             results.append("无效行：数据缺失")
+            components.append({})
             continue
 
         try:
-            verdict, _ = calibrated_evaluation(
-                instruction, answer1, answer2, mode, model_name=model_name)
-            results.append(verdict)
+            row_components = calibration_components(
+                instruction, answer1, answer2, mode, model_name)
         except Exception as e:
             results.append(f"错误：{str(e)}")
+            components.append({})
+            continue
+        components.append(row_components)
+        if row_components["score1"] is None:
+            results.append("解析分数失败")
+        else:
+            results.append(verdict_from_scores(*calibrated_scores(
+                row_components["score1"], row_components["score2"],
+                row_components["surface1"], row_components["surface2"])))
 
     output_df = pd.DataFrame({
         '指令': df.get('instruction', []),
         '答案 1': df.get('answer1', []),
         '答案 2': df.get('answer2', []),
-        '评估结果': results
+        '评估结果': fan_out(results, inverse)
     })
+    add_calibration_columns(output_df, components, inverse)
 
     try:
         output_df.to_csv(output_path, index=False, encoding='utf-8')
-        return f"评估完成，点击下方下载报告", output_path
+        return f"评估完成（{dedup_summary(len(df), len(unique_df))}），点击下方下载报告", output_path
     except Exception as e:
         return f"保存文件时出错：{str(e)}", None
 
 
-def evaluate_batch_with_api(file, mode, model_name):
-    if file is None:
-        return "请上传文件", None
+def add_calibration_columns(output_df, components, inverse):
+    # components 与唯一行对应，未调用校准的行为空字典
+    for column in CALIBRATION_COLUMNS:
+        output_df[column] = fan_out([c.get(column) for c in components], inverse)
+    output_df['calibration_weight'] = CALIBRATION_WEIGHT
+    return output_df
 
-    try:
-        temp_dir = tempfile.gettempdir()
+
+def evaluate_batch_with_api(file, mode, model_name, output_path=None):
+    df, error = load_batch_file(file)
+    if error:
+        return error, None
+    if output_path is None:
         output_filename = f"eval_report_{uuid.uuid4().hex[:8]}.csv"
-        output_path = os.path.join(temp_dir, output_filename)
-        if file.name.endswith('.csv'):
-            df = pd.read_csv(file.name)
-        elif file.name.endswith('.json'):
-            with open(file.name, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            df = pd.DataFrame(data)
-        else:
-            return "仅支持 CSV 或 JSON 格式的文件", None
-    except (pd.errors.ParserError, json.JSONDecodeError) as e:
-        return f"文件解析错误：{e}", None
-    except Exception as e:
-        return f"读取文件时出错：{e}", None
+        output_path = os.path.join(tempfile.gettempdir(), output_filename)
 
-    results = []
-    scores1 = []
-    scores2 = []
-    winners = []
-    for _, row in df.iterrows():
+    unique_df, inverse = dedupe_rows(df)
+    raw_results = []
+    errors = []
+    usages = []
+    for _, row in unique_df.iterrows():
         instruction = row.get('instruction', '')
         answer1 = row.get('answer1', '')
         answer2 = row.get('answer2', '')
 
         if not instruction or not answer1 or not answer2:
-            results.append("无效行：数据缺失")
+            raw_results.append(None)
+            errors.append("无效行：数据缺失")
+            usages.append(None)
             continue
 
         try:
-            # 获取详细分数和结果
-            verdict, details, _, score1, score2 = evaluate(
+            result, _, _, usage = generate_judgment_detailed(
                 instruction, answer1, answer2, mode, proprietary_model=model_name)
-
-            winner = "model1" if score1 > score2 else (
-                "model2" if score2 > score1 else "draw")
-
-            # 存储到不同列表
-            results.append(verdict)
-            scores1.append(score1)
-            scores2.append(score2)
-            winners.append(winner)
-
+            raw_results.append(result)
+            errors.append(None)
+            usages.append(usage)
         except Exception as e:
             # 错误处理
-            results.append(f"错误：{str(e)}")
-            scores1.append(None)
-            scores2.append(None)
-            winners.append("error")
+            raw_results.append(None)
+            errors.append(f"错误：{str(e)}")
+            usages.append(None)
 
     # 保存时采用结构化存储
-    output_df = pd.DataFrame({
-        'instruction': df['instruction'],
-        'answer1': df['answer1'],
-        'answer2': df['answer2'],
-        'score1': scores1,
-        'score2': scores2,
-        'winner': winners,
-        'verdict': results  # 保留原始文本结果
-    })
+    output_df = build_report(df, fan_out(raw_results, inverse), fan_out(errors, inverse), mode)
+    add_model_columns(output_df, df, model_name)
+    add_usage_columns(output_df, fan_out(usages, inverse))
 
     try:
         output_df.to_csv(output_path, index=False, encoding='utf-8')
-        return f"评估完成，点击下方下载报告", output_path
+        return f"评估完成（{dedup_summary(len(df), len(unique_df))}），点击下方下载报告", output_path
     except Exception as e:
         return f"保存文件时出错：{str(e)}", None
 
 
+def cascade_evaluation_batch(file, mode, state, calibration_mode=False, output_path=None, explanations=False):
+    # 级联批量评估：微调裁判模型置信度低于阈值的行交给专有模型重新评估。
+    # 分数在首行时本地模型只生成分数行并据此计算置信度；仅在 explanations 为真时为未升级的行续写解释，
+    # 升级到专有模型的行不再生成本地解释。
+    # 报告保存本地原始输出与分数、置信度以及专有模型（含校准）的中间结果，修改阈值或校准权重后可离线重算
+    llm = state.get("model")
+    tokenizer = state.get("tokenizer")
+    threshold = state.get("confidence_threshold", 0.5)
+    if llm is None or tokenizer is None:
+        return "请先加载微调裁判模型", None
+    proprietary_model_name = state.get("proprietary_model_name")
+    if not proprietary_model_name:
+        return "请先加载专有模型", None
+    df, error = load_batch_file(file)
+    if error:
+        return f"文件读取失败：{error}", None
+    if output_path is None:
+        output_filename = f"eval_report_{uuid.uuid4().hex[:8]}.csv"
+        output_path = os.path.join(tempfile.gettempdir(), output_filename)
+    finetuned_model_name = state.get("finetuned_model_name")
+    scores_only = scores_come_first(mode, finetuned_model_name)
+    unique_df, inverse = dedupe_rows(df)
+    results = []
+    explanation_texts = []
+    # 每个唯一行的中间结果；数据不完整的行为空字典
+    components = []
+    for _, row in unique_df.iterrows():
+        instruction = row.get('instruction', '')
+        answer1 = row.get('answer1', '')
+        answer2 = row.get('answer2', '')
+        explanation = None
+        if not all([instruction, answer1, answer2]):
+            results.append("数据不完整")
+            explanation_texts.append(explanation)
+            components.append({})
+            continue
+        # 本地评估出错时置信度记为 NaN，一定升级
+        row_components = {"confidence": np.nan}
+        try:
+            if scores_only:
+                local_raw, logprobs, context = judge_scores_only(
+                    instruction, answer1, answer2, mode, state, finetuned_model_name)
+            else:
+                local_raw, logprobs, _ = generate_judgment(
+                    instruction, answer1, answer2, mode, state, finetuned_model_name)
+                context = None
+            row_components["local_raw"] = local_raw
+            row_components["confidence"] = calculate_confidence(logprobs)
+            try:
+                row_components["local_score1"], row_components["local_score2"] = extract_scores(local_raw, mode)
+                verdict = verdict_from_scores(row_components["local_score1"], row_components["local_score2"])
+            except ValueError:
+                verdict = PARSE_FAILED_VERDICT
+            try:
+                if context is not None and row_components["confidence"] >= threshold and explanations:
+                    explanation = explain_judgment(state, context)
+            finally:
+                release_scores_context(state, context)
+            del logprobs, context
+        except ValueError as e:
+            verdict = str(e)
+        except Exception as e:
+            verdict = f"评估失败: {str(e)}"
+        confidence = row_components["confidence"]
+        row_components["escalated"] = 0.0
+        if np.isnan(confidence) or confidence < threshold:
+            row_components["escalated"] = 1.0
+            try:
+                if calibration_mode:
+                    proprietary = calibration_components(
+                        instruction, answer1, answer2, mode, proprietary_model_name)
+                    row_components.update(proprietary)
+                    verdict = "解析分数失败" if proprietary["score1"] is None else verdict_from_scores(
+                        *calibrated_scores(proprietary["score1"], proprietary["score2"],
+                                           proprietary["surface1"], proprietary["surface2"]))
+                else:
+                    raw, _, _ = generate_judgment(
+                        instruction, answer1, answer2, mode, state,
+                        proprietary_model=proprietary_model_name)
+                    row_components["raw"] = raw
+                    try:
+                        row_components["score1"], row_components["score2"] = extract_scores(raw, mode)
+                        verdict = verdict_from_scores(row_components["score1"], row_components["score2"])
+                    except ValueError:
+                        verdict = PARSE_FAILED_VERDICT
+            except Exception as e:
+                verdict = f"评估失败: {str(e)}"
+        results.append(verdict)
+        explanation_texts.append(explanation)
+        components.append(row_components)
+    output_df = pd.DataFrame({
+        '指令': df.get('instruction', []),
+        '答案 1': df.get('answer1', []),
+        '答案 2': df.get('answer2', []),
+        '评估结果': fan_out(results, inverse)
+    })
+    if explanations:
+        output_df['解释'] = fan_out(explanation_texts, inverse)
+    for column in CASCADE_COLUMNS:
+        output_df[column] = fan_out([c.get(column) for c in components], inverse)
+    output_df['threshold'] = threshold
+    if calibration_mode:
+        add_calibration_columns(output_df, components, inverse)
+    else:
+        for column in ('score1', 'score2', 'raw'):
+            output_df[column] = fan_out([c.get(column) for c in components], inverse)
+    try:
+        output_df.to_csv(output_path, index=False, encoding='utf-8')
+        return f"评估完成（{dedup_summary(len(df), len(unique_df))}），点击下方下载报告", output_path
+    except Exception as e:
+        return f"保存结果失败：{str(e)}", None
+
+
 def calculate_confidence(logprobs):
     if not logprobs:
         return 0.0
+    import torch
 
     entropy_list = []
     for logprob in logprobs:
@@ -0,0 +1,148 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+from config import LOCAL_MAX_PROMPT_TOKENS, LOCAL_RESERVED_NEW_TOKENS, LOCAL_TRUNCATION_POLICY
+from webui.evaluation import create_prompt
+
+
+TRUNCATION_POLICIES = ("head", "tail", "middle", "skip")
+# middle 策略在保留的首尾之间插入的省略标记
+TRUNCATION_MARKER = "\n...\n"
+# 截断后重新分词的长度可能与预估略有出入，每次重试多削减的 token 数
+TRUNCATION_MARGIN = 8
+
+
+def prompt_token_budget(model):
+    # 本地提示的 token 上限；模型配置中没有位置长度时返回 None（不截断）
+    if LOCAL_MAX_PROMPT_TOKENS:
+        return LOCAL_MAX_PROMPT_TOKENS
+    max_positions = getattr(model.config, "max_position_embeddings", None)
+    if not max_positions:
+        return None
+    return max(1, max_positions - LOCAL_RESERVED_NEW_TOKENS)
+
+
+def local_prompt(row, mode, tokenizer, model_name):
+    """
+    返回本地模型实际输入的提示文本与 token 数 (text, length, add_special_tokens)，与 prepare_local_inputs 的构造方式一致。
+    """
+    instruction, answer1, answer2 = row
+    conversation = create_prompt(
+        instruction, answer1, answer2, mode, model_name)
+    if tokenizer.chat_template is None:
+        return conversation, len(tokenizer(conversation)["input_ids"]), True
+    # 模板文本已包含起始符，分词时不再重复添加
+    text = tokenizer.apply_chat_template(
+        conversation, tokenize=False, add_generation_prompt=True)
+    return text, len(tokenizer(text, add_special_tokens=False)["input_ids"]), False
+
+
+def split_excess(length1, length2, excess):
+    """
+    两个答案共需削减 excess 个 token 时各自保留的长度：先削减较长的答案直到两者等长，再平均削减。
+    """
+    target = max(0, length1 + length2 - excess)
+    shorter = min(length1, length2)
+    if target >= 2 * shorter:
+        cap = target - shorter
+    else:
+        cap = target // 2
+    keep1, keep2 = min(length1, cap), min(length2, cap)
+    if keep1 + keep2 < target:
+        # target 为奇数时多出的一个 token 留给较长的答案
+        if length1 >= length2:
+            keep1 += 1
+        else:
+            keep2 += 1
+    return keep1, keep2
+
+
+def truncate_text(text, tokenizer, keep, policy):
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    if keep >= len(ids):
+        return text
+    if policy == "tail":
+        return tokenizer.decode(ids[len(ids) - keep:]) if keep else ""
+    if policy == "middle":
+        head, tail = (keep + 1) // 2, keep // 2
+        return (tokenizer.decode(ids[:head]) + TRUNCATION_MARKER
+                + (tokenizer.decode(ids[len(ids) - tail:]) if tail else ""))
+    return tokenizer.decode(ids[:keep])
+
+
+def fit_rows(rows, mode, model, tokenizer, model_name, policy=LOCAL_TRUNCATION_POLICY, attempts=3):
+    """
+    批量评估前的长度预处理：计算整批提示的 token 数，超出上限的行按 policy 截断答案。
+    返回 [(row, length, note), ...]，row 为截断后的 (instruction, answer1, answer2)；
+    policy 为 skip 时超长行、以及截断 attempts 次后仍超出上限的行（如指令本身过长）的 row 为 None。
+    note 记录截断情况，未截断时为 None。
+    """
+    if policy not in TRUNCATION_POLICIES:
+        raise ValueError(f"不支持的截断策略：{policy}")
+    budget = prompt_token_budget(model)
+    fitted = []
+    for row in rows:
+        _, length, _ = local_prompt(row, mode, tokenizer, model_name)
+        if budget is None or length <= budget:
+            fitted.append((row, length, None))
+            continue
+        if policy == "skip":
+            fitted.append((None, length, f"提示 {length} tokens 超出上限 {budget}，已跳过"))
+            continue
+        instruction, answer1, answer2 = row
+        length1 = len(tokenizer.encode(answer1, add_special_tokens=False))
+        length2 = len(tokenizer.encode(answer2, add_special_tokens=False))
+        original_length = length
+        truncated = row
+        for attempt in range(attempts):
+            excess = original_length - budget + attempt * TRUNCATION_MARGIN
+            keep1, keep2 = split_excess(length1, length2, excess)
+            truncated = (instruction,
+                         truncate_text(answer1, tokenizer, keep1, policy),
+                         truncate_text(answer2, tokenizer, keep2, policy))
+            _, length, _ = local_prompt(truncated, mode, tokenizer, model_name)
+            if length <= budget:
+                break
+        if length > budget:
+            fitted.append((None, original_length,
+                           f"提示 {original_length} tokens 截断后仍为 {length}，超出上限 {budget}，已跳过"))
+            continue
+        note = (f"提示 {original_length}→{length} tokens（{policy}）："
+                f"答案 1 保留 {min(keep1, length1)}/{length1}，答案 2 保留 {min(keep2, length2)}/{length2}")
+        fitted.append((truncated, length, note))
+    return fitted
+
+
+def length_buckets(lengths, batch_size):
+    """
+    按提示长度排序后每 batch_size 行一桶，同一批内长度相近，左填充浪费最少。返回下标列表的列表。
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def judge_rows_bucketed(rows, lengths, mode, state, model_name, batch_size, max_new_tokens=2048):
+    """
+    按长度分桶批量生成，结果按原顺序返回 [(raw_result, error), ...]。
+    """
+    from local_model import generate_batch
+
+    model = state.get("model")
+    tokenizer = state.get("tokenizer")
+    prompts = []
+    add_special_tokens = True
+    for row in rows:
+        text, _, add_special_tokens = local_prompt(row, mode, tokenizer, model_name)
+        prompts.append(text)
+    outputs = [None] * len(rows)
+    for bucket in length_buckets(lengths, batch_size):
+        try:
+            results = generate_batch(
+                model, tokenizer, [prompts[i] for i in bucket], max_new_tokens,
+                add_special_tokens=add_special_tokens)
+            for i, (text, _, _) in zip(bucket, results):
+                outputs[i] = (text, None)
+        except Exception as e:
+            for i in bucket:
+                outputs[i] = (None, f"错误：{str(e)}")
+    return outputs
@@ -0,0 +1,105 @@
+import os
+import sys
+import math
+import atexit
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import torch
+import torch.multiprocessing as mp
+from local_model import load_local_model
+from webui.evaluation import judge_rows_local
+
+
+# 每个工作进程自己的状态（模型、分词器、绑定的核心）。
+# 工作进程以 spawn 方式启动而不是 fork：父进程（Gradio / torch）已有多个线程，fork 后 OpenMP / MKL 可能死锁
+_worker = {}
+
+# 常驻的进程池，按模型路径各保留一个：model_path -> (pool, num_workers, model, tokenizer)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def split_cores(num_workers, cores=None):
+    """
+    把当前进程可用的 CPU 核心按编号顺序切成 num_workers 组，相邻核心（通常同一 socket）分在一组。
+    """
+    cores = sorted(cores if cores is not None else os.sched_getaffinity(0))
+    num_workers = max(1, min(num_workers, len(cores)))
+    size, extra = divmod(len(cores), num_workers)
+    groups = []
+    start = 0
+    for i in range(num_workers):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(cores[start:end])
+        start = end
+    return groups
+
+
+def _init_worker(core_queue, model, tokenizer):
+    cores = core_queue.get()
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    # 模型权重位于父进程的共享内存中，工作进程只映射同一份权重，不再各自加载
+    _worker.update(model=model, tokenizer=tokenizer, cores=cores)
+
+
+def _judge_shard(task):
+    shard_index, rows, mode, model_name = task
+    state = {"model": _worker["model"], "tokenizer": _worker["tokenizer"]}
+    return shard_index, judge_rows_local(rows, mode, state, model_name)
+
+
+def _get_pool(model_path, num_workers):
+    """
+    取 model_path 对应的常驻进程池，不存在或进程数不同时新建。
+    模型只在父进程加载一次并移入共享内存（share_memory），随进程池的初始化参数传给各工作进程。
+    """
+    groups = split_cores(num_workers)
+    with _pools_lock:
+        entry = _pools.get(model_path)
+        if entry is not None and entry[1] == len(groups):
+            return entry[0], len(groups)
+        if entry is not None:
+            # 旧进程池处理完已提交的分片后退出
+            entry[0].close()
+        model, tokenizer = load_local_model(model_path, device="cpu")
+        model.share_memory()
+        ctx = mp.get_context("spawn")
+        core_queue = ctx.Queue()
+        for cores in groups:
+            core_queue.put(cores)
+        pool = ctx.Pool(len(groups), initializer=_init_worker,
+                        initargs=(core_queue, model, tokenizer))
+        _pools[model_path] = (pool, len(groups), model, tokenizer)
+        return pool, len(groups)
+
+
+@atexit.register
+def close_pools():
+    # 结束所有常驻进程池并释放共享内存中的模型
+    with _pools_lock:
+        for pool, _, _, _ in _pools.values():
+            pool.terminate()
+        _pools.clear()
+
+
+def judge_rows_parallel(rows, mode, model_name, num_workers, model_path, shards_per_worker=4):
+    """
+    数据并行地用本地裁判模型评估 rows（(instruction, answer1, answer2) 列表）。
+    输入按顺序切分成若干分片交给 model_path 对应的常驻进程池（num_workers 个 spawn 进程），
+    各进程共享父进程中的同一份模型权重、绑定一组核心并使用对应的线程数，结果按原顺序合并，返回 [(raw_result, error), ...]。
+    """
+    if not rows:
+        return []
+    if not model_path:
+        return [(None, "错误：并行评估需要模型路径")] * len(rows)
+    pool, workers = _get_pool(model_path, num_workers)
+    shard_size = max(1, math.ceil(len(rows) / (workers * shards_per_worker)))
+    shards = [(i, rows[start:start + shard_size], mode, model_name)
+              for i, start in enumerate(range(0, len(rows), shard_size))]
+
+    # imap 按提交顺序返回，分片结果直接拼接即为原始行序
+    results = []
+    for _, outputs in pool.imap(_judge_shard, shards):
+        results.extend(outputs)
+    return results
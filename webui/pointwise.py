@@ -0,0 +1,246 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from config import PROPRIETARY_MODELS, FINETUNED_JUDGE_MODELS, SCORE_CACHE_PATH
+from call_model import call_model, get_provider, generation_kwargs
+from webui.evaluation import (
+    REPORT_DIR, PARSE_FAILED_VERDICT, load_batch_file, add_model_columns, normalize_text, score_line_pattern,
+    compare_scores
+)
+
+
+def create_pointwise_prompt(instruction, answer, mode, model_name=None):
+    # 单答案评分提示：与成对提示相同的评分维度，只给出一个 1-10 的分数
+    if not instruction or not answer:
+        raise ValueError("Instruction and answer cannot be empty.")
+
+    if model_name and "judgelm" in model_name.lower():
+        return f"""You are a helpful and precise assistant for checking the quality of the answer.
+[Question]
+{instruction}
+
+[The Start of Assistant's Answer]
+{answer}
+
+[The End of Assistant's Answer]
+
+[System]
+We would like to request your feedback on the performance of an AI assistant in response to the user question displayed above.
+Please rate the helpfulness, relevance, accuracy, level of details of the response. The assistant receives an overall score on a scale of 1 to 10, where a higher score indicates better overall performance.
+Please first output a single line containing only one value indicating the score for the assistant. In the subsequent line, please provide a comprehensive explanation of your evaluation, avoiding any potential bias.
+
+### Response:"""
+    criteria = (f"[Question]\n{instruction}\n[The Start of Assistant's Answer]\n{answer}\n[The End of Assistant's Answer]\n\n"
+                "We would like to request your feedback on the performance of an AI assistant in response to the user question displayed above.\n"
+                "Please rate the helpfulness, relevance, accuracy, level of details of the response. The assistant receives an overall score on a scale of 1 to 10, where a higher score indicates better overall performance.\n")
+    if mode == "直接评估":
+        return [
+            {"role": "system", "content": "You are a helpful and precise assistant for checking the quality of the answer."},
+            {"role": "user", "content": criteria + "Please first output a single line containing only one value indicating the score for the assistant. In the subsequent line, please provide a comprehensive explanation of your evaluation, avoiding any potential bias."},
+        ]
+    elif mode == "思维链":
+        return [
+            {"role": "system", "content": "You are a helpful and precise assistant for checking the quality of the answer using a chain of thought reasoning approach."},
+            {"role": "user", "content": criteria + "In the first line, please provide a comprehensive explanation of your evaluation, avoiding any potential bias.\nIn the subsequent line, please output a single line containing only one value indicating the score for the assistant. There should be nothing on this line except the score."},
+        ]
+    else:
+        raise ValueError(f"Unsupported mode: {mode}")
+
+
+# 单个分数的行，前缀与后缀规则与成对评估的分数行相同
+POINT_SCORE_PATTERN = score_line_pattern(1)
+
+
+def extract_point_score(result, mode):
+    # 直接评估取第一条分数行，思维链取最后一条分数行；解析失败返回 None
+    matches = POINT_SCORE_PATTERN.findall((result or "").strip())
+    if not matches:
+        return None
+    return float(matches[0] if mode == "直接评估" else matches[-1])
+
+
+def score_answer(instruction, answer, mode, state=None, model_name=None, proprietary_model=None):
+    """
+    用裁判模型给单个答案评分，返回 (score, raw_result)；score 解析失败时为 None，调用出错时抛出 ValueError。
+    """
+    if proprietary_model:
+        conversation = create_pointwise_prompt(
+            instruction, answer, mode, PROPRIETARY_MODELS[proprietary_model])
+        if isinstance(conversation, str):
+            conversation = [{"role": "user", "content": conversation}]
+        result = call_model(conversation, PROPRIETARY_MODELS[proprietary_model],
+                            validate=lambda text: float(extract_point_score(text, mode)))
+        if result is None:
+            raise ValueError("错误：call_model 返回空结果")
+        return extract_point_score(result, mode), result
+
+    import torch
+    from local_model import decode_cache
+
+    model = state.get("model") if state else None
+    tokenizer = state.get("tokenizer") if state else None
+    if model is None or tokenizer is None or model_name is None:
+        raise ValueError("请先加载模型")
+    conversation = create_pointwise_prompt(instruction, answer, mode, model_name)
+    if tokenizer.chat_template is None:
+        input_ids = tokenizer(conversation, return_tensors="pt")["input_ids"].to(model.device)
+    else:
+        input_ids = tokenizer.apply_chat_template(
+            conversation, add_generation_prompt=True, return_tensors="pt").to(model.device)
+    with torch.no_grad(), decode_cache(model, input_ids, 2048) as cache_kwargs:
+        sequences = model.generate(
+            input_ids=input_ids, attention_mask=torch.ones_like(input_ids), **cache_kwargs)
+    result = tokenizer.decode(sequences[0][input_ids.shape[1]:], skip_special_tokens=True)
+    return extract_point_score(result, mode), result
+
+
+def judge_fingerprint(proprietary_model=None, finetuned_model=None):
+    """
+    缓存键中的裁判标识：专有模型取实际使用的提供方、模型 ID 与生成预算，本地模型取模型路径。
+    切换提供方（包括 PROVIDER_OVERRIDE=mock）、模型 ID 或生成预算后不会读到之前的分数。
+    """
+    if proprietary_model:
+        modelname = PROPRIETARY_MODELS[proprietary_model]
+        provider, _ = get_provider(modelname)
+        return json.dumps([provider, modelname, generation_kwargs(modelname)], sort_keys=True, ensure_ascii=False)
+    return json.dumps(["local", FINETUNED_JUDGE_MODELS.get(finetuned_model, finetuned_model)], ensure_ascii=False)
+
+
+class ScoreCache:
+    """
+    SQLite 持久化的单答案分数缓存，键为规范化后的 (instruction, answer) 与裁判标识（judge_fingerprint）、推理策略的哈希。
+    """
+
+    def __init__(self, path=SCORE_CACHE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "key TEXT PRIMARY KEY, judge TEXT, mode TEXT, score REAL, raw TEXT, created REAL)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(instruction, answer, fingerprint, mode):
+        text = "\x1f".join([instruction, answer, fingerprint, mode])
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        # 返回 {key: (score, raw)}，分批查询避免超出 SQLite 的参数个数上限
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, score, raw FROM scores WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                found.update((key, (score, raw)) for key, score, raw in rows)
+        return found
+
+    def put(self, key, judge, mode, score, raw):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)",
+                (key, judge, mode, score, raw, time.time()))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def pointwise_evaluation_batch(file, mode, state, output_path=None, cache_path=SCORE_CACHE_PATH):
+    """
+    逐答案评分模式：把成对比较文件展开为唯一的 (instruction, answer)，每个答案只评分一次（已缓存的直接复用），
+    再按两侧分数投影回每一对，得到与成对评估相同格式的报告。返回 (message, report_path)。
+    """
+    df, error = load_batch_file(file)
+    if error:
+        return error, None
+    if output_path is None:
+        output_filename = f"eval_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        output_path = os.path.join(REPORT_DIR, output_filename)
+    proprietary_model_name = state.get("proprietary_model_name")
+    finetuned_model_name = state.get("finetuned_model_name")
+    judge = proprietary_model_name or finetuned_model_name
+    if not judge:
+        return "请先加载模型", None
+    fingerprint = judge_fingerprint(proprietary_model_name, finetuned_model_name)
+
+    columns = {column: (df[column] if column in df.columns else pd.Series("", index=df.index))
+               for column in ('instruction', 'answer1', 'answer2')}
+    instructions = normalize_text(columns['instruction'])
+    keys = {}
+    for side in ('answer1', 'answer2'):
+        answers = normalize_text(columns[side])
+        keys[side] = [ScoreCache.key(instruction, answer, fingerprint, mode) if instruction and answer else None
+                      for instruction, answer in zip(instructions, answers)]
+
+    # 每个唯一答案取首次出现时的原始文本评分
+    pending = {}
+    for side in ('answer1', 'answer2'):
+        for i, key in enumerate(keys[side]):
+            if key is not None and key not in pending:
+                pending[key] = (columns['instruction'].iloc[i], columns[side].iloc[i])
+
+    cache = ScoreCache(cache_path)
+    try:
+        scores = cache.get_many(pending)
+        hits = len(scores)
+        failures = {}
+        for key, (instruction, answer) in pending.items():
+            if key in scores:
+                continue
+            try:
+                if proprietary_model_name:
+                    score, raw = score_answer(
+                        instruction, answer, mode, proprietary_model=proprietary_model_name)
+                else:
+                    score, raw = score_answer(
+                        instruction, answer, mode, state, model_name=finetuned_model_name)
+            except Exception as e:
+                failures[key] = f"错误：{str(e)}"
+                continue
+            scores[key] = (score, raw)
+            # 解析失败的结果不缓存，下次重新评分
+            if score is not None:
+                cache.put(key, judge, mode, score, raw)
+    finally:
+        cache.close()
+
+    score1 = pd.Series([scores.get(key, (None, None))[0] for key in keys['answer1']], dtype=float)
+    score2 = pd.Series([scores.get(key, (None, None))[0] for key in keys['answer2']], dtype=float)
+    winner, verdict = compare_scores(score1, score2)
+    verdict = verdict.astype(object)
+    for i in np.flatnonzero(winner == "error"):
+        key1, key2 = keys['answer1'][i], keys['answer2'][i]
+        if key1 is None or key2 is None:
+            verdict[i] = "无效行：数据缺失"
+        else:
+            verdict[i] = failures.get(key1) or failures.get(key2) or PARSE_FAILED_VERDICT
+
+    output_df = pd.DataFrame({
+        'instruction': columns['instruction'].to_numpy(),
+        'answer1': columns['answer1'].to_numpy(),
+        'answer2': columns['answer2'].to_numpy(),
+        'score1': score1.to_numpy(),
+        'score2': score2.to_numpy(),
+        'winner': winner,
+        'verdict': verdict,
+    })
+    add_model_columns(output_df, df, judge)
+    message = (f"评估完成（逐答案评分：{len(df)} 对共 {len(pending)} 个唯一答案，"
+               f"缓存命中 {hits}，新评分 {len(pending) - hits}），点击下方下载报告")
+    try:
+        output_df.to_csv(output_path, index=False, encoding='utf-8')
+        return message, output_path
+    except Exception as e:
+        return f"保存文件时出错：{str(e)}", None
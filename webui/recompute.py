@@ -0,0 +1,93 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # NOQA: E402
+import numpy as np
+import pandas as pd
+from webui.evaluation import REPORT_DIR, compare_scores, calibrated_scores
+
+
+# 提高阈值后新增的低置信度行原先没有专有模型结果，只能重新调用，报告中以此标记
+NEEDS_PROPRIETARY_VERDICT = "需要专有模型重新评估"
+
+
+def recompute_verdicts(report, calibration_weight=None, threshold=None):
+    """
+    按新的校准权重 / 置信度阈值，根据报告中保存的中间结果整列重新得出结论，不调用任何模型。
+    未指定的参数沿用报告中记录的值。返回 (新报告, 需要重新调用专有模型的行数)。
+    """
+    report = report.copy()
+    verdict = report['评估结果'].to_numpy(dtype=object).copy()
+
+    # 专有模型的结论：有表面质量得分时按校准分比较，否则直接比较原分数
+    score1 = report['score1'].to_numpy(dtype=float)
+    score2 = report['score2'].to_numpy(dtype=float)
+    if 'surface1' in report.columns:
+        if calibration_weight is None:
+            calibration_weight = float(report['calibration_weight'].iloc[0])
+        score1, score2 = calibrated_scores(
+            score1, score2,
+            report['surface1'].to_numpy(dtype=float), report['surface2'].to_numpy(dtype=float),
+            calibration_weight)
+        report['calibration_weight'] = calibration_weight
+    _, proprietary_verdict = compare_scores(score1, score2)
+    # 原分数缺失的行（请求出错、解析失败、数据缺失）保留原结论
+    proprietary_valid = ~np.isnan(score1) & ~np.isnan(score2)
+
+    if 'confidence' not in report.columns:
+        verdict[proprietary_valid] = proprietary_verdict[proprietary_valid]
+        report['评估结果'] = verdict
+        return report, 0
+
+    if threshold is None:
+        threshold = float(report['threshold'].iloc[0])
+    confidence = report['confidence'].to_numpy(dtype=float)
+    escalated = report['escalated'].to_numpy(dtype=float)
+    judged = ~np.isnan(escalated)
+    # 置信度为 NaN（本地评估出错）的比较结果为 False，一律视为需要升级
+    use_local = judged & (confidence >= threshold)
+    _, local_verdict = compare_scores(
+        report['local_score1'].to_numpy(dtype=float), report['local_score2'].to_numpy(dtype=float))
+    verdict[use_local] = local_verdict[use_local]
+    upgrade = judged & ~use_local
+    verdict[upgrade & proprietary_valid] = proprietary_verdict[upgrade & proprietary_valid]
+    needs_proprietary = upgrade & (escalated == 0)
+    verdict[needs_proprietary] = NEEDS_PROPRIETARY_VERDICT
+    report['评估结果'] = verdict
+    report['threshold'] = threshold
+    return report, int(needs_proprietary.sum())
+
+
+def recompute_report(file, calibration_weight=None, threshold=None, output_path=None):
+    """
+    离线重算入口：读取校准或级联评估的报告，按新参数重新得出结论并写出新报告。返回 (message, report_path)。
+    """
+    if file is None:
+        return "请上传评估报告", None
+    path = getattr(file, "name", file)
+    try:
+        report = pd.read_csv(path)
+    except Exception as e:
+        return f"读取报告时出错：{e}", None
+    if '评估结果' not in report.columns or 'score1' not in report.columns:
+        return "报告中没有保存评估的中间结果（仅支持校准或级联评估的报告），无法离线重算", None
+    notes = []
+    if threshold is not None and 'confidence' not in report.columns:
+        threshold = None
+        notes.append("非级联评估报告，已忽略置信度阈值")
+    if calibration_weight is not None and 'surface1' not in report.columns:
+        calibration_weight = None
+        notes.append("报告未启用校准，已忽略校准权重")
+
+    recomputed, needs_proprietary = recompute_verdicts(report, calibration_weight, threshold)
+    changed = int((recomputed['评估结果'] != report['评估结果']).sum())
+    if output_path is None:
+        output_filename = f"recomputed_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        output_path = os.path.join(REPORT_DIR, output_filename)
+    if needs_proprietary:
+        notes.append(f"{needs_proprietary} 行置信度低于新阈值但原先未调用专有模型，已标记为“{NEEDS_PROPRIETARY_VERDICT}”")
+    message = "；".join([f"重算完成：{len(report)} 行中 {changed} 行结论改变"] + notes)
+    try:
+        recomputed.to_csv(output_path, index=False, encoding='utf-8')
+        return message, output_path
+    except Exception as e:
+        return f"保存文件时出错：{str(e)}", None